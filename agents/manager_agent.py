@@ -158,6 +158,9 @@ class AgentManager(Agent):
         self.tasks = updated_tasks
         # print(f"Updated tasks: {self.tasks}")
 
+        # Write the memory updates of this turn in one batch.
+        self.memory.flush()
+
         return worker_results
 
     @staticmethod
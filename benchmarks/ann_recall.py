@@ -0,0 +1,101 @@
+"""Reports recall@k and QPS of approximate indexes against exact search.
+
+Also reports memory per vector and recall (before re-ranking) for each
+vector storage type.
+
+Vectors are drawn around random cluster centres so that, like code
+embeddings, they are not uniformly spread. Run from the repository root:
+
+    python -m benchmarks.ann_recall --vectors 100000 --dimension 256
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from database.index_factory import (
+    STORAGE_TYPES,
+    build_index,
+    get_bytes_per_vector,
+    set_search_params,
+)
+
+
+def make_clustered_vectors(count, dimension, clusters, rng):
+    centres = rng.standard_normal((clusters, dimension)).astype("float32")
+    assignments = rng.integers(0, clusters, count)
+    noise = 0.3 * rng.standard_normal((count, dimension)).astype("float32")
+    return centres[assignments] + noise
+
+
+def recall_at_k(found, expected):
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, expected))
+    return hits / expected.size
+
+
+def time_search(index, queries, k):
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    return found, len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_clustered_vectors(args.vectors, args.dimension, args.clusters, rng)
+    queries = make_clustered_vectors(args.queries, args.dimension, args.clusters, rng)
+    ids = np.arange(args.vectors)
+
+    start = time.perf_counter()
+    exact = build_index(vectors, ids, "flat")
+    exact_build = time.perf_counter() - start
+    expected, exact_qps = time_search(exact, queries, args.k)
+
+    print(
+        f"{'index':<8}{'param':>14}{'build s':>10}{f'recall@{args.k}':>12}{'QPS':>12}"
+    )
+    print(f"{'flat':<8}{'-':>14}{exact_build:>10.2f}{1.0:>12.4f}{exact_qps:>12.0f}")
+
+    sweeps = {
+        "ivf": ("nprobe", [1, 4, 16, 64]),
+        "hnsw": ("efSearch", [16, 32, 64, 128]),
+    }
+    for index_type, (param, values) in sweeps.items():
+        start = time.perf_counter()
+        index = build_index(vectors, ids, index_type)
+        build_seconds = time.perf_counter() - start
+        for value in values:
+            if index_type == "ivf":
+                set_search_params(index, nprobe=value)
+            else:
+                set_search_params(index, ef_search=value)
+            found, qps = time_search(index, queries, args.k)
+            recall = recall_at_k(found, expected)
+            print(
+                f"{index_type:<8}{f'{param}={value}':>14}{build_seconds:>10.2f}"
+                f"{recall:>12.4f}{qps:>12.0f}"
+            )
+
+    print()
+    print(f"{'storage':<10}{'bytes/vector':>14}{f'recall@{args.k}':>12}{'QPS':>12}")
+    for storage in STORAGE_TYPES:
+        index = build_index(vectors, ids, "flat", storage=storage)
+        found, qps = time_search(index, queries, args.k)
+        print(
+            f"{storage:<10}{get_bytes_per_vector(index):>14.1f}"
+            f"{recall_at_k(found, expected):>12.4f}{qps:>12.0f}"
+        )
+
+    print(f"(faiss {faiss.__version__}, {args.vectors} vectors, d={args.dimension})")
+
+
+if __name__ == "__main__":
+    main()
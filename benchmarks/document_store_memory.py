@@ -0,0 +1,67 @@
+"""Compares the heap held by a dict of document dicts and by a DocumentStore.
+
+Run from the repository root:
+
+    python -m benchmarks.document_store_memory --files 2000
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic_repo import generate_repo
+from database.document_store import DocumentStore
+from database.file_parser import extract_functions
+
+
+def measure(build):
+    """Returns what ``build`` returns and the bytes it left allocated."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def read_documents(paths):
+    """Parses every file into document dicts, bypassing the parse cache."""
+    for path in paths:
+        with open(path, "rb") as file:
+            source = file.read()
+        for function in extract_functions(source):
+            function["filepath"] = path
+            yield function
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--functions-per-file", type=int, default=10)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        paths = generate_repo(root, args.files, args.functions_per_file)
+        dicts, dict_bytes = measure(lambda: dict(enumerate(read_documents(paths))))
+        store, store_bytes = measure(
+            lambda: DocumentStore(enumerate(read_documents(paths)))
+        )
+
+        start = time.perf_counter()
+        for i in range(min(args.lookups, len(store))):
+            assert store[i]["code"] == dicts[i]["code"]
+        lookup_seconds = time.perf_counter() - start
+
+    print(f"documents:     {len(store):10d} ({args.files} files)")
+    print(f"dict of dicts: {dict_bytes / 2**20:10.1f} MiB")
+    print(f"DocumentStore: {store_bytes / 2**20:10.1f} MiB")
+    print(f"reduction:     {dict_bytes / store_bytes:10.1f}x")
+    print(
+        f"lazy lookups:  {lookup_seconds / max(1, args.lookups) * 1e6:10.1f} us "
+        f"per document read from disk"
+    )
+
+
+if __name__ == "__main__":
+    main()
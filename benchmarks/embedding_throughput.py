@@ -0,0 +1,77 @@
+"""Compares serial and batched embedding throughput against a fake embedder.
+
+Run from the repository root:
+
+    python -m benchmarks.embedding_throughput --functions 2000
+"""
+import argparse
+import time
+
+from benchmarks.fake_embedder import FakeEmbedder
+from database.embedding_pipeline import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    embed_in_batches,
+)
+
+
+def make_function_bodies(count):
+    return [
+        f"def function_{i}(value):\n    return value * {i} + {i % 7}\n"
+        for i in range(count)
+    ]
+
+
+def run_serial(embedder, texts):
+    start = time.perf_counter()
+    vectors = [embedder.embed_query(text) for text in texts]
+    return vectors, time.perf_counter() - start
+
+
+def run_batched(embedder, texts, batch_size, max_concurrency):
+    start = time.perf_counter()
+    vectors = embed_in_batches(
+        texts,
+        embedder.embed_documents,
+        batch_size=batch_size,
+        max_concurrency=max_concurrency,
+    )
+    return vectors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--functions", type=int, default=1000)
+    parser.add_argument("--serial-sample", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_MAX_CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    texts = make_function_bodies(args.functions)
+
+    # The serial path is slow by design, so it is timed on a sample only.
+    serial_texts = texts[: args.serial_sample]
+    _, serial_seconds = run_serial(FakeEmbedder(latency=args.latency), serial_texts)
+    serial_rate = len(serial_texts) / serial_seconds
+
+    embedder = FakeEmbedder(latency=args.latency)
+    vectors, batched_seconds = run_batched(
+        embedder, texts, args.batch_size, args.concurrency
+    )
+    batched_rate = len(texts) / batched_seconds
+
+    reference = FakeEmbedder(latency=0)
+    assert all(vectors[i] == reference.embed(texts[i]) for i in range(len(texts)))
+
+    print(f"serial:  {serial_rate:10.1f} functions/s ({len(serial_texts)} functions)")
+    print(
+        f"batched: {batched_rate:10.1f} functions/s ({len(texts)} functions, "
+        f"{embedder.calls} requests, batch={args.batch_size}, "
+        f"concurrency={args.concurrency})"
+    )
+    print(f"speedup: {batched_rate / serial_rate:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import hashlib
+import time
+
+import numpy as np
+
+
+class FakeEmbedder:
+    """A local stand-in for the embedding endpoint.
+
+    Vectors are derived from a hash of the text, so the same text always gets
+    the same vector. Each call sleeps for a fixed round-trip latency plus a
+    small per-text cost to mimic a remote API.
+    """
+
+    def __init__(self, dimension=1536, latency=0.05, per_text_latency=0.0005):
+        self.dimension = dimension
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).astype("float32").tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self.embed(text) for text in texts]
@@ -0,0 +1,193 @@
+"""Times indexing and search of CodebaseDatabase on synthetic repositories.
+
+For each repository size this reports the file walk, serial get_functions
+parsing, the build's own stage timings (scan, parse, embed, index) and the
+p50/p99 latency of search_faiss_index for code and identifier queries.
+Code queries are timed with hybrid search, the default, and again with
+vector search alone, which shows what the lexical index adds.
+Embeddings come from a deterministic FakeEmbedder, so runs are comparable
+across machines and versions. Run from the repository root:
+
+    python -m benchmarks.indexing_suite --files 100 1000 --output results.json
+
+The JSON written to --output holds the configuration, the library versions
+and git commit, and one result per size, to track regressions over time.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+
+from benchmarks.fake_embedder import FakeEmbedder  # noqa: E402
+from benchmarks.synthetic_repo import generate_repo  # noqa: E402
+from database import codebase_database  # noqa: E402
+from database.codebase_database import CodebaseDatabase  # noqa: E402
+from database.embedding_cache import (  # noqa: E402
+    get_query_embedding_cache,
+    reopen_embedding_cache,
+)
+from database.file_parser import clear_function_cache, get_functions  # noqa: E402
+from database.file_walker import walk_files  # noqa: E402
+
+
+def time_call(function, *args, **kwargs):
+    """Returns what ``function`` returns and the seconds it took."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def get_latencies(database, queries, k):
+    """Returns the p50, p99 and mean latency of searching each query, in
+    milliseconds."""
+    latencies = []
+    for query in queries:
+        _, seconds = time_call(database.search_faiss_index, query, k)
+        latencies.append(seconds * 1000)
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(np.mean(latencies)),
+    }
+
+
+def make_queries(database, count, seed):
+    """Samples code and identifier queries from the indexed functions.
+
+    Code queries are the first lines of functions. The query cache is
+    cleared before searching, so every code query is embedded.
+    """
+    rng = random.Random(seed)
+    ids = sorted(database.documents.records)
+    sample = [database.documents[i] for i in rng.sample(ids, min(count, len(ids)))]
+    code_queries = ["\n".join(doc["code"].splitlines()[:3]) for doc in sample]
+    identifier_queries = [doc["function_name"].rsplit(".", 1)[-1] for doc in sample]
+    return code_queries, identifier_queries
+
+
+def run(args, files, directory):
+    root = os.path.join(directory, f"repo_{files}")
+    paths = generate_repo(root, files, args.functions_per_file, seed=args.seed)
+    clear_function_cache()
+
+    code_files, walk_seconds = time_call(walk_files, root)
+    functions, parse_seconds = time_call(
+        lambda: [function for path in code_files for function in get_functions(path)]
+    )
+
+    # A fresh embedding cache and parse cache make the build pay for every
+    # function, as on a first run.
+    reopen_embedding_cache(os.path.join(directory, f"cache_{files}.sqlite3"))
+    clear_function_cache()
+    embedder = FakeEmbedder(dimension=args.dimension, latency=args.latency)
+    codebase_database.embeddings = embedder
+    database, build_seconds = time_call(
+        CodebaseDatabase,
+        root,
+        index_type=args.index_type,
+        storage=args.storage,
+        parse_workers=args.parse_workers,
+    )
+
+    code_queries, identifier_queries = make_queries(database, args.queries, args.seed)
+    get_query_embedding_cache().clear()
+    search_code = get_latencies(database, code_queries, args.k)
+    database.hybrid = False
+    search_code_vector = get_latencies(database, code_queries, args.k)
+    database.hybrid = True
+    return {
+        "files": len(paths),
+        "functions": len(functions),
+        "documents": len(database.documents),
+        "vectors": int(database.faiss_index.ntotal),
+        "walk_seconds": walk_seconds,
+        "parse_seconds": parse_seconds,
+        "build_seconds": build_seconds,
+        "build_stages": database.timings,
+        "embedding_requests": embedder.calls,
+        "memory_bytes": database.estimate_memory(),
+        "search_code": search_code,
+        "search_code_vector": search_code_vector,
+        "search_identifier": get_latencies(database, identifier_queries, args.k),
+    }
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result):
+    stages = ", ".join(
+        f"{stage} {seconds:.2f}s" for stage, seconds in result["build_stages"].items()
+    )
+    print(
+        f"{result['files']} files, {result['functions']} functions: "
+        f"walk {result['walk_seconds']:.3f}s, "
+        f"parse {result['parse_seconds']:.2f}s, "
+        f"build {result['build_seconds']:.2f}s ({stages})"
+    )
+    for kind in ("search_code", "search_code_vector", "search_identifier"):
+        latency = result[kind]
+        print(
+            f"  {kind}: p50 {latency['p50_ms']:.2f} ms, "
+            f"p99 {latency['p99_ms']:.2f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--functions-per-file", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--index-type", default="auto")
+    parser.add_argument("--storage", default="float32")
+    parser.add_argument("--parse-workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for files in args.files:
+            result = run(args, files, directory)
+            print_result(result)
+            results.append(result)
+
+    if args.output:
+        report = {
+            "config": vars(args),
+            "environment": {
+                "commit": get_git_commit(),
+                "python": platform.python_version(),
+                "faiss": faiss.__version__,
+                "numpy": np.__version__,
+                "cpus": os.cpu_count(),
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
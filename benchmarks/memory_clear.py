@@ -0,0 +1,87 @@
+"""Times clearing MemoryDatabase collections of increasing size.
+
+clear_all_memories drops and recreates the collection, so its time should
+stay flat as the collection grows. For comparison, the previous approach of
+deleting what peek() returns until the collection is empty is timed on the
+sizes up to --peek-max. Run from the repository root:
+
+    python -m benchmarks.memory_clear --memories 1000 10000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fake_embedder import FakeEmbedder
+from database.embedding_cache import reopen_embedding_cache
+from database.memory_database import MemoryDatabase
+
+# Memories are added this many at a time with precomputed vectors.
+ADD_BATCH_SIZE = 5000
+
+
+def fill(database, count, embedder):
+    for start in range(0, count, ADD_BATCH_SIZE):
+        ids = [str(i) for i in range(start, min(start + ADD_BATCH_SIZE, count))]
+        documents = [f"memory {i}" for i in ids]
+        database.collection.add(
+            ids=ids,
+            documents=documents,
+            embeddings=[embedder.embed(document) for document in documents],
+            metadatas=[{"namespace": "benchmark"} for _ in ids],
+        )
+
+
+def clear_by_peeking(database):
+    while database.collection.count() > 0:
+        database.collection.delete(ids=database.collection.peek()["ids"])
+
+
+def time_clear(directory, count, embedder, clear):
+    database = MemoryDatabase(directory, embedder.embed_documents)
+    fill(database, count, embedder)
+    start = time.perf_counter()
+    clear(database)
+    seconds = time.perf_counter() - start
+    assert database.collection.count() == 0
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--memories", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--peek-max", type=int, default=1000)
+    args = parser.parse_args()
+
+    embedder = FakeEmbedder(dimension=args.dimension, latency=0)
+    with tempfile.TemporaryDirectory() as directory:
+        reopen_embedding_cache(os.path.join(directory, "cache.sqlite3"))
+        print(f"{'memories':>10}{'drop s':>12}{'delete_namespace s':>20}{'peek s':>12}")
+        for count in args.memories:
+            drop = time_clear(
+                os.path.join(directory, f"drop_{count}"),
+                count,
+                embedder,
+                MemoryDatabase.clear_all_memories,
+            )
+            namespace = time_clear(
+                os.path.join(directory, f"namespace_{count}"),
+                count,
+                embedder,
+                lambda database: database.delete_namespace("benchmark"),
+            )
+            peek = "-"
+            if count <= args.peek_max:
+                seconds = time_clear(
+                    os.path.join(directory, f"peek_{count}"),
+                    count,
+                    embedder,
+                    clear_by_peeking,
+                )
+                peek = f"{seconds:.3f}"
+            print(f"{count:>10}{drop:>12.3f}{namespace:>20.3f}{peek:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Generates a deterministic synthetic Python project for benchmarks."""
+import os
+import random
+
+WORDS = (
+    "parse",
+    "load",
+    "fetch",
+    "render",
+    "update",
+    "request",
+    "response",
+    "config",
+    "token",
+    "cache",
+    "index",
+    "query",
+    "file",
+    "folder",
+    "repo",
+    "memory",
+    "agent",
+    "tool",
+    "result",
+    "message",
+)
+
+
+def make_identifier(rng, words=2):
+    return "_".join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_function(rng, index, indent=""):
+    name = f"{make_identifier(rng)}_{index}"
+    arguments = ", ".join(make_identifier(rng, 1) + str(i) for i in range(3))
+    lines = [f"{indent}def {name}({arguments}):"]
+    lines.append(f'{indent}    """{make_identifier(rng, 4).replace("_", " ")}."""')
+    for line in range(rng.randint(3, 20)):
+        lines.append(
+            f"{indent}    {make_identifier(rng)}_{line} = "
+            f"{make_identifier(rng)}({make_identifier(rng, 1)}0, {line})"
+        )
+    lines.append(f"{indent}    return {make_identifier(rng, 1)}1")
+    return "\n".join(lines)
+
+
+def make_module(rng, functions_per_file):
+    blocks = ["import os\n"]
+    methods = functions_per_file // 3
+    for i in range(functions_per_file - methods):
+        blocks.append(make_function(rng, i))
+    if methods:
+        class_lines = [f"class {make_identifier(rng).title().replace('_', '')}:"]
+        for i in range(methods):
+            class_lines.append(make_function(rng, i, indent="    "))
+            class_lines.append("")
+        blocks.append("\n".join(class_lines))
+    return "\n\n\n".join(blocks) + "\n"
+
+
+def generate_repo(
+    root, files=1000, functions_per_file=10, files_per_package=50, seed=0
+):
+    """Writes ``files`` modules under ``root`` and returns their paths.
+
+    The same arguments always produce the same files.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        package = os.path.join(root, f"package_{i // files_per_package}")
+        os.makedirs(package, exist_ok=True)
+        path = os.path.join(package, f"module_{i}.py")
+        with open(path, "w") as file:
+            file.write(make_module(rng, functions_per_file))
+        paths.append(path)
+    return paths
@@ -0,0 +1,116 @@
+import functools
+import math
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - depends on the environment
+    tiktoken = None
+
+# Tokenizer of text-embedding-ada-002.
+EMBEDDING_ENCODING = "cl100k_base"
+# Functions longer than this are split into chunks of at most this many
+# tokens, well below the 8191 token input limit of ada-002.
+CHUNK_MAX_TOKENS = 2048
+# Tokens of context repeated at the start of each chunk from the previous.
+CHUNK_OVERLAP_TOKENS = 128
+# Without tiktoken, tokens are estimated as one per this many bytes, which
+# overestimates for code so chunks stay under the limit.
+BYTES_PER_TOKEN_ESTIMATE = 3
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    """Returns the tiktoken encoding, or None if it cannot be loaded."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(EMBEDDING_ENCODING)
+    except Exception:
+        # The encoding is downloaded on first use, which fails offline.
+        return None
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN_ESTIMATE)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_segments(span, max_tokens):
+    """Splits source bytes into (start, end, line, tokens) segments.
+
+    Each line is a segment, except that lines over ``max_tokens`` are cut
+    into pieces that fit. ``start`` and ``end`` are offsets into ``span``
+    and ``line`` counts from 0.
+    """
+    segments = []
+    start = 0
+    for line, text in enumerate(span.splitlines(keepends=True)):
+        end = start + len(text)
+        tokens = count_tokens(text.decode("utf-8", errors="replace"))
+        n_pieces = math.ceil(tokens / max_tokens) if tokens > max_tokens else 1
+        piece_bytes = math.ceil(len(text) / n_pieces)
+        for piece_start in range(start, end, piece_bytes):
+            piece_end = min(piece_start + piece_bytes, end)
+            segments.append(
+                (piece_start, piece_end, line, math.ceil(tokens / n_pieces))
+            )
+        start = end
+    return segments
+
+
+def group_segments(segments, max_tokens, overlap_tokens):
+    """Groups consecutive segments into chunks of at most ``max_tokens``
+    that repeat up to ``overlap_tokens`` from the end of the previous one.
+
+    Returns (first, last) segment index pairs, inclusive.
+    """
+    chunks = []
+    first = 0
+    while first < len(segments):
+        last = first
+        tokens = segments[first][3]
+        while last + 1 < len(segments) and tokens + segments[last + 1][3] <= max_tokens:
+            last += 1
+            tokens += segments[last][3]
+        chunks.append((first, last))
+        if last + 1 == len(segments):
+            break
+
+        # Step back over the segments that fit in the overlap, but always
+        # move forward by at least one.
+        next_first = last + 1
+        overlap = 0
+        while (
+            next_first - 1 > first
+            and overlap + segments[next_first - 1][3] <= overlap_tokens
+        ):
+            next_first -= 1
+            overlap += segments[next_first][3]
+        first = next_first
+    return chunks
+
+
+def get_chunk_spans(
+    span,
+    max_tokens=CHUNK_MAX_TOKENS,
+    overlap_tokens=CHUNK_OVERLAP_TOKENS,
+):
+    """Splits the source bytes of a function into overlapping chunks.
+
+    Returns None if the function fits in ``max_tokens``. Otherwise returns
+    a (start, end, first_line, last_line) tuple per chunk, with byte
+    offsets into ``span`` and lines counted from 0.
+    """
+    # A token is at least one byte, so short functions need no counting.
+    if len(span) <= max_tokens:
+        return None
+    if count_tokens(span.decode("utf-8", errors="replace")) <= max_tokens:
+        return None
+
+    segments = split_segments(span, max_tokens)
+    return [
+        (segments[first][0], segments[last][1], segments[first][2], segments[last][2])
+        for first, last in group_segments(segments, max_tokens, overlap_tokens)
+    ]
@@ -1,13 +1,60 @@
 import os
-from glob import glob
+import tempfile
+import threading
+import time
 
-import faiss
 import numpy as np
 import openai
 from dotenv import load_dotenv
 from langchain.embeddings import OpenAIEmbeddings
 
-from database.file_parser import get_functions
+from database.document_store import DocumentStore, get_body_hash
+from database.embedding_cache import get_embedding_cache, get_query_embedding_cache
+from database.embedding_pipeline import (
+    EMBEDDING_BATCH_MAX_CHARS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    embed_in_batches,
+)
+from database.file_parser import (
+    get_file_fingerprint,
+    get_functions,
+    iter_parse_files,
+)
+from database.file_walker import DEFAULT_EXCLUDES, PathFilter, get_shard, walk_files
+from database.index_factory import (
+    DEFAULT_EF_SEARCH,
+    DEFAULT_NPROBE,
+    IDFilter,
+    build_index,
+    get_bytes_per_vector,
+    get_index_memory,
+    get_index_type,
+    get_storage,
+    remove_ids,
+    search_index,
+    set_search_params,
+)
+from database.index_store import (
+    append_vectors,
+    get_build_dir,
+    get_index_dir,
+    index_exists,
+    read_checkpoint,
+    read_documents,
+    read_index,
+    read_vectors,
+    remove_checkpoint,
+    write_documents,
+    write_index,
+)
+from database.lexical_index import (
+    LexicalIndex,
+    is_identifier_query,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+from database.vector_store import VectorStore
 from utils import print_search_results
 
 embeddings = OpenAIEmbeddings()
@@ -18,83 +65,930 @@ load_dotenv()
 # Access the variables using the os module
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Hybrid search fuses this many vector and lexical candidates per result.
+HYBRID_CANDIDATES_PER_RESULT = 2
+# A checkpointed build saves its progress at most this often.
+BUILD_CHECKPOINT_SECONDS = 10
+# Rough heap held per document by the DocumentStore and by the lexical
+# index, measured on the synthetic benchmark repository.
+DOCUMENT_MEMORY_BYTES = 512
+LEXICAL_INDEX_MEMORY_BYTES = 4096
+
 
 class CodebaseDatabase:
-    def __init__(self, project_folder):
+    def __init__(
+        self,
+        project_folder,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        max_batch_chars=EMBEDDING_BATCH_MAX_CHARS,
+        max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+        index_dir=None,
+        index_type="auto",
+        nprobe=DEFAULT_NPROBE,
+        ef_search=DEFAULT_EF_SEARCH,
+        storage="float32",
+        rerank_factor=4,
+        exclude=DEFAULT_EXCLUDES,
+        use_gitignore=True,
+        parse_workers=None,
+        hybrid=True,
+        checkpoint=False,
+        progress_callback=None,
+        shard=None,
+        build=True,
+    ):
         self.project_folder = project_folder
-        self.documents = self.load_documents()
-        self.faiss_index = self.create_vector_database()
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_concurrency = max_concurrency
+        self.index_dir = index_dir or get_index_dir(project_folder)
+        # "auto" picks an exact flat index for small projects and an IVF
+        # index for large ones, see index_factory.choose_index_type.
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        # Lossy storage ("float16", "sq8", "pq") keeps the index small; the
+        # top k * rerank_factor candidates are then re-ranked against the
+        # exact vectors kept in exact_vectors.
+        self.storage = storage
+        self.rerank_factor = rerank_factor
+        # File discovery skips names matching ``exclude`` and, optionally,
+        # anything the project's .gitignore files ignore.
+        self.exclude = exclude
+        self.use_gitignore = use_gitignore
+        self.parse_workers = parse_workers
+        # Hybrid search fuses FAISS hits with BM25 hits from the lexical
+        # index, and answers pure identifier queries from it alone.
+        self.hybrid = hybrid
+        # With ``checkpoint``, a build saves its progress under index_dir and
+        # an interrupted build resumes from it.
+        self.checkpoint = checkpoint
+        # Called as progress_callback("progress", progress) during a build,
+        # which matches the Agent callback signature.
+        self.progress_callback = progress_callback
+        # A (shard, n_shards) pair restricts the database to the files that
+        # get_shard assigns to ``shard``, see ShardedCodebaseDatabase.
+        self.shard = shard
+        # Seconds spent in each stage of the last build.
+        self.timings = {}
+        # Set when the index was loaded memory-mapped, which makes it
+        # read-only. Only IVF indexes are, see index_store.read_index.
+        self.index_mmapped = False
+        # Documents are keyed by a stable integer ID that is also their ID in
+        # the FAISS index, so removing one never shifts the others.
+        self.next_id = 0
+        # Per-file mtime, content hash and document IDs, used to re-index
+        # only the files that changed.
+        self.file_states = {}
+        # Documents only keep the filepath and byte span of their code,
+        # which is read back from the file when a document is looked up.
+        self.documents = DocumentStore()
+        # Document IDs grouped by the hash of their whitespace-normalized
+        # code. Only the first document of each group is embedded and
+        # indexed; search hits list every document in the group.
+        self.body_groups = {}
+        # None until first needed after loading a saved index.
+        self.lexical_index = LexicalIndex()
+        self.faiss_index = None
+        # The exact vector of every indexed document, memory-mapped from a
+        # file, for indexes with lossy storage. None for float32 storage.
+        self.exact_vectors = None
+        # The matching documents and FAISS ID filter of recent search
+        # filters, keyed by their (include, exclude) patterns. Emptied
+        # whenever documents or vectors change.
+        self.filter_cache = {}
+        # Held while the index and documents are read or changed, so that
+        # searches never see a half-applied refresh. Refreshes do their
+        # parsing and embedding before taking it, and take refresh_lock to
+        # run one at a time. Saves only take refresh_lock, which keeps the
+        # database from changing while searches go on.
+        self.lock = threading.RLock()
+        self.refresh_lock = threading.Lock()
+        if build:
+            self.build()
+
+    @classmethod
+    def load(cls, project_folder, mmap=False, **kwargs):
+        """Opens a saved index without re-parsing or re-embedding the project.
+
+        Returns None if there is no compatible saved index for the project.
+        """
+        database = cls(project_folder, build=False, **kwargs)
+        if not index_exists(database.index_dir):
+            return None
+
+        table = read_documents(database.index_dir)
+        if table is None:
+            return None
+
+        database.documents = table["documents"]
+        database.rebuild_body_groups()
+        database.lexical_index = None
+        database.file_states = table["file_states"]
+        database.next_id = table["next_id"]
+        database.faiss_index = read_index(database.index_dir, mmap=mmap)
+        database.index_mmapped = mmap and get_index_type(database.faiss_index) == "ivf"
+        database.storage = get_storage(database.faiss_index)
+        if database.storage != "float32":
+            database.exact_vectors = VectorStore.load(database.index_dir)
+            if database.exact_vectors is None:
+                return None
+        database.set_search_params(database.nprobe, database.ef_search)
+        return database
+
+    def save(self):
+        """Saves the FAISS index and the document table to ``index_dir``.
+
+        Everything that changes the database holds refresh_lock, so saving
+        under it alone writes a consistent state without blocking searches.
+        """
+        with self.refresh_lock:
+            if self.faiss_index is None:
+                return
+            # A memory-mapped index is backed by the file being replaced.
+            if not self.index_mmapped:
+                write_index(self.faiss_index, self.index_dir)
+            if self.exact_vectors is not None:
+                self.exact_vectors.save(self.index_dir, self.lock)
+            write_documents(
+                self.index_dir,
+                self.project_folder,
+                self.documents,
+                self.file_states,
+                self.next_id,
+            )
+
+    def ensure_writable(self):
+        """Swaps a memory-mapped index for an in-memory copy before mutating it."""
+        if self.index_mmapped:
+            self.faiss_index = read_index(self.index_dir)
+            self.filter_cache = {}
+            self.index_mmapped = False
+            self.set_search_params(self.nprobe, self.ef_search)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Tunes the recall/latency trade-off of approximate indexes.
+
+        ``nprobe`` is the number of IVF lists scanned per query and
+        ``ef_search`` the HNSW candidate list size; both are ignored by
+        index types that do not have them.
+        """
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+        if self.faiss_index is not None:
+            set_search_params(self.faiss_index, self.nprobe, self.ef_search)
+
+    def list_code_files(self):
+        code_files = walk_files(
+            self.project_folder,
+            exclude=self.exclude,
+            use_gitignore=self.use_gitignore,
+        )
+        if self.shard is None:
+            return code_files
+        return [path for path in code_files if self.in_shard(path)]
+
+    def in_shard(self, path):
+        if self.shard is None:
+            return True
+        shard, n_shards = self.shard
+        return get_shard(self.project_folder, path, n_shards) == shard
+
+    def build(self):
+        """Parses, embeds and indexes the project as a streaming pipeline.
 
-    def load_documents(self):
+        Files are parsed a chunk at a time and their functions embedded in
+        groups of batch_size * max_concurrency, with the vectors appended to
+        a file instead of kept in memory. The index is then built from the
+        memory-mapped vectors. With ``checkpoint``, the document table and
+        vectors are saved under index_dir as the build goes, an interrupted
+        build resumes where it stopped, and the finished index is saved.
+        """
+        if not self.checkpoint:
+            with tempfile.TemporaryDirectory() as build_dir:
+                self.build_in(build_dir)
+            return
+
+        build_dir = get_build_dir(self.index_dir)
+        resumed = self.resume_build(build_dir)
+        self.build_in(build_dir)
+        if resumed:
+            # Catch up on files that changed while the build was stopped.
+            self.refresh(list(self.file_states))
+        self.save()
+        remove_checkpoint(build_dir)
+
+    def resume_build(self, build_dir):
+        """Restores the documents of an interrupted build from its checkpoint.
+
+        Returns whether there was a usable checkpoint; unusable ones are
+        removed.
+        """
+        table = read_checkpoint(build_dir)
+        usable = table is not None and table["project_folder"] == os.path.abspath(
+            self.project_folder
+        )
+        if usable:
+            # The vector file holds one vector per body.
+            records = table["documents"].records.values()
+            n_bodies = len({record.body_hash for record in records})
+            usable = read_vectors(build_dir, n_bodies) is not None
+        if not usable:
+            remove_checkpoint(build_dir)
+            return False
+
+        self.documents = table["documents"]
+        self.rebuild_body_groups()
+        self.file_states = table["file_states"]
+        self.next_id = table["next_id"]
+        self.lexical_index = None
+        print(f"Resuming the build from {len(self.documents)} indexed functions.")
+        return True
+
+    def build_in(self, build_dir):
+        start = time.perf_counter()
         code_files = [
-            y
-            for x in os.walk(self.project_folder)
-            for y in glob(os.path.join(x[0], "*.py"))
+            path for path in self.list_code_files() if path not in self.file_states
         ]
-        all_funcs = []
+        scanned = time.perf_counter()
+        self.timings = {"scan": scanned - start, "parse": 0.0, "embed": 0.0}
 
-        for code_file in code_files:
-            funcs = list(get_functions(code_file))
-            for func in funcs:
-                all_funcs.append(func)
+        pending = {}
+        flush_size = self.batch_size * self.max_concurrency
+        last_checkpoint = scanned
+        parsed_files = iter_parse_files(code_files, self.parse_workers)
+        for n_files, code_file in enumerate(code_files, start=1):
+            parse_start = time.perf_counter()
+            fingerprint, funcs = next(parsed_files)
+            self.timings["parse"] += time.perf_counter() - parse_start
+            pending.update(self.add_parsed_file(code_file, fingerprint, funcs))
 
-        print(f"Loaded {len(all_funcs)} functions from {len(code_files)} files.")
-        return all_funcs
+            if len(pending) < flush_size and n_files < len(code_files):
+                continue
+            embed_start = time.perf_counter()
+            self.add_build_documents(build_dir, pending)
+            self.timings["embed"] += time.perf_counter() - embed_start
+            pending = {}
 
-    def create_vector_database(self):
-        embeddings = []
+            now = time.perf_counter()
+            if self.checkpoint and (
+                n_files == len(code_files)
+                or now - last_checkpoint >= BUILD_CHECKPOINT_SECONDS
+            ):
+                write_documents(
+                    build_dir,
+                    self.project_folder,
+                    self.documents,
+                    self.file_states,
+                    self.next_id,
+                )
+                last_checkpoint = now
+            self.report_progress("embedding", n_files, len(code_files), scanned)
 
-        print("Generating embeddings for loaded functions...")
-        for document in self.documents:
-            code = document["code"]
-            embedding = get_embedding(code)
-            embeddings.append(embedding)
-        print("Embeddings generated.")
+        cache_stats = get_embedding_cache().stats()
+        dedup = self.dedup_report()
+        print(
+            f"Loaded and embedded {len(self.documents)} functions from "
+            f"{len(code_files)} files ({dedup['unique_bodies']} unique bodies, "
+            f"dedup ratio {dedup['dedup_ratio']:.2f}; "
+            f"{cache_stats['hits']} cache hits, "
+            f"{cache_stats['misses']} misses; scan {self.timings['scan']:.2f}s, "
+            f"parse {self.timings['parse']:.2f}s, "
+            f"embed {self.timings['embed']:.2f}s)."
+        )
 
-        # print("Embeddings of loaded functions:")
-        # for i, embedding in enumerate(embeddings):
-        #     print(f"{i + 1}: {embedding}")
+        index_start = time.perf_counter()
+        indexed_ids = self.get_indexed_ids()
+        self.report_progress("indexing", 0, len(indexed_ids), index_start)
+        vectors = read_vectors(build_dir, len(indexed_ids))
+        if vectors is not None:
+            self.faiss_index = self.create_faiss_index(vectors, indexed_ids)
+            self.add_exact_vectors(vectors, indexed_ids)
+            self.filter_cache = {}
+        del vectors
+        self.timings["index"] = time.perf_counter() - index_start
+        self.report_progress(
+            "indexing", len(indexed_ids), len(indexed_ids), index_start
+        )
 
-        index = self.create_faiss_index(embeddings)
-        return index
+    def add_build_documents(self, build_dir, documents):
+        """Embeds documents with new bodies during a build and appends their
+        vectors."""
+        new_bodies = self.find_new_bodies(documents)
+        if new_bodies:
+            append_vectors(build_dir, self.embed_documents(new_bodies.values()))
+        self.documents.update(documents)
+        self.add_to_body_groups(documents)
+        if self.lexical_index is not None:
+            for document_id, document in new_bodies.items():
+                self.lexical_index.add(document_id, document)
+
+    def report_progress(self, stage, done, total, start):
+        """Sends the progress and estimated time left of a build stage."""
+        if self.progress_callback is None:
+            return
+        elapsed = time.perf_counter() - start
+        self.progress_callback(
+            "progress",
+            {
+                "stage": stage,
+                "done": done,
+                "total": total,
+                "elapsed": elapsed,
+                "eta": elapsed / done * (total - done) if done else None,
+            },
+        )
+
+    def get_lexical_index(self):
+        """Returns the lexical index, building it if the database was loaded."""
+        if self.lexical_index is None:
+            lexical_index = LexicalIndex()
+            for document_id in self.get_indexed_ids():
+                lexical_index.add(document_id, self.documents[document_id])
+            self.lexical_index = lexical_index
+        return self.lexical_index
+
+    def get_indexed_ids(self):
+        """Returns the IDs of the documents in the index, one per body."""
+        return [group[0] for group in self.body_groups.values()]
 
-    def create_faiss_index(self, vectors):
-        dimension = len(vectors[0])
-        index = faiss.IndexFlatL2(dimension)
-        index.add(np.array(vectors).astype("float32"))
+    def rebuild_body_groups(self):
+        self.body_groups = {}
+        for document_id, record in self.documents.records.items():
+            self.body_groups.setdefault(record.body_hash, []).append(document_id)
+
+    def find_new_bodies(self, documents):
+        """Returns the documents whose body is not indexed yet, one per body.
+
+        Sets the "body_hash" of every document along the way.
+        """
+        new_bodies = {}
+        for document_id, document in documents.items():
+            if "body_hash" not in document:
+                document["body_hash"] = get_body_hash(document["code"])
+            body_hash = document["body_hash"]
+            if body_hash not in self.body_groups and body_hash not in new_bodies:
+                new_bodies[body_hash] = document_id
+        return {
+            document_id: documents[document_id] for document_id in new_bodies.values()
+        }
+
+    def add_to_body_groups(self, documents):
+        for document_id, document in documents.items():
+            self.body_groups.setdefault(document["body_hash"], []).append(document_id)
+
+    def get_locations(self, document_id):
+        """Returns where every copy of an indexed document's body is defined."""
+        body_hash = self.documents.records[document_id].body_hash
+        return [
+            self.documents.get_location(copy_id)
+            for copy_id in self.body_groups.get(body_hash, [document_id])
+        ]
+
+    def dedup_report(self):
+        """Reports how many documents share a body with another one."""
+        n_documents = len(self.documents)
+        n_bodies = len(self.body_groups)
+        return {
+            "documents": n_documents,
+            "unique_bodies": n_bodies,
+            "duplicates": n_documents - n_bodies,
+            "dedup_ratio": n_documents / n_bodies if n_bodies else 1.0,
+        }
+
+    def add_parsed_file(self, code_file, fingerprint, funcs):
+        """Assigns IDs to a file's functions and records the file's state."""
+        mtime, content_hash = fingerprint
+        documents = {}
+        for func in funcs:
+            documents[self.next_id] = func
+            self.next_id += 1
+
+        self.file_states[code_file] = {
+            "mtime": mtime,
+            "hash": content_hash,
+            "ids": list(documents),
+        }
+        return documents
+
+    def embed_documents(self, documents):
+        return embed_in_batches(
+            [document["code"] for document in documents],
+            get_embeddings,
+            batch_size=self.batch_size,
+            max_batch_chars=self.max_batch_chars,
+            max_concurrency=self.max_concurrency,
+        )
+
+    def create_faiss_index(self, vectors, ids):
+        if len(vectors) == 0:
+            return None
+        index = build_index(
+            vectors,
+            ids,
+            index_type=self.index_type,
+            nprobe=self.nprobe,
+            ef_search=self.ef_search,
+            storage=self.storage,
+        )
         return index
 
+    def add_documents(self, documents):
+        """Embeds and indexes documents keyed by their IDs.
+
+        Documents whose body is already indexed are only added to its group.
+        """
+        if not documents:
+            return
+        self.filter_cache = {}
+        new_bodies = self.find_new_bodies(documents)
+        vectors = self.embed_documents(new_bodies.values()) if new_bodies else []
+        self.ensure_writable()
+        self.add_vectors(vectors, list(new_bodies))
+        self.documents.update(documents)
+        self.add_to_body_groups(documents)
+        if self.lexical_index is not None:
+            for document_id, document in new_bodies.items():
+                self.lexical_index.add(document_id, document)
+
+    def add_vectors(self, vectors, ids):
+        if not ids:
+            return
+        if self.faiss_index is None:
+            self.faiss_index = self.create_faiss_index(vectors, ids)
+        else:
+            self.faiss_index.add_with_ids(
+                np.array(vectors).astype("float32"), np.array(ids).astype("int64")
+            )
+        self.add_exact_vectors(vectors, ids)
+
+    def add_exact_vectors(self, vectors, ids):
+        """Keeps the exact vectors of indexed documents when the index only
+        stores lossy ones."""
+        if self.storage == "float32":
+            return
+        if self.exact_vectors is None:
+            self.exact_vectors = VectorStore()
+        self.exact_vectors.add(ids, vectors)
+
+    def get_exact_vectors(self, ids):
+        """Returns the exact vectors of indexed documents, without embedding
+        them."""
+        if self.exact_vectors is not None:
+            return self.exact_vectors.get(ids)
+        return np.vstack([self.faiss_index.reconstruct(int(i)) for i in ids])
+
+    def remove_documents(self, ids):
+        """Removes documents and their vectors from the index.
+
+        When an indexed document is removed but other documents share its
+        body, the next one of them is indexed in its place.
+        """
+        if not ids:
+            return
+        self.ensure_writable()
+        self.filter_cache = {}
+
+        # The indexed document of each body that loses documents.
+        indexed_ids = {}
+        for document_id in ids:
+            record = self.documents.records.get(document_id)
+            if record is None:
+                continue
+            group = self.body_groups[record.body_hash]
+            indexed_ids.setdefault(record.body_hash, group[0])
+            group.remove(document_id)
+            del self.documents[document_id]
+
+        unindexed_ids = []
+        promoted = {}
+        for body_hash, indexed_id in indexed_ids.items():
+            group = self.body_groups[body_hash]
+            if group and group[0] == indexed_id:
+                continue
+            unindexed_ids.append(indexed_id)
+            if self.lexical_index is not None:
+                self.lexical_index.remove(indexed_id)
+            if group:
+                promoted[group[0]] = self.documents[group[0]]
+            else:
+                del self.body_groups[body_hash]
+
+        if unindexed_ids and self.faiss_index is not None:
+            self.faiss_index = remove_ids(
+                self.faiss_index, unindexed_ids, self.get_exact_vectors
+            )
+        if unindexed_ids and self.exact_vectors is not None:
+            self.exact_vectors.remove(unindexed_ids)
+        if promoted:
+            self.add_vectors(self.embed_documents(promoted.values()), list(promoted))
+            if self.lexical_index is not None:
+                for document_id, document in promoted.items():
+                    self.lexical_index.add(document_id, document)
+
+    def refresh(self, paths=None):
+        """Re-indexes the files that changed since they were last indexed.
+
+        When ``paths`` is None the whole project is rescanned. Files whose
+        mtime changed but whose content hash did not are left untouched.
+        Returns the list of files that were re-indexed or dropped.
+
+        Changed files are parsed and embedded without holding ``lock``, so
+        searches keep running against the previous state until the changes
+        are applied all at once.
+        """
+        with self.refresh_lock:
+            if paths is None:
+                paths = set(self.list_code_files()) | set(self.file_states)
+
+            deleted_files = []
+            parsed_files = []
+            for path in paths:
+                if not path.endswith(".py") or not self.in_shard(path):
+                    continue
+
+                state = self.file_states.get(path)
+                if not os.path.isfile(path):
+                    if state is not None:
+                        deleted_files.append(path)
+                    continue
+
+                if state is not None and os.stat(path).st_mtime == state["mtime"]:
+                    continue
+
+                fingerprint = get_file_fingerprint(path)
+                if state is not None and fingerprint[1] == state["hash"]:
+                    state["mtime"] = fingerprint[0]
+                    continue
+
+                parsed_files.append((path, fingerprint, get_functions(path)))
+
+            # Embedding the new bodies here fills the embedding cache, so
+            # add_documents finds their vectors there while holding the lock.
+            functions = dict(
+                enumerate(func for _, _, funcs in parsed_files for func in funcs)
+            )
+            new_bodies = self.find_new_bodies(functions)
+            if new_bodies:
+                self.embed_documents(new_bodies.values())
+
+            with self.lock:
+                stale_ids = []
+                for path in deleted_files:
+                    stale_ids.extend(self.file_states.pop(path)["ids"])
+                new_documents = {}
+                for path, fingerprint, funcs in parsed_files:
+                    state = self.file_states.get(path)
+                    if state is not None:
+                        stale_ids.extend(state["ids"])
+                    new_documents.update(self.add_parsed_file(path, fingerprint, funcs))
+
+                self.remove_documents(stale_ids)
+                self.add_documents(new_documents)
+            return deleted_files + [path for path, _, _ in parsed_files]
+
     def update_faiss_index(self, new_information):
-        new_vector = get_embedding(new_information["code"])
-        self.faiss_index.add(np.array([new_vector]).astype("float32"))
+        with self.refresh_lock, self.lock:
+            document_id = self.next_id
+            self.next_id += 1
+            self.add_documents({document_id: new_information})
+
+            state = self.file_states.get(new_information.get("filepath"))
+            if state is not None:
+                state["ids"].append(document_id)
+
+    def search_faiss_index(self, query, k=5, include=None, exclude=None):
+        """Returns the ``k`` documents most relevant to ``query``.
+
+        Each result has the "document", the L2 "distance" of its vector to
+        the query, and the "locations" of every function with the same
+        body, the document's own included. Documents that are chunks of a
+        long function have its "parent_start_line" and "parent_end_line".
+
+        With hybrid search, results also have the "score" they were ranked
+        by: the reciprocal rank fusion of the FAISS and BM25 rankings, or,
+        for identifier queries answered by the lexical index alone, the
+        BM25 score (their distance is then NaN).
+
+        ``include`` and ``exclude`` restrict the search to files matching
+        any pattern of the first and none of the second, see PathFilter.
+        FAISS and BM25 then only rank functions in those files, so up to
+        ``k`` results still come back, with only the locations that match.
+        """
+        return self.search_many([query], k, include, exclude)[0]
+
+    def search_many(self, queries, k=5, include=None, exclude=None):
+        """Searches for several queries with one embedding request.
+
+        Returns one list of results per query, each in the format returned
+        by search_faiss_index. Identifier queries that the lexical index can
+        answer are not embedded.
+        """
+        if self.faiss_index is None or not queries:
+            return [[] for _ in queries]
+
+        all_hits = self.search_identifiers(queries, k, include, exclude)
+        embedded = [position for position, hits in enumerate(all_hits) if not hits]
+        if embedded:
+            # Queries are embedded without holding the lock, so a slow
+            # request never holds up a refresh.
+            query_vectors = get_query_embeddings([queries[p] for p in embedded])
+            vector_hits = self.search_embedded(
+                [queries[p] for p in embedded], query_vectors, k, include, exclude
+            )
+            for position, hits in zip(embedded, vector_hits):
+                all_hits[position] = hits
+        return [
+            self.make_results(fuse_search_hits(hits, k), include, exclude)
+            for hits in all_hits
+        ]
+
+    def get_candidate_count(self, k):
+        """Returns how many FAISS and BM25 hits are fused into ``k`` results."""
+        return k * HYBRID_CANDIDATES_PER_RESULT if self.hybrid else k
+
+    def get_term_stats(self, queries):
+        """Returns the lexical index's term statistics for the terms of each
+        query, see LexicalIndex.get_term_stats."""
+        with self.lock:
+            lexical_index = self.get_lexical_index()
+            return [lexical_index.get_term_stats(set(tokenize(q))) for q in queries]
+
+    def search_identifiers(self, queries, k, include=None, exclude=None, stats=None):
+        """Answers the identifier queries that the lexical index can.
+
+        Returns the search hits of each query, see fuse_search_hits, or None
+        for queries that have to be embedded. ``stats`` replaces the lexical
+        index's term statistics for each query.
+        """
+        all_hits = [None] * len(queries)
+        with self.lock:
+            allowed, _ = self.get_search_filter(include, exclude)
+            if allowed is not None and not allowed:
+                # Nothing matches the filter, so nothing needs embedding.
+                return [{"vector": []} for _ in queries]
+            if not self.hybrid:
+                return all_hits
+            lexical_index = self.get_lexical_index()
+            for position, query in enumerate(queries):
+                if not is_identifier_query(query):
+                    continue
+                query_stats = stats[position] if stats is not None else None
+                hits = lexical_index.search_identifier(query, k, allowed, query_stats)
+                if hits:
+                    exact = lexical_index.find_name(query)
+                    all_hits[position] = {
+                        "identifier": hits,
+                        "exact": {i for _, i in hits if i in exact},
+                    }
+        return all_hits
+
+    def search_embedded(
+        self, queries, query_vectors, k, include=None, exclude=None, stats=None
+    ):
+        """Returns the FAISS hits and, with hybrid search, the BM25 hits of
+        each embedded query, see fuse_search_hits."""
+        with self.lock:
+            allowed, id_filter = self.get_search_filter(include, exclude)
+            if self.faiss_index is None or (allowed is not None and not allowed):
+                return [{"vector": []} for _ in queries]
+            n_candidates = self.get_candidate_count(k)
+            vector_hits = self.search_vectors(query_vectors, n_candidates, id_filter)
+            if not self.hybrid:
+                return [{"vector": hits} for hits in vector_hits]
+            lexical_index = self.get_lexical_index()
+            return [
+                {
+                    "vector": hits,
+                    "lexical": lexical_index.search(
+                        query,
+                        n_candidates,
+                        allowed,
+                        stats[position] if stats is not None else None,
+                    ),
+                }
+                for position, (query, hits) in enumerate(zip(queries, vector_hits))
+            ]
+
+    def make_results(self, hits, include=None, exclude=None):
+        """Returns the results of (distance, score, ID) hits.
+
+        Documents that a refresh removed since the search are left out.
+        """
+        with self.lock:
+            allowed, _ = self.get_search_filter(include, exclude)
+            return [
+                self.make_result(i, distance, score, allowed)
+                for distance, score, i in hits
+                if i in self.documents.records and (allowed is None or i in allowed)
+            ]
+
+    def get_search_filter(self, include=None, exclude=None):
+        """Returns the documents and FAISS ID filter of a path filter.
+
+        The documents map the indexed ID of every body defined in a matching
+        file to the IDs of its matching copies. Both are None without
+        patterns.
+        """
+        if isinstance(include, str):
+            include = [include]
+        if isinstance(exclude, str):
+            exclude = [exclude]
+        if not include and not exclude:
+            return None, None
+
+        key = (tuple(include or ()), tuple(exclude or ()))
+        if key not in self.filter_cache:
+            path_filter = PathFilter(self.project_folder, key[0], key[1])
+            allowed = {}
+            for path, state in self.file_states.items():
+                if not path_filter.matches(path):
+                    continue
+                for document_id in state["ids"]:
+                    record = self.documents.records.get(document_id)
+                    if record is not None:
+                        indexed_id = self.body_groups[record.body_hash][0]
+                        allowed.setdefault(indexed_id, []).append(document_id)
+            id_filter = None
+            if allowed and self.faiss_index is not None:
+                id_filter = IDFilter(self.faiss_index, list(allowed))
+            self.filter_cache[key] = (allowed, id_filter)
+        return self.filter_cache[key]
 
-    def search_faiss_index(self, query, k=5):
-        query_vector = get_embedding(query)
-        distances, indices = self.faiss_index.search(
-            np.array([query_vector]).astype("float32"), k
+    def make_result(self, document_id, distance, score=None, allowed=None):
+        """Returns a search result for an indexed document.
+
+        With ``allowed`` from get_search_filter, the result is the first
+        copy of the body in a matching file and only lists those copies.
+        """
+        locations = self.get_locations(document_id)
+        if allowed is not None:
+            copy_ids = allowed[document_id]
+            document_id = copy_ids[0]
+            locations = [self.documents.get_location(i) for i in copy_ids]
+        result = {
+            "document": self.documents[document_id],
+            "distance": distance,
+            "locations": locations,
+        }
+        if score is not None:
+            result["score"] = score
+        return result
+
+    def search_vectors(self, query_vectors, k, id_filter=None):
+        """Returns the (distance, document ID) hits for each query vector.
+
+        With lossy storage, k * rerank_factor candidates are fetched and
+        re-ranked by their exact L2 distance. With ``id_filter``, only the
+        vectors it selects are searched.
+        """
+        query_vectors = np.array(query_vectors).astype("float32")
+        rerank = self.storage != "float32"
+        n_candidates = k * self.rerank_factor if rerank else k
+        distances, indices = search_index(
+            self.faiss_index, query_vectors, n_candidates, id_filter
         )
-        results = [
-            {"document": self.documents[i], "distance": distances[0][j]}
-            for j, i in enumerate(indices[0])
+
+        all_hits = [
+            [
+                (distance, int(i))
+                for distance, i in zip(row_distances, row_indices)
+                if i != -1
+            ]
+            for row_distances, row_indices in zip(distances, indices)
         ]
-        return results
+        if not rerank:
+            return all_hits
+
+        candidate_ids = list({i for hits in all_hits for _, i in hits})
+        exact_vectors = dict(zip(candidate_ids, self.get_exact_vectors(candidate_ids)))
+        reranked = []
+        for query_vector, hits in zip(query_vectors, all_hits):
+            reranked_hits = [
+                (np.sum((exact_vectors[i] - query_vector) ** 2), i) for _, i in hits
+            ]
+            reranked_hits.sort(key=lambda hit: hit[0])
+            reranked.append(reranked_hits[:k])
+        return reranked
+
+    def estimate_memory(self):
+        """Estimates the bytes the index, documents and lexical index hold."""
+        with self.lock:
+            n_bytes = len(self.documents) * DOCUMENT_MEMORY_BYTES
+            if self.lexical_index is not None:
+                n_bytes += len(self.lexical_index) * LEXICAL_INDEX_MEMORY_BYTES
+            if self.faiss_index is not None:
+                n_bytes += get_index_memory(self.faiss_index)
+            return n_bytes
+
+    def memory_report(self, sample_size=100, k=10):
+        """Reports the index's memory per vector and its recall@k.
+
+        Recall is measured by using a sample of indexed vectors as queries
+        and comparing the hits with an exact search over all vectors.
+        """
+        if self.faiss_index is None:
+            return None
+
+        indexed_ids = self.get_indexed_ids()
+        ids = np.array(indexed_ids).astype("int64")
+        vectors = self.get_exact_vectors(indexed_ids)
+        dimension = vectors.shape[1]
+        k = min(k, len(ids))
+
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(ids), min(sample_size, len(ids)), replace=False)
+        queries = vectors[sample]
+
+        exact_index = build_index(vectors, ids, "flat")
+        _, expected = exact_index.search(queries, k)
+        _, found = self.faiss_index.search(queries, k)
+        reranked = [[i for _, i in hits] for hits in self.search_vectors(queries, k)]
+
+        def recall(results):
+            matches = sum(len(set(r) & set(e)) for r, e in zip(results, expected))
+            return matches / expected.size
+
+        return {
+            "index_type": get_index_type(self.faiss_index),
+            "storage": self.storage,
+            "vectors": int(self.faiss_index.ntotal),
+            "dimension": dimension,
+            "bytes_per_vector": get_bytes_per_vector(self.faiss_index),
+            "float32_bytes_per_vector": 4 * dimension,
+            f"recall@{k}": recall(reranked),
+            f"recall@{k}_without_rerank": recall(found),
+        }
 
 
-def convert_to_database(project_folder, project_source):
-    if project_source != "none":
-        codebase_database = CodebaseDatabase(project_folder)
-    else:
-        codebase_database = None
+def fuse_search_hits(hits, k):
+    """Returns the ``k`` best (distance, score, ID) results of search hits.
+
+    ``hits`` holds either the (BM25 score, ID) "identifier" hits of an
+    identifier query, ranked with the "exact" name matches first, or the
+    (distance, ID) "vector" hits of an embedded query and, with hybrid
+    search, its (BM25 score, ID) "lexical" hits, which are fused by
+    reciprocal rank fusion. Results without a distance have a NaN one and
+    results of a plain vector search no score.
+    """
+    if "identifier" in hits:
+        return [(float("nan"), score, i) for score, i in hits["identifier"][:k]]
+    if "lexical" not in hits:
+        return [(distance, None, i) for distance, i in hits["vector"][:k]]
+    distances = {i: distance for distance, i in hits["vector"]}
+    fused = reciprocal_rank_fusion([list(distances), [i for _, i in hits["lexical"]]])
+    return [(distances.get(i, float("nan")), score, i) for score, i in fused[:k]]
+
+
+def open_database(project_folder, callback=None, **kwargs):
+    """Opens a project's saved index, or builds and saves one.
+
+    A saved index is memory-mapped and only catches up on the files that
+    changed since it was written.
+    """
+    codebase_database = CodebaseDatabase.load(project_folder, mmap=True, **kwargs)
+    if codebase_database is None:
+        codebase_database = CodebaseDatabase(
+            project_folder, checkpoint=True, progress_callback=callback, **kwargs
+        )
+    elif codebase_database.refresh():
+        codebase_database.save()
     return codebase_database
 
 
+def convert_to_database(project_folder, project_source, callback=None):
+    if project_source == "none":
+        return None
+    return open_database(project_folder, callback)
+
+
 def get_embedding(text, engine="text-embedding-ada-002"):
     openai.api_key = OPENAI_API_KEY
 
-    query_result = embeddings.embed_query(text)
+    query_result = get_embedding_cache().get_or_embed(
+        [text], lambda texts: [embeddings.embed_query(texts[0])], engine
+    )[0]
     return query_result
 
 
+def get_query_embeddings(queries, engine="text-embedding-ada-002"):
+    """Embeds search queries, sending only uncached ones in one request."""
+    return get_query_embedding_cache().get_or_embed(
+        queries, lambda texts: get_embeddings(texts, engine), engine
+    )
+
+
+def get_embeddings(texts, engine="text-embedding-ada-002"):
+    openai.api_key = OPENAI_API_KEY
+
+    query_results = get_embedding_cache().get_or_embed(
+        texts, embeddings.embed_documents, engine
+    )
+    return query_results
+
+
 def main():
     project_folder = "/Users/russellocean/Dev/ProjectGPT"
     codebase_database = CodebaseDatabase(project_folder)
@@ -0,0 +1,235 @@
+import hashlib
+import mmap
+import sys
+from collections.abc import MutableMapping
+
+from database.file_parser import decode_code, get_functions_from_source
+
+
+# Optional fields of a record returned in document dicts when set.
+LOCATION_FIELDS = (
+    "start_line",
+    "end_line",
+    "start_byte",
+    "end_byte",
+    "chunk_index",
+    "parent_start_line",
+    "parent_end_line",
+)
+
+
+class DocumentRecord:
+    """The compact form of a document: where its code lives, not the code.
+
+    ``code`` is only set for documents that have no byte span in a file,
+    such as ones added by hand through CodebaseDatabase.update_faiss_index.
+    ``body_hash`` identifies the document's code up to whitespace, see
+    get_body_hash. Chunks of a function too long to embed whole have a
+    ``chunk_index`` and the line span of the whole function.
+    """
+
+    __slots__ = (
+        "path_id",
+        "function_name",
+        "start_line",
+        "end_line",
+        "start_byte",
+        "end_byte",
+        "body_hash",
+        "chunk_index",
+        "parent_start_line",
+        "parent_end_line",
+        "code",
+    )
+
+    def __init__(
+        self,
+        path_id,
+        function_name,
+        start_line=None,
+        end_line=None,
+        start_byte=None,
+        end_byte=None,
+        body_hash=None,
+        chunk_index=None,
+        parent_start_line=None,
+        parent_end_line=None,
+        code=None,
+    ):
+        self.path_id = path_id
+        self.function_name = function_name
+        self.start_line = start_line
+        self.end_line = end_line
+        self.start_byte = start_byte
+        self.end_byte = end_byte
+        self.body_hash = body_hash
+        self.chunk_index = chunk_index
+        self.parent_start_line = parent_start_line
+        self.parent_end_line = parent_end_line
+        self.code = code
+
+
+class DocumentStore(MutableMapping):
+    """
+    A table of documents keyed by ID that keeps code out of memory.
+
+    Each document is stored as a DocumentRecord with an interned filepath
+    and the byte span of its code. Looking a document up returns the usual
+    document dict, reading its code from the source file through mmap, so
+    only the documents actually returned by a search pay for their text.
+
+    Code read from a file is checked against the document's body hash. If
+    the file changed since it was indexed, the function is looked up again
+    in the file as it is now; when its code changed too, the dict has its
+    current code, or "" if it is gone, and "stale" set to True.
+
+    Attributes
+    ----------
+    paths : list
+        the interned filepaths, indexed by DocumentRecord.path_id
+    records : dict
+        the DocumentRecord of each document ID
+    """
+
+    def __init__(self, documents=None):
+        self.paths = []
+        self.path_ids = {}
+        self.records = {}
+        if documents:
+            self.update(documents)
+
+    def intern_path(self, path):
+        if path is None:
+            return None
+        path_id = self.path_ids.get(path)
+        if path_id is None:
+            path_id = self.path_ids[path] = len(self.paths)
+            self.paths.append(path)
+        return path_id
+
+    def __setitem__(self, document_id, document):
+        has_span = (
+            document.get("filepath") is not None
+            and document.get("start_byte") is not None
+            and document.get("end_byte") is not None
+        )
+        function_name = document.get("function_name")
+        body_hash = document.get("body_hash")
+        if body_hash is None:
+            body_hash = get_body_hash(document.get("code") or "")
+        self.records[document_id] = DocumentRecord(
+            self.intern_path(document.get("filepath")),
+            sys.intern(function_name) if function_name else function_name,
+            document.get("start_line"),
+            document.get("end_line"),
+            document.get("start_byte"),
+            document.get("end_byte"),
+            body_hash,
+            document.get("chunk_index"),
+            document.get("parent_start_line"),
+            document.get("parent_end_line"),
+            None if has_span else document.get("code"),
+        )
+
+    def __getitem__(self, document_id):
+        document = self.get_location(document_id)
+        code = self.get_code(document_id)
+        if code is not None:
+            document["code"] = code
+            return document
+
+        current = self.find_current(document_id)
+        if current is None:
+            return dict(document, code="", stale=True)
+        for field in LOCATION_FIELDS:
+            if field in current:
+                document[field] = current[field]
+        document["code"] = current["code"]
+        if get_body_hash(current["code"]) != self.records[document_id].body_hash:
+            document["stale"] = True
+        return document
+
+    def get_location(self, document_id):
+        """Returns a document's dict without its code, which reads no file."""
+        record = self.records[document_id]
+        location = {
+            "function_name": record.function_name,
+            "filepath": self.get_path(record),
+        }
+        for field in LOCATION_FIELDS:
+            value = getattr(record, field)
+            if value is not None:
+                location[field] = value
+        return location
+
+    def __delitem__(self, document_id):
+        del self.records[document_id]
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, document_id):
+        return document_id in self.records
+
+    def get_path(self, record):
+        return None if record.path_id is None else self.paths[record.path_id]
+
+    def get_code(self, document_id):
+        """Reads a document's code from its file, or returns the stored copy.
+
+        Returns None if the span no longer holds the indexed code.
+        """
+        record = self.records[document_id]
+        if record.code is not None or record.start_byte is None:
+            return record.code
+        code = read_span(self.get_path(record), record.start_byte, record.end_byte)
+        if get_body_hash(code) != record.body_hash:
+            return None
+        return code
+
+    def find_current(self, document_id):
+        """Parses a document's file as it is now and returns the function
+        with the document's name, preferring one with the indexed code."""
+        record = self.records[document_id]
+        path = self.get_path(record)
+        try:
+            with open(path, "rb") as file:
+                source = file.read()
+        except OSError:
+            return None
+
+        candidates = [
+            function
+            for function in get_functions_from_source(path, source)
+            if function["function_name"] == record.function_name
+            and function.get("chunk_index") == record.chunk_index
+        ]
+        for function in candidates:
+            if get_body_hash(function["code"]) == record.body_hash:
+                return function
+        return candidates[0] if candidates else None
+
+
+def get_body_hash(code):
+    """Returns a 128-bit hash of ``code`` with all runs of whitespace collapsed,
+    so copies that only differ in indentation or spacing hash the same."""
+    normalized = " ".join(code.split()).encode("utf-8", errors="replace")
+    return int.from_bytes(hashlib.blake2b(normalized, digest_size=16).digest(), "big")
+
+
+def read_span(filepath, start_byte, end_byte):
+    """Reads and decodes a byte span of a file through mmap.
+
+    Returns an empty string if the file is gone or shorter than the span.
+    """
+    try:
+        with open(filepath, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if end_byte > len(mapped):
+                    return ""
+                return decode_code(mapped[start_byte:end_byte])
+    except (OSError, ValueError):
+        return ""
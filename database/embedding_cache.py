@@ -0,0 +1,338 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+EMBEDDING_CACHE_PATH = ".aidapt/embedding_cache.sqlite3"
+# Roughly 160k ada-002 vectors at 6 KiB each.
+EMBEDDING_CACHE_MAX_BYTES = 1024**3
+QUERY_CACHE_MAX_ENTRIES = 2048
+QUERY_CACHE_TTL_SECONDS = 60 * 60
+
+
+class EmbeddingCache:
+    """
+    An on-disk, content-addressed cache of embedding vectors.
+
+    Rows are keyed by a SHA-256 hash of the model name and the text, so the
+    same text embedded with the same model is only ever paid for once. The
+    cache is capped at ``max_bytes`` of vector data; when the cap is exceeded
+    the least recently used rows are evicted.
+
+    Attributes
+    ----------
+    path : str
+        the SQLite database file backing the cache
+    max_bytes : int
+        the maximum number of bytes of vector data kept on disk
+    hits : int
+        the number of lookups answered from the cache
+    misses : int
+        the number of lookups that had to be embedded
+    """
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+    ):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._connection.commit()
+        self._total_bytes, self._clock = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM embeddings"
+        ).fetchone()
+
+    @staticmethod
+    def make_key(text: str, model: str) -> str:
+        """Returns the cache key for the given text and model."""
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def get_many(self, texts: Sequence[str], model: str) -> List[Optional[list]]:
+        """Returns the cached vector for each text, or None where there is none."""
+        keys = [self.make_key(text, model) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters.
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                self._clock += 1
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(self._clock, key) for key in found],
+                )
+                self._connection.commit()
+
+            vectors = []
+            for key in keys:
+                if key in found:
+                    self.hits += 1
+                    vectors.append(np.frombuffer(found[key], dtype="float32").tolist())
+                else:
+                    self.misses += 1
+                    vectors.append(None)
+        return vectors
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[list], model: str):
+        """Stores vectors for the given texts and evicts rows over the size cap."""
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype="float32").tobytes()
+            rows.append((self.make_key(text, model), model, blob, len(blob)))
+        rows = list({row[0]: row for row in rows}.values())
+
+        with self._lock:
+            self._clock += 1
+            rows = [row + (self._clock,) for row in rows]
+            # Replacing a row must not count its old size twice.
+            for start in range(0, len(rows), 500):
+                chunk = [row[0] for row in rows[start : start + 500]]
+                placeholders = ",".join("?" * len(chunk))
+                self._total_bytes -= self._connection.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchone()[0]
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._total_bytes += sum(row[3] for row in rows)
+            self._evict()
+            self._connection.commit()
+
+    def get_or_embed(
+        self,
+        texts: Sequence[str],
+        embed: Callable[[List[str]], List[list]],
+        model: str,
+    ) -> List[list]:
+        """Returns a vector for each text, embedding only the texts not cached."""
+        vectors = self.get_many(texts, model)
+
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(texts[i], []).append(i)
+
+        if missing:
+            missing_texts = list(missing)
+            new_vectors = embed(missing_texts)
+            self.put_many(missing_texts, new_vectors, model)
+            for text, vector in zip(missing_texts, new_vectors):
+                for i in missing[text]:
+                    vectors[i] = vector
+
+        return vectors
+
+    def _evict(self):
+        """Deletes least recently used rows until the cache fits in max_bytes."""
+        while self._total_bytes > self.max_bytes:
+            rows = self._connection.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+            self._connection.executemany(
+                "DELETE FROM embeddings WHERE key = ?", evicted
+            )
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries = self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._total_bytes,
+            }
+
+    def close(self):
+        """Closes the underlying SQLite connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class CachedEmbeddingFunction:
+    """Wraps a Chroma embedding function so it reads from an EmbeddingCache."""
+
+    def __init__(self, embedding_function, model: str, cache: EmbeddingCache = None):
+        self.embedding_function = embedding_function
+        self.model = model
+        self.cache = cache
+
+    def __call__(self, texts):
+        cache = self.cache if self.cache is not None else get_embedding_cache()
+        return cache.get_or_embed(list(texts), self.embedding_function, self.model)
+
+
+class QueryEmbeddingCache:
+    """
+    A bounded in-process LRU cache of query embeddings with a TTL.
+
+    Queries are keyed by the model and the text with runs of whitespace
+    collapsed, so strings that only differ in spacing share an entry.
+    Entries older than ``ttl`` seconds are treated as misses.
+
+    Attributes
+    ----------
+    max_entries : int
+        the maximum number of cached queries
+    ttl : float
+        the number of seconds an entry stays valid
+    hits : int
+        the number of lookups answered from the cache
+    misses : int
+        the number of lookups that had to be embedded, expired ones included
+    expirations : int
+        the number of entries dropped because they outlived the TTL
+    """
+
+    def __init__(
+        self,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        ttl: float = QUERY_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text: str, model: str):
+        return model, " ".join(text.split())
+
+    def get(self, text: str, model: str) -> Optional[list]:
+        """Returns the cached vector for a query, or None."""
+        key = self.make_key(text, model)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, text: str, vector: list, model: str):
+        key = self.make_key(text, model)
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_embed(
+        self,
+        texts: Sequence[str],
+        embed: Callable[[List[str]], List[list]],
+        model: str,
+    ) -> List[list]:
+        """Returns a vector per query, embedding the misses in one call."""
+        vectors = [self.get(text, model) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            new_vectors = embed([texts[i] for i in missing])
+            for i, vector in zip(missing, new_vectors):
+                self.put(texts[i], vector, model)
+                vectors[i] = vector
+        return vectors
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the number of cached queries."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+_query_embedding_cache = QueryEmbeddingCache()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Returns the process-wide embedding cache, opening it on first use."""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
+
+
+def reopen_embedding_cache(path: str = EMBEDDING_CACHE_PATH) -> EmbeddingCache:
+    """Opens a new embedding cache connection for this process.
+
+    Worker processes call this with their parent's cache path, since a
+    SQLite connection must not be shared across a fork.
+    """
+    global _embedding_cache
+    with _embedding_cache_lock:
+        _embedding_cache = EmbeddingCache(path)
+        return _embedding_cache
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """Returns the query embedding cache shared by both databases."""
+    return _query_embedding_cache
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Sequence
+
+# Number of texts sent to the embedding endpoint in a single request.
+EMBEDDING_BATCH_SIZE = 64
+# Upper bound on the characters sent in one request, keeps giant functions from
+# pushing a request over the endpoint's token limit.
+EMBEDDING_BATCH_MAX_CHARS = 200_000
+# Number of embedding requests kept in flight at once.
+EMBEDDING_MAX_CONCURRENCY = 8
+
+
+def make_batches(
+    texts: Sequence[str],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_batch_chars: int = EMBEDDING_BATCH_MAX_CHARS,
+) -> Iterator[List[int]]:
+    """Groups texts into size-bounded batches.
+
+    Yields lists of indices into ``texts``. A batch is closed once it holds
+    ``batch_size`` texts or adding the next text would exceed
+    ``max_batch_chars``. A single text longer than ``max_batch_chars`` is sent
+    in a batch of its own.
+    """
+    batch = []
+    batch_chars = 0
+    for i, text in enumerate(texts):
+        if batch and (
+            len(batch) >= batch_size or batch_chars + len(text) > max_batch_chars
+        ):
+            yield batch
+            batch = []
+            batch_chars = 0
+        batch.append(i)
+        batch_chars += len(text)
+    if batch:
+        yield batch
+
+
+def embed_in_batches(
+    texts: Sequence[str],
+    embed_batch: Callable[[List[str]], List[List[float]]],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_batch_chars: int = EMBEDDING_BATCH_MAX_CHARS,
+    max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+) -> List[List[float]]:
+    """Embeds texts in batches with up to ``max_concurrency`` requests in flight.
+
+    ``embed_batch`` receives a list of texts and must return one vector per
+    text. The returned list is in the same order as ``texts``.
+    """
+    vectors = [None] * len(texts)
+    batches = list(make_batches(texts, batch_size, max_batch_chars))
+    if not batches:
+        return vectors
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        futures = {
+            executor.submit(embed_batch, [texts[i] for i in batch]): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            batch_vectors = future.result()
+            if len(batch_vectors) != len(batch):
+                raise ValueError(
+                    f"Embedding batch returned {len(batch_vectors)} vectors for {len(batch)} texts."
+                )
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+    return vectors
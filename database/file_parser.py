@@ -1,3 +1,28 @@
+import ast
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from database.chunker import get_chunk_spans
+
+# The line breaks of Python source, as ``ast`` counts lines.
+LINE_BREAK_PATTERN = re.compile(rb"\r\n|\r|\n")
+
+# Below this many files, parsing in-process beats starting a process pool.
+PARALLEL_PARSE_MIN_FILES = 64
+# Files handed to the process pool at a time, so parsed functions for the
+# whole project never pile up in memory ahead of the consumer.
+PARSE_CHUNK_FILES = 512
+# Number of files whose parsed functions are kept, keyed by content hash.
+FUNCTION_CACHE_MAX_FILES = 4096
+
+_function_cache = OrderedDict()
+_function_cache_lock = threading.Lock()
+
+
 def get_function_name(code):
     assert code.startswith("def ")
     return code[len("def ") : code.index("(")]
@@ -14,11 +39,252 @@ def get_until_no_space(all_lines, i) -> str:
     return "\n".join(ret)
 
 
-def get_functions(filepath):
-    whole_code = open(filepath).read().replace("\r", "\n")
-    all_lines = whole_code.split("\n")
-    for i, l in enumerate(all_lines):
-        if l.startswith("def "):
+def get_line_offsets(source):
+    """Returns the byte offset at which each line of ``source`` starts.
+
+    Lines end in "\\r\\n", "\\r" or "\\n", like the line numbers of ``ast``.
+    """
+    offsets = [0]
+    if b"\r" in source:
+        offsets.extend(match.end() for match in LINE_BREAK_PATTERN.finditer(source))
+        return offsets
+    position = source.find(b"\n")
+    while position != -1:
+        offsets.append(position + 1)
+        position = source.find(b"\n", position + 1)
+    return offsets
+
+
+def decode_code(span):
+    """Turns the bytes of a function's span into the text that is indexed."""
+    code = span.decode("utf-8", errors="replace")
+    return code.replace("\r\n", "\n").replace("\r", "\n").rstrip("\n")
+
+
+def make_function(source, line_offsets, function_name, start_line, end_line):
+    start_byte = line_offsets[start_line - 1]
+    end_byte = line_offsets[end_line] if end_line < len(line_offsets) else len(source)
+    return {
+        "code": decode_code(source[start_byte:end_byte]),
+        "function_name": function_name,
+        "start_line": start_line,
+        "end_line": end_line,
+        "start_byte": start_byte,
+        "end_byte": end_byte,
+    }
+
+
+def extract_functions(source):
+    """Extracts every function and method from Python source bytes.
+
+    Functions are found with ``ast`` in a single pass, including async and
+    decorated definitions and methods at any nesting depth. Each one is
+    named by its dotted path (``Class.method``, ``outer.inner``) and spans
+    whole lines, from its first decorator to its last statement.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return extract_functions_by_indentation(source)
+
+    line_offsets = get_line_offsets(source)
+    functions = []
+    stack = [(node, "") for node in reversed(tree.body)]
+    while stack:
+        node, prefix = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            qualified_name = prefix + node.name
+            if not isinstance(node, ast.ClassDef):
+                start_line = min(
+                    [node.lineno] + [d.lineno for d in node.decorator_list]
+                )
+                functions.append(
+                    make_function(
+                        source,
+                        line_offsets,
+                        qualified_name,
+                        start_line,
+                        node.end_lineno,
+                    )
+                )
+            prefix = qualified_name + "."
+        # Definitions only live in statement bodies, so expressions (and
+        # the lambdas inside them) are not descended into.
+        children = [
+            child
+            for child in ast.iter_child_nodes(node)
+            if not isinstance(child, (ast.expr, ast.expr_context))
+        ]
+        stack.extend((child, prefix) for child in reversed(children))
+
+    return functions
+
+
+def extract_functions_by_indentation(source):
+    """Finds top-level ``def`` blocks by indentation.
+
+    This is the fallback for files ``ast`` cannot parse, such as Python 2
+    code or files with syntax errors.
+    """
+    all_lines = LINE_BREAK_PATTERN.split(source)
+    all_lines = [line.decode("utf-8", errors="replace") for line in all_lines]
+    line_offsets = get_line_offsets(source)
+    functions = []
+    for i, line in enumerate(all_lines):
+        if line.startswith("def ") and "(" in line:
             code = get_until_no_space(all_lines, i)
-            function_name = get_function_name(code)
-            yield {"code": code, "function_name": function_name, "filepath": filepath}
+            end_line = i + code.count("\n") + 1
+            functions.append(
+                make_function(
+                    source, line_offsets, get_function_name(code), i + 1, end_line
+                )
+            )
+    return functions
+
+
+def chunk_function(source, function):
+    """Splits a function too long to embed whole into overlapping chunks.
+
+    Returns a list with the function itself if it fits. Otherwise each
+    chunk is a function of its own, spanning whole lines of the original,
+    with its "chunk_index" and the "parent_start_line" and
+    "parent_end_line" of the whole function.
+    """
+    has_span = function.get("start_byte") is not None
+    if has_span:
+        span = source[function["start_byte"] : function["end_byte"]]
+    else:
+        span = function["code"].encode("utf-8")
+    chunk_spans = get_chunk_spans(span)
+    if chunk_spans is None:
+        return [function]
+
+    start_line = function.get("start_line", 1)
+    end_line = function.get("end_line", start_line + function["code"].count("\n"))
+    chunks = []
+    for chunk_index, (start, end, first_line, last_line) in enumerate(chunk_spans):
+        chunk = {
+            "code": decode_code(span[start:end]),
+            "function_name": function["function_name"],
+            "start_line": start_line + first_line,
+            "end_line": start_line + last_line,
+            "chunk_index": chunk_index,
+            "parent_start_line": start_line,
+            "parent_end_line": end_line,
+        }
+        if has_span:
+            chunk["start_byte"] = function["start_byte"] + start
+            chunk["end_byte"] = function["start_byte"] + end
+        chunks.append(chunk)
+    return chunks
+
+
+def get_functions_from_source(filepath, source, content_hash=None):
+    """Returns the functions in ``source``, parsing each distinct content once.
+
+    Functions too long to embed are returned as chunks, see chunk_function.
+    """
+    content_hash = content_hash or hashlib.sha256(source).hexdigest()
+    with _function_cache_lock:
+        functions = _function_cache.get(content_hash)
+        if functions is not None:
+            _function_cache.move_to_end(content_hash)
+
+    if functions is None:
+        functions = [
+            chunk
+            for function in extract_functions(source)
+            for chunk in chunk_function(source, function)
+        ]
+        cache_functions(content_hash, functions)
+
+    return [dict(function, filepath=filepath) for function in functions]
+
+
+def cache_functions(content_hash, functions):
+    with _function_cache_lock:
+        _function_cache[content_hash] = functions
+        _function_cache.move_to_end(content_hash)
+        while len(_function_cache) > FUNCTION_CACHE_MAX_FILES:
+            _function_cache.popitem(last=False)
+
+
+def clear_function_cache():
+    """Forgets every parsed file, so the next parse of each is a miss."""
+    with _function_cache_lock:
+        _function_cache.clear()
+
+
+def get_functions(filepath):
+    with open(filepath, "rb") as file:
+        source = file.read()
+    return get_functions_from_source(filepath, source)
+
+
+def get_file_fingerprint(filepath):
+    """Returns the mtime and SHA-256 content hash of a file."""
+    mtime = os.stat(filepath).st_mtime
+    with open(filepath, "rb") as file:
+        content_hash = hashlib.sha256(file.read()).hexdigest()
+    return mtime, content_hash
+
+
+def parse_file(filepath):
+    """Returns the fingerprint and the list of functions of a file."""
+    mtime = os.stat(filepath).st_mtime
+    with open(filepath, "rb") as file:
+        source = file.read()
+    content_hash = hashlib.sha256(source).hexdigest()
+    functions = get_functions_from_source(filepath, source, content_hash)
+    return (mtime, content_hash), functions
+
+
+def parse_files(filepaths, max_workers=None):
+    """Parses files on a process pool, returning parse_file results in order."""
+    return list(iter_parse_files(filepaths, max_workers))
+
+
+def iter_parse_files(filepaths, max_workers=None, chunk_files=PARSE_CHUNK_FILES):
+    """Yields parse_file results in order, parsing on a process pool.
+
+    Files are parsed ``chunk_files`` at a time and the next chunk is parsed
+    while the current one is consumed, so at most two chunks of results are
+    held at once. Small batches are parsed in this process, where starting
+    workers would cost more than it saves. Results from workers are added
+    to this process's cache so the same content is not parsed again.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(filepaths) < PARALLEL_PARSE_MIN_FILES:
+        for filepath in filepaths:
+            yield parse_file(filepath)
+        return
+
+    chunks = [
+        filepaths[start : start + chunk_files]
+        for start in range(0, len(filepaths), chunk_files)
+    ]
+    chunksize = max(1, len(chunks[0]) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # executor.map submits a whole chunk up front, which keeps the
+        # workers busy on the next chunk while this one is consumed.
+        next_results = executor.map(parse_file, chunks[0], chunksize=chunksize)
+        for i in range(len(chunks)):
+            results = next_results
+            if i + 1 < len(chunks):
+                next_results = executor.map(
+                    parse_file, chunks[i + 1], chunksize=chunksize
+                )
+            for result in results:
+                (_, content_hash), functions = result
+                cache_functions(
+                    content_hash,
+                    [
+                        {
+                            key: value
+                            for key, value in function.items()
+                            if key != "filepath"
+                        }
+                        for function in functions
+                    ],
+                )
+                yield result
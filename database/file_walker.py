@@ -0,0 +1,214 @@
+import fnmatch
+import os
+import re
+import zlib
+
+# Directory and file names that are never worth indexing.
+DEFAULT_EXCLUDES = (
+    ".git",
+    ".hg",
+    ".svn",
+    ".aidapt",
+    ".chromadb",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+    ".tox",
+    ".nox",
+    ".venv",
+    "venv",
+    "env",
+    "__pycache__",
+    "node_modules",
+    "site-packages",
+    "build",
+    "dist",
+    "*.egg-info",
+)
+
+
+class GitignoreRule:
+    """A single pattern from a .gitignore file, scoped to its directory."""
+
+    __slots__ = ("base", "regex", "negate", "dir_only", "anchored")
+
+    def __init__(self, base, pattern):
+        self.base = base
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # A slash anywhere but the end ties the pattern to the .gitignore's
+        # directory; otherwise it matches a name at any depth.
+        self.anchored = "/" in pattern
+        self.regex = re.compile(translate_gitignore_pattern(pattern.lstrip("/")))
+
+    def matches(self, relative_path, name, is_dir):
+        if self.dir_only and not is_dir:
+            return False
+        if self.anchored:
+            return self.regex.match(relative_path) is not None
+        return self.regex.match(name) is not None
+
+
+def translate_gitignore_pattern(pattern):
+    """Translates a gitignore glob into an anchored regular expression."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(pattern[i])
+                i += 1
+            else:
+                regex += pattern[i : end + 1].replace("[!", "[^")
+                i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            regex += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return f"^{regex}$"
+
+
+def read_gitignore(directory):
+    """Returns the rules of the .gitignore in ``directory``, if there is one."""
+    try:
+        with open(os.path.join(directory, ".gitignore"), errors="ignore") as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return []
+
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        rules.append(GitignoreRule(directory, line))
+    return rules
+
+
+def is_ignored(path, name, is_dir, rules):
+    """Applies gitignore rules in order; the last matching rule wins."""
+    ignored = False
+    for rule in rules:
+        relative_path = os.path.relpath(path, rule.base).replace(os.sep, "/")
+        if rule.matches(relative_path, name, is_dir):
+            ignored = not rule.negate
+    return ignored
+
+
+class PathFilter:
+    """
+    Selects files by gitignore-style patterns relative to a root folder.
+
+    As in a .gitignore, a pattern matches a file when it matches the file
+    or one of its directories: "agents/" selects everything under any
+    agents directory, "tests" anything in or named tests, and
+    "database/*.py" only the modules directly in database.
+
+    Attributes
+    ----------
+    root : str
+        the folder the patterns are relative to
+    include : list
+        the rules of which a file must match one, if there are any
+    exclude : list
+        the rules of which a file must match none
+    """
+
+    __slots__ = ("root", "include", "exclude")
+
+    def __init__(self, root, include=(), exclude=()):
+        self.root = root
+        self.include = [GitignoreRule(root, pattern) for pattern in include]
+        self.exclude = [GitignoreRule(root, pattern) for pattern in exclude]
+
+    def matches(self, path):
+        relative_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+        if self.include and not matches_any(self.include, relative_path):
+            return False
+        return not matches_any(self.exclude, relative_path)
+
+
+def matches_any(rules, relative_path):
+    """Returns whether a rule matches a file or one of its directories."""
+    if not rules:
+        return False
+    names = relative_path.split("/")
+    for depth, name in enumerate(names, start=1):
+        prefix = "/".join(names[:depth])
+        is_dir = depth < len(names)
+        if any(rule.matches(prefix, name, is_dir) for rule in rules):
+            return True
+    return False
+
+
+def get_shard(root, path, n_shards):
+    """Returns the shard of a file among ``n_shards``.
+
+    Files are assigned by a hash of their directory relative to ``root``, so
+    a package stays in one shard and new files land in a fixed shard.
+    """
+    directory = os.path.dirname(os.path.relpath(path, root)).replace(os.sep, "/")
+    return zlib.crc32(directory.encode()) % n_shards
+
+
+def walk_files(root, extensions=(".py",), exclude=DEFAULT_EXCLUDES, use_gitignore=True):
+    """Lists files under ``root`` in a single ``os.scandir`` pass.
+
+    Directories and files whose name matches a pattern in ``exclude`` are
+    skipped without being entered. With ``use_gitignore``, every
+    .gitignore found on the way applies to its own directory and below.
+    """
+    files = []
+    stack = [(root, [])]
+    while stack:
+        directory, parent_rules = stack.pop()
+        rules = parent_rules
+        if use_gitignore:
+            own_rules = read_gitignore(directory)
+            if own_rules:
+                rules = parent_rules + own_rules
+
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            name = entry.name
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude):
+                continue
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if not is_dir and not name.endswith(extensions):
+                continue
+            if rules and is_ignored(entry.path, name, is_dir, rules):
+                continue
+            if is_dir:
+                subdirectories.append((entry.path, rules))
+            elif entry.is_file():
+                files.append(entry.path)
+
+        # Reversed so directories are visited in scandir order.
+        stack.extend(reversed(subdirectories))
+    return files
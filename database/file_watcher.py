@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+from database.file_walker import walk_files
+
+# Seconds between two scans of the project.
+WATCH_INTERVAL_SECONDS = 1.0
+# Seconds without further changes before a burst of changes is indexed.
+WATCH_DEBOUNCE_SECONDS = 0.5
+
+
+class FileWatcher:
+    """
+    Keeps a CodebaseDatabase up to date with its project from a background
+    thread.
+
+    The project is polled every ``interval`` seconds by comparing the mtime
+    and size of every code file with the previous scan, which only costs a
+    stat per file. Changes are collected until ``debounce`` seconds pass
+    without new ones, so a burst of edits is indexed in one refresh, and
+    only the changed paths are handed to CodebaseDatabase.refresh. Callers
+    never wait on that: searches keep answering from the current index
+    until a refresh is applied.
+
+    Attributes
+    ----------
+    database : CodebaseDatabase
+        the database kept up to date
+    interval : float
+        the number of seconds between two scans
+    debounce : float
+        the number of quiet seconds to wait before refreshing
+    save : bool
+        whether to save the database after each refresh
+    on_refresh : callable
+        called with the list of re-indexed files after each refresh
+    refreshes : int
+        the number of refreshes that changed the index
+    last_error : Exception
+        the error raised by the last failed refresh, whose paths are then
+        retried after the next quiet scan
+    """
+
+    def __init__(
+        self,
+        database,
+        interval=WATCH_INTERVAL_SECONDS,
+        debounce=WATCH_DEBOUNCE_SECONDS,
+        save=False,
+        on_refresh=None,
+    ):
+        self.database = database
+        self.interval = interval
+        self.debounce = debounce
+        self.save = save
+        self.on_refresh = on_refresh
+        self.refreshes = 0
+        self.last_error = None
+        self._snapshot = {}
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._last_change = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._snapshot = self.scan()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="aidapt-file-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops watching, indexing any changes that are still pending."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def notify(self, paths):
+        """Marks paths as changed without waiting for the next scan."""
+        with self._pending_lock:
+            self._pending.update(paths)
+            self._last_change = time.monotonic()
+
+    def scan(self):
+        """Returns the (mtime, size) of every code file in the project."""
+        snapshot = {}
+        for path in walk_files(
+            self.database.project_folder,
+            exclude=self.database.exclude,
+            use_gitignore=self.database.use_gitignore,
+        ):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self):
+        """Scans the project and returns the paths that changed since the
+        last scan, including deleted ones."""
+        snapshot = self.scan()
+        changed = {
+            path
+            for path in snapshot.keys() | self._snapshot.keys()
+            if snapshot.get(path) != self._snapshot.get(path)
+        }
+        self._snapshot = snapshot
+        return changed
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            changed = self.poll()
+            if changed:
+                self.notify(changed)
+            elif time.monotonic() - self._last_change >= self.debounce:
+                self.flush()
+        self.notify(self.poll())
+        self.flush()
+
+    def flush(self):
+        """Refreshes the database for the pending paths."""
+        with self._pending_lock:
+            paths, self._pending = sorted(self._pending), set()
+        if not paths:
+            return
+
+        try:
+            changed_files = self.database.refresh(paths)
+            if changed_files and self.save:
+                self.database.save()
+        except Exception as error:
+            self.last_error = error
+            self.notify(paths)
+            return
+
+        if changed_files:
+            self.refreshes += 1
+            if self.on_refresh is not None:
+                self.on_refresh(changed_files)
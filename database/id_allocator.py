@@ -0,0 +1,55 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - depends on the platform
+    fcntl = None
+
+
+class IdAllocator:
+    """
+    Hands out increasing integer IDs, persisted in a file.
+
+    The file holds the next free ID. An allocation takes a thread lock and
+    an exclusive lock on the file, reads it, writes it back advanced by the
+    number of IDs taken and syncs it, so IDs are never handed out twice by
+    any thread or process, nor after a restart. Allocating a batch of IDs
+    costs one such update. Without fcntl (on Windows), only threads of one
+    process are kept apart.
+
+    Attributes
+    ----------
+    path : str
+        the file holding the next free ID
+    get_start : callable
+        returns the first ID when the file does not exist yet or cannot be
+        read, for instance one past the largest ID already in use
+    """
+
+    def __init__(self, path, get_start=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.get_start = get_start
+        self._lock = threading.Lock()
+
+    def allocate(self, count=1):
+        """Returns a range of ``count`` IDs that were never allocated."""
+        with self._lock, open(self.path, "a+") as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            file.seek(0)
+            try:
+                next_id = int(file.read())
+            except ValueError:
+                next_id = self.get_start() if self.get_start is not None else 0
+
+            file.seek(0)
+            file.truncate()
+            file.write(str(next_id + count))
+            file.flush()
+            os.fsync(file.fileno())
+            # Closing the file releases the lock.
+            return range(next_id, next_id + count)
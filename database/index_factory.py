@@ -0,0 +1,389 @@
+import math
+
+import faiss
+import numpy as np
+
+# Corpora up to this size are searched exactly; beyond it an approximate
+# index answers queries in sublinear time.
+FLAT_MAX_VECTORS = 20_000
+# Number of neighbours per node in an HNSW graph.
+HNSW_M = 32
+# Inverted lists probed per IVF query.
+DEFAULT_NPROBE = 16
+# Candidate list size explored per HNSW query.
+DEFAULT_EF_SEARCH = 64
+# FAISS wants at least this many training points per IVF centroid.
+IVF_MIN_POINTS_PER_CENTROID = 39
+IVF_MAX_TRAINING_POINTS_PER_CENTROID = 256
+# Target number of dimensions per product quantizer subspace.
+PQ_DIMENSIONS_PER_SUBQUANTIZER = 16
+
+INDEX_TYPES = ("auto", "flat", "ivf", "hnsw")
+# How vectors are stored in the index. Everything but float32 is lossy and
+# relies on re-ranking candidates against the exact vectors.
+STORAGE_TYPES = ("float32", "float16", "sq8", "pq")
+# Training a product quantizer's 256 centroids per subspace on fewer points
+# than this gives poor codebooks, so smaller corpora fall back to sq8.
+PQ_MIN_TRAINING_VECTORS = IVF_MIN_POINTS_PER_CENTROID * 256
+# Vectors are added to an index this many at a time, so building from a
+# memory-mapped file only ever copies one chunk into memory.
+INDEX_ADD_CHUNK_VECTORS = 65_536
+# An int64 ID plus its entry in the ID-to-vector hash table.
+ID_MEMORY_BYTES = 40
+
+
+def choose_index_type(n_vectors, index_type="auto"):
+    """Resolves "auto" to an index type for a corpus of ``n_vectors``.
+
+    Small corpora get an exact flat index. Larger ones get an IVF index,
+    which keeps search sublinear and, unlike HNSW, supports removing
+    vectors in place when files change.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(
+            f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}."
+        )
+    if index_type != "auto":
+        return index_type
+    return "flat" if n_vectors <= FLAT_MAX_VECTORS else "ivf"
+
+
+def get_nlist(n_vectors):
+    """Returns the number of IVF lists for a corpus of ``n_vectors``."""
+    nlist = int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // IVF_MIN_POINTS_PER_CENTROID))
+
+
+def get_pq_subquantizers(dimension):
+    """Returns the largest divisor of ``dimension`` giving subspaces of at
+    least PQ_DIMENSIONS_PER_SUBQUANTIZER dimensions."""
+    m = max(1, dimension // PQ_DIMENSIONS_PER_SUBQUANTIZER)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def get_codec(storage, n_vectors, dimension):
+    """Returns the index factory codec string for a storage type."""
+    if storage not in STORAGE_TYPES:
+        raise ValueError(
+            f"Unknown storage type {storage!r}, expected one of {STORAGE_TYPES}."
+        )
+    if storage == "pq" and n_vectors < PQ_MIN_TRAINING_VECTORS:
+        storage = "sq8"
+    return {
+        "float32": "Flat",
+        "float16": "SQfp16",
+        "sq8": "SQ8",
+        "pq": f"PQ{get_pq_subquantizers(dimension)}",
+    }[storage]
+
+
+def build_index(
+    vectors,
+    ids,
+    index_type="auto",
+    nprobe=DEFAULT_NPROBE,
+    ef_search=DEFAULT_EF_SEARCH,
+    storage="float32",
+):
+    """Builds an index over ``vectors`` that returns ``ids`` from searches.
+
+    IVF indexes keep the IDs themselves; flat and HNSW indexes are wrapped
+    in an IndexIDMap2. ``storage`` picks how vectors are encoded, see
+    STORAGE_TYPES. ``vectors`` may be a memory-mapped array; it is added
+    to the index in chunks rather than copied whole.
+    """
+    vectors = np.asarray(vectors, dtype="float32")
+    ids = np.asarray(ids, dtype="int64")
+    n_vectors, dimension = vectors.shape
+    index_type = choose_index_type(n_vectors, index_type)
+    codec = get_codec(storage, n_vectors, dimension)
+
+    if index_type == "flat":
+        index = faiss.index_factory(dimension, f"IDMap2,{codec}")
+    elif index_type == "hnsw":
+        graph = f"HNSW{HNSW_M}" if codec == "Flat" else f"HNSW{HNSW_M}_{codec}"
+        index = faiss.index_factory(dimension, f"IDMap2,{graph}")
+    else:
+        nlist = get_nlist(n_vectors)
+        index = faiss.index_factory(dimension, f"IVF{nlist},{codec}")
+        # Lets reconstruct() look vectors up by ID while still allowing
+        # arbitrary IDs and removals.
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+    if not index.is_trained:
+        index.train(sample_training_vectors(vectors, n_vectors))
+
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    for start in range(0, n_vectors, INDEX_ADD_CHUNK_VECTORS):
+        end = start + INDEX_ADD_CHUNK_VECTORS
+        index.add_with_ids(np.ascontiguousarray(vectors[start:end]), ids[start:end])
+    return index
+
+
+def sample_training_vectors(vectors, n_vectors):
+    max_points = max(
+        get_nlist(n_vectors) * IVF_MAX_TRAINING_POINTS_PER_CENTROID,
+        PQ_MIN_TRAINING_VECTORS,
+    )
+    if len(vectors) <= max_points:
+        return vectors
+    rng = np.random.default_rng(0)
+    return vectors[rng.choice(len(vectors), max_points, replace=False)]
+
+
+def get_base_index(index):
+    """Returns the index an IndexIDMap wraps, or the index itself."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def get_index_type(index):
+    base_index = get_base_index(index)
+    if isinstance(base_index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(base_index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def get_storage(index):
+    """Returns the storage type an index encodes its vectors with."""
+    base_index = get_base_index(index)
+    if isinstance(base_index, faiss.IndexHNSW):
+        base_index = faiss.downcast_index(base_index.storage)
+    if isinstance(base_index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(
+        base_index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)
+    ):
+        if base_index.sq.qtype == faiss.ScalarQuantizer.QT_fp16:
+            return "float16"
+        return "sq8"
+    return "float32"
+
+
+def get_bytes_per_vector(index):
+    """Returns the serialized size of the index divided by its vector count.
+
+    This includes codes, IDs, graph links and codebooks, so it is close to
+    what the index occupies in memory.
+    """
+    if index.ntotal == 0:
+        return 0.0
+    return len(faiss.serialize_index(index)) / index.ntotal
+
+
+class IDFilter:
+    """
+    Restricts searches of an index to the vectors with some IDs.
+
+    FAISS checks the selector while it scans, before computing distances,
+    so a filtered search costs no more than an unfiltered one and returns
+    k hits as long as k vectors pass the filter. An IndexPQ takes no
+    selector, so its hits are filtered after the search instead.
+
+    Attributes
+    ----------
+    selector : faiss.IDSelector
+        tests the IDs stored by an IVF index, or the positions of the
+        vectors in the index an IndexIDMap wraps
+    size : int
+        the number of vectors that pass the filter
+    """
+
+    def __init__(self, index, ids):
+        ids = np.ascontiguousarray(ids, dtype="int64")
+        self._mask = None
+        if get_base_index(index) is index:
+            self.size = len(ids)
+            self._selected = ids
+            self.selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+        else:
+            # IndexIDMap does not take search parameters, so the wrapped
+            # index is searched with a bitmap over the positions instead.
+            self._mask = np.isin(get_id_map(index), ids)
+            self.size = int(np.count_nonzero(self._mask))
+            self._selected = np.packbits(self._mask, bitorder="little")
+            self.selector = faiss.IDSelectorBitmap(
+                len(self._mask), faiss.swig_ptr(self._selected)
+            )
+
+    def contains(self, labels):
+        """Returns which of the labels a search of the index returned, IDs
+        or positions as the selector tests them, pass the filter."""
+        if self._mask is None:
+            return np.isin(labels, self._selected)
+        return (labels != -1) & self._mask[np.maximum(labels, 0)]
+
+
+def get_id_map(index):
+    """Returns the IDs of an IndexIDMap by position, without copying them."""
+    return faiss.rev_swig_ptr(index.id_map.data(), index.id_map.size())
+
+
+def get_filtered_search(index, selector, exhaustive=False, nprobe=None):
+    """Returns the index to search and the parameters that apply ``selector``.
+
+    ``nprobe`` overrides the number of lists an IVF index probes. With
+    ``exhaustive``, IVF indexes probe every list and HNSW indexes scan
+    their storage instead of walking the graph, which can dead-end before
+    finding enough of the selected nodes.
+
+    The parameters are None for an IndexPQ, which does not take any, see
+    search_post_filtered.
+    """
+    base_index = get_base_index(index)
+    if isinstance(base_index, faiss.IndexIVF):
+        if exhaustive:
+            nprobe = base_index.nlist
+        nprobe = nprobe or base_index.nprobe
+        return base_index, faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    if isinstance(base_index, faiss.IndexHNSW):
+        if exhaustive:
+            storage = faiss.downcast_index(base_index.storage)
+            if isinstance(storage, faiss.IndexPQ):
+                return storage, None
+            return storage, faiss.SearchParameters(sel=selector)
+        return base_index, faiss.SearchParametersHNSW(
+            sel=selector, efSearch=base_index.hnsw.efSearch
+        )
+    if isinstance(base_index, faiss.IndexPQ):
+        return base_index, None
+    return base_index, faiss.SearchParameters(sel=selector)
+
+
+def search_post_filtered(index, queries, k, id_filter):
+    """Searches an index that does not take search parameters, keeping the
+    first ``k`` hits of each query that pass ``id_filter``.
+
+    More hits than ``k`` are fetched, in proportion to the share of vectors
+    the filter leaves out, and twice as many again until every query has
+    min(k, id_filter.size) hits or the whole index was returned.
+    """
+    n_hits = max(k, 2 * math.ceil(k * index.ntotal / max(id_filter.size, 1)))
+    while True:
+        n_hits = min(n_hits, max(k, index.ntotal))
+        distances, labels = index.search(queries, n_hits)
+        selected = id_filter.contains(labels)
+        enough = np.count_nonzero(selected, axis=1) >= min(k, id_filter.size)
+        if enough.all() or n_hits >= index.ntotal:
+            break
+        n_hits *= 2
+
+    # Selected hits first, each part staying in order of distance.
+    order = np.argsort(~selected, axis=1, kind="stable")[:, :k]
+    selected = np.take_along_axis(selected, order, axis=1)
+    distances = np.where(selected, np.take_along_axis(distances, order, axis=1), np.inf)
+    labels = np.where(selected, np.take_along_axis(labels, order, axis=1), -1)
+    return distances.astype("float32"), labels
+
+
+def search_index(index, queries, k, id_filter=None):
+    """Searches ``index`` like index.search, but only over the vectors that
+    pass ``id_filter`` if one is given.
+
+    Approximate indexes may find fewer than k of those vectors in the lists
+    or graph nodes they visit, so every query gets min(k, id_filter.size)
+    hits by searching the short ones again. IVF indexes probe twice as
+    many lists each time: a filter whose vectors sit in the lists farthest
+    from the query ends up probing every list, which adds up to less than
+    two unfiltered scans of the whole index. HNSW indexes scan their
+    storage instead.
+    """
+    if id_filter is None:
+        return index.search(queries, k)
+
+    searched_index, params = get_filtered_search(index, id_filter.selector)
+    distances, labels = search_with_filter(
+        searched_index, queries, k, params, id_filter
+    )
+    n_wanted = min(k, id_filter.size)
+    short = np.flatnonzero(np.count_nonzero(labels != -1, axis=1) < n_wanted)
+    index_type = get_index_type(index)
+    if index_type == "ivf":
+        base_index = get_base_index(index)
+        nprobe = base_index.nprobe
+        while len(short) and nprobe < base_index.nlist:
+            nprobe = min(2 * nprobe, base_index.nlist)
+            searched_index, params = get_filtered_search(
+                index, id_filter.selector, nprobe=nprobe
+            )
+            distances[short], labels[short] = search_with_filter(
+                searched_index, queries[short], k, params, id_filter
+            )
+            short = short[np.count_nonzero(labels[short] != -1, axis=1) < n_wanted]
+    elif len(short) and index_type == "hnsw":
+        searched_index, params = get_filtered_search(
+            index, id_filter.selector, exhaustive=True
+        )
+        distances[short], labels[short] = search_with_filter(
+            searched_index, queries[short], k, params, id_filter
+        )
+    if get_base_index(index) is not index:
+        id_map = get_id_map(index)
+        labels = np.where(labels == -1, -1, id_map[np.maximum(labels, 0)])
+    return distances, labels
+
+
+def search_with_filter(index, queries, k, params, id_filter):
+    if params is None:
+        return search_post_filtered(index, queries, k, id_filter)
+    return index.search(queries, k, params=params)
+
+
+def get_index_memory(index):
+    """Estimates the bytes an index holds in memory.
+
+    Unlike get_bytes_per_vector this does not serialize the index: it adds
+    up the vector codes, the IDs with their lookup table and HNSW links.
+    """
+    base_index = get_base_index(index)
+    if isinstance(base_index, faiss.IndexHNSW):
+        code_size = faiss.downcast_index(base_index.storage).code_size
+        links = base_index.hnsw.neighbors.size() * 4
+    else:
+        code_size = base_index.code_size
+        links = 0
+    return index.ntotal * (code_size + ID_MEMORY_BYTES) + links
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Sets the IVF nprobe and HNSW efSearch knobs where the index has them."""
+    base_index = get_base_index(index)
+    if nprobe is not None and isinstance(base_index, faiss.IndexIVF):
+        base_index.nprobe = min(nprobe, base_index.nlist)
+    if ef_search is not None and isinstance(base_index, faiss.IndexHNSW):
+        base_index.hnsw.efSearch = ef_search
+
+
+def remove_ids(index, ids, get_vectors=None):
+    """Removes ``ids`` from the index and returns the index to keep using.
+
+    HNSW graphs cannot drop nodes, so those are rebuilt from the remaining
+    vectors instead, which returns None once nothing remains. The vectors
+    come from ``get_vectors(ids)`` when given: rebuilding a lossy index
+    from its own decoded vectors would add to their error on every removal.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    if get_index_type(index) != "hnsw":
+        index.remove_ids(ids)
+        return index
+
+    kept_ids = faiss.vector_to_array(index.id_map)
+    kept_ids = kept_ids[~np.isin(kept_ids, ids)]
+    if len(kept_ids) == 0:
+        return None
+    if get_vectors is not None:
+        vectors = get_vectors(kept_ids)
+    else:
+        vectors = np.vstack([index.reconstruct(int(i)) for i in kept_ids])
+    return build_index(
+        vectors,
+        kept_ids,
+        "hnsw",
+        ef_search=get_base_index(index).hnsw.efSearch,
+        storage=get_storage(index),
+    )
@@ -0,0 +1,133 @@
+import os
+import threading
+from collections import OrderedDict
+
+from database.codebase_database import open_database
+
+# Default bound on the estimated memory of all open indexes.
+DEFAULT_MEMORY_BUDGET_BYTES = 2 * 2**30
+
+
+class IndexRegistry:
+    """
+    Keeps the CodebaseDatabase of several projects open within a memory
+    budget.
+
+    Databases are kept in least-recently-used order. Getting an open one is
+    a dictionary lookup, so switching between recently used projects costs
+    nothing. When the estimated memory of all open databases exceeds the
+    budget, the least recently used ones are saved to their index folder
+    and closed; getting them again loads the saved index instead of
+    rebuilding it. The database just returned is never evicted, even when
+    it alone is over budget.
+
+    Callers should get a database from the registry each time they need it
+    rather than keep a reference, which would keep an evicted database in
+    memory and miss any later reload.
+
+    Attributes
+    ----------
+    memory_budget : int
+        the number of bytes the open databases may hold, as estimated by
+        CodebaseDatabase.estimate_memory
+    database_kwargs : dict
+        the keyword arguments every database is opened with
+    callback : callable
+        receives the progress of the builds of projects without a saved
+        index, like CodebaseDatabase.progress_callback
+    databases : OrderedDict
+        the open databases by project folder, least recently used first
+    evictions : int
+        the number of databases closed to stay within the budget
+    """
+
+    def __init__(
+        self,
+        memory_budget=DEFAULT_MEMORY_BUDGET_BYTES,
+        callback=None,
+        **database_kwargs
+    ):
+        self.memory_budget = memory_budget
+        self.database_kwargs = database_kwargs
+        self.callback = callback
+        self.databases = OrderedDict()
+        self.evictions = 0
+        self.lock = threading.RLock()
+        # One lock per project being opened, so that opening a project
+        # never holds up getting the others.
+        self._opening = {}
+
+    def __contains__(self, project_folder):
+        return self.get_key(project_folder) in self.databases
+
+    def __len__(self):
+        return len(self.databases)
+
+    @staticmethod
+    def get_key(project_folder):
+        return os.path.abspath(project_folder)
+
+    def get(self, project_folder):
+        """Returns the database of a project, opening it if needed."""
+        key = self.get_key(project_folder)
+        with self.lock:
+            database = self.get_open(key)
+            if database is not None:
+                return database
+            opening = self._opening.setdefault(key, threading.Lock())
+
+        with opening:
+            with self.lock:
+                # Another thread may have opened it in the meantime.
+                database = self.get_open(key)
+                if database is not None:
+                    return database
+            database = open_database(key, self.callback, **self.database_kwargs)
+            with self.lock:
+                self.databases[key] = database
+                self._opening.pop(key, None)
+                self.enforce_budget()
+            return database
+
+    def get_open(self, key):
+        """Returns an open database and marks it as most recently used."""
+        database = self.databases.get(key)
+        if database is not None:
+            self.databases.move_to_end(key)
+        return database
+
+    def memory_usage(self):
+        """Returns the estimated bytes held by each open database."""
+        with self.lock:
+            return {
+                key: database.estimate_memory()
+                for key, database in self.databases.items()
+            }
+
+    def enforce_budget(self):
+        """Evicts least recently used databases until the rest fit the
+        budget, always keeping the most recently used one."""
+        with self.lock:
+            usage = self.memory_usage()
+            total = sum(usage.values())
+            for key in list(self.databases)[:-1]:
+                if total <= self.memory_budget:
+                    break
+                self.evict(key)
+                total -= usage[key]
+
+    def evict(self, project_folder):
+        """Saves a database to its index folder and closes it."""
+        with self.lock:
+            database = self.databases.pop(self.get_key(project_folder), None)
+            if database is None:
+                return
+            database.save()
+            self.evictions += 1
+
+    def close(self):
+        """Saves and closes every open database."""
+        with self.lock:
+            while self.databases:
+                _, database = self.databases.popitem(last=False)
+                database.save()
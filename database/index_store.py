@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import shutil
+
+import faiss
+import numpy as np
+
+from database.document_store import DocumentRecord, DocumentStore
+
+# Saved indexes live under this folder, one subfolder per project.
+INDEX_ROOT = ".aidapt/indexes"
+INDEX_FILENAME = "faiss.index"
+DOCUMENTS_FILENAME = "documents.json"
+# An in-progress build keeps its checkpoint in this subfolder: a document
+# table plus the vectors embedded so far, appended to a raw float32 file.
+BUILD_DIRNAME = "build"
+VECTORS_FILENAME = "vectors.f32"
+VECTORS_INFO_FILENAME = "vectors.json"
+# Bump whenever the on-disk layout changes so stale indexes get rebuilt.
+INDEX_FORMAT_VERSION = 6
+
+
+def get_index_dir(project_folder, index_root=INDEX_ROOT):
+    """Returns the folder a project's index is saved to."""
+    project_path = os.path.abspath(project_folder)
+    project_hash = hashlib.sha256(project_path.encode()).hexdigest()
+    return os.path.join(index_root, project_hash[:16])
+
+
+def index_exists(index_dir):
+    return os.path.isfile(os.path.join(index_dir, INDEX_FILENAME)) and os.path.isfile(
+        os.path.join(index_dir, DOCUMENTS_FILENAME)
+    )
+
+
+def write_index(index, index_dir):
+    """Writes a FAISS index atomically, so readers never see a partial file."""
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, INDEX_FILENAME)
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def read_index(index_dir, mmap=False):
+    """Reads a FAISS index, memory-mapping its data when ``mmap`` is set.
+
+    FAISS only memory-maps the inverted lists of IVF indexes: those are
+    read-only and their pages are shared by every process that maps the
+    same file. Flat and HNSW indexes are read onto the heap either way.
+    """
+    path = os.path.join(index_dir, INDEX_FILENAME)
+    if mmap:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(path)
+
+
+def write_documents(index_dir, project_folder, documents, file_states, next_id):
+    """Writes the document table and file states next to the index.
+
+    ``documents`` is a DocumentStore. Its records are written as flat lists
+    that reference the interned filepaths, and code is only written for
+    documents that have no span in a file.
+    """
+    paths = list(documents.paths)
+    path_ids = dict(documents.path_ids)
+
+    def intern(path):
+        if path not in path_ids:
+            path_ids[path] = len(paths)
+            paths.append(path)
+        return path_ids[path]
+
+    records = [
+        [document_id] + [getattr(record, field) for field in DocumentRecord.__slots__]
+        for document_id, record in documents.records.items()
+    ]
+    states = [
+        [intern(path), state["mtime"], state["hash"], state["ids"]]
+        for path, state in file_states.items()
+    ]
+    table = {
+        "version": INDEX_FORMAT_VERSION,
+        "project_folder": os.path.abspath(project_folder),
+        "next_id": next_id,
+        "fields": list(DocumentRecord.__slots__),
+        "paths": paths,
+        "documents": records,
+        "file_states": states,
+    }
+
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, DOCUMENTS_FILENAME)
+    with open(path + ".tmp", "w") as file:
+        json.dump(table, file, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def read_documents(index_dir):
+    """Reads a document table written by write_documents.
+
+    Returns None if the table was written by an incompatible version.
+    """
+    with open(os.path.join(index_dir, DOCUMENTS_FILENAME)) as file:
+        table = json.load(file)
+
+    if (
+        table.get("version") != INDEX_FORMAT_VERSION
+        or tuple(table["fields"]) != DocumentRecord.__slots__
+    ):
+        return None
+
+    paths = table["paths"]
+    documents = DocumentStore()
+    documents.paths = paths
+    documents.path_ids = {path: path_id for path_id, path in enumerate(paths)}
+    documents.records = {
+        record[0]: DocumentRecord(*record[1:]) for record in table["documents"]
+    }
+
+    file_states = {
+        paths[path_id]: {"mtime": mtime, "hash": content_hash, "ids": ids}
+        for path_id, mtime, content_hash, ids in table["file_states"]
+    }
+    return {
+        "project_folder": table["project_folder"],
+        "next_id": table["next_id"],
+        "documents": documents,
+        "file_states": file_states,
+    }
+
+
+def get_build_dir(index_dir):
+    return os.path.join(index_dir, BUILD_DIRNAME)
+
+
+def read_checkpoint(build_dir):
+    """Reads the document table of an interrupted build, if there is one."""
+    if not os.path.isfile(os.path.join(build_dir, DOCUMENTS_FILENAME)):
+        return None
+    return read_documents(build_dir)
+
+
+def remove_checkpoint(build_dir):
+    shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def append_vectors(build_dir, vectors):
+    """Appends vectors to the build's vector file and syncs it to disk."""
+    vectors = np.asarray(vectors, dtype="float32")
+    os.makedirs(build_dir, exist_ok=True)
+    info_path = os.path.join(build_dir, VECTORS_INFO_FILENAME)
+    if not os.path.isfile(info_path):
+        with open(info_path, "w") as file:
+            json.dump({"dimension": vectors.shape[1]}, file)
+    with open(os.path.join(build_dir, VECTORS_FILENAME), "ab") as file:
+        file.write(vectors.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def read_vectors(build_dir, n_vectors):
+    """Memory-maps the first ``n_vectors`` vectors of a build.
+
+    Vectors are appended before the checkpoint that counts them is
+    written, so the file may hold more than ``n_vectors``; the extra ones
+    are cut off. Returns None if the file holds fewer.
+    """
+    info_path = os.path.join(build_dir, VECTORS_INFO_FILENAME)
+    path = os.path.join(build_dir, VECTORS_FILENAME)
+    if not os.path.isfile(info_path) or not os.path.isfile(path):
+        return None
+    with open(info_path) as file:
+        dimension = json.load(file)["dimension"]
+
+    size = n_vectors * dimension * 4
+    if os.path.getsize(path) < size:
+        return None
+    if os.path.getsize(path) > size:
+        os.truncate(path, size)
+    if n_vectors == 0:
+        return np.empty((0, dimension), dtype="float32")
+    return np.memmap(path, dtype="float32", mode="r", shape=(n_vectors, dimension))
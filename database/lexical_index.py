@@ -0,0 +1,249 @@
+import functools
+import heapq
+import keyword
+import math
+import re
+import sys
+from collections import Counter
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# A query made of a single, possibly dotted, identifier such as
+# ``parse_response`` or ``CodebaseDatabase.refresh``.
+PURE_IDENTIFIER_PATTERN = re.compile(
+    r"^\s*[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*\s*$"
+)
+IDENTIFIER_PART_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+# Python keywords and the usual names of the receiver occur in nearly every
+# function, so they are not indexed.
+STOP_IDENTIFIERS = frozenset(keyword.kwlist) | {"self", "cls"}
+# Terms held by more than this share of the documents, and by more than
+# COMMON_TERM_MIN_DOCUMENTS, have the longest postings while barely moving
+# the ranking, so they are not scored.
+COMMON_TERM_SHARE = 0.05
+COMMON_TERM_MIN_DOCUMENTS = 100
+# Standard BM25 term frequency saturation and length normalisation.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# How many times a function's own name counts compared to its body.
+NAME_WEIGHT = 3
+# Rank offset of reciprocal rank fusion; 60 is the value from the paper.
+RRF_K = 60
+
+
+@functools.lru_cache(maxsize=65536)
+def get_identifier_terms(identifier):
+    """Returns the lowercased identifier followed by its words, if several."""
+    parts = split_identifier(identifier)
+    if len(parts) > 1:
+        return (identifier.lower(), *parts)
+    return (identifier.lower(),)
+
+
+def split_identifier(identifier):
+    """Splits snake_case and CamelCase identifiers into lowercase words."""
+    return [part.lower() for part in IDENTIFIER_PART_PATTERN.findall(identifier)]
+
+
+def tokenize(text):
+    """Returns the terms of ``text``: each identifier and, if it has
+    several, its words. Keywords and STOP_IDENTIFIERS are left out."""
+    terms = []
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        if identifier not in STOP_IDENTIFIERS:
+            terms.extend(get_identifier_terms(identifier))
+    return terms
+
+
+def get_scored_terms(terms, n_documents, frequencies):
+    """Returns the terms worth scoring: those in some document but not in
+    too many, see COMMON_TERM_SHARE. If every term is that common, only the
+    rarest one is kept."""
+    max_frequency = max(COMMON_TERM_MIN_DOCUMENTS, COMMON_TERM_SHARE * n_documents)
+    present = [term for term in terms if frequencies.get(term)]
+    scored = [term for term in present if frequencies[term] <= max_frequency]
+    if present and not scored:
+        scored = [min(present, key=lambda term: (frequencies[term], term))]
+    return scored
+
+
+def is_identifier_query(query):
+    return PURE_IDENTIFIER_PATTERN.match(query) is not None
+
+
+def add_term_stats(all_stats):
+    """Sums the term statistics of several lexical indexes, see
+    LexicalIndex.get_term_stats.
+
+    Scoring with the sums ranks the documents of each index as one index
+    holding all of them would.
+    """
+    n_documents = 0
+    total_length = 0
+    frequencies = Counter()
+    for stats in all_stats:
+        n_documents += stats[0]
+        total_length += stats[1]
+        frequencies.update(stats[2])
+    return n_documents, total_length, dict(frequencies)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuses ranked lists of IDs into (score, ID) pairs, best first.
+
+    Each ID scores the sum of 1 / (k + rank) over the lists it appears in.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, document_id in enumerate(ranking, start=1):
+            scores[document_id] = scores.get(document_id, 0.0) + 1.0 / (k + rank)
+    return sorted(
+        ((score, document_id) for document_id, score in scores.items()),
+        key=lambda hit: -hit[0],
+    )
+
+
+class LexicalIndex:
+    """
+    A BM25 inverted index over function names, identifiers and docstrings.
+
+    Every identifier in a function is indexed both whole and split into its
+    words, so ``parse_response`` matches the identifier itself as well as
+    "parse the response". Function names are also kept in an exact-match
+    table, which answers pure identifier queries without scoring.
+
+    Attributes
+    ----------
+    postings : dict
+        the term frequency of each term in each document, by term
+    document_lengths : dict
+        the number of terms in each document
+    names : dict
+        the IDs of the documents with each lowercased function name, indexed
+        under both the qualified name and its last component
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.document_lengths = {}
+        self.document_terms = {}
+        self.document_names = {}
+        self.names = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.document_lengths)
+
+    def __contains__(self, document_id):
+        return document_id in self.document_lengths
+
+    def add(self, document_id, document):
+        """Indexes a document dict with at least "code" and "function_name"."""
+        if document_id in self:
+            self.remove(document_id)
+
+        function_name = document.get("function_name") or ""
+        terms = tokenize(document.get("code") or "")
+        terms.extend(tokenize(function_name) * NAME_WEIGHT)
+        counts = Counter(terms)
+        for term, count in counts.items():
+            self.postings.setdefault(sys.intern(term), {})[document_id] = count
+        self.document_terms[document_id] = tuple(counts)
+        self.document_lengths[document_id] = len(terms)
+        self.total_length += len(terms)
+
+        self.document_names[document_id] = self.get_name_keys(function_name)
+        for name in self.document_names[document_id]:
+            self.names.setdefault(name, set()).add(document_id)
+
+    def remove(self, document_id):
+        if document_id not in self:
+            return
+        for term in self.document_terms.pop(document_id):
+            postings = self.postings[term]
+            del postings[document_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.document_lengths.pop(document_id)
+
+        for name in self.document_names.pop(document_id):
+            ids = self.names[name]
+            ids.discard(document_id)
+            if not ids:
+                del self.names[name]
+
+    @staticmethod
+    def get_name_keys(function_name):
+        function_name = function_name.lower()
+        return {function_name, function_name.rsplit(".", 1)[-1]} - {""}
+
+    def find_name(self, name):
+        """Returns the IDs of the functions named exactly ``name``."""
+        ids = set()
+        for key in self.get_name_keys(name.strip()):
+            ids |= self.names.get(key, set())
+        return ids
+
+    def get_term_stats(self, terms):
+        """Returns the number of documents, their total length and the
+        number of documents holding each of ``terms``, which BM25 scores
+        are computed from."""
+        return (
+            len(self.document_lengths),
+            self.total_length,
+            {term: len(self.postings.get(term, ())) for term in terms},
+        )
+
+    def search(self, query, k=5, allowed=None, stats=None):
+        """Returns up to ``k`` (BM25 score, ID) hits, best first.
+
+        If ``allowed`` is given, only documents whose ID is in it are hits.
+        ``stats`` replaces the index's own term statistics, for instance
+        with those of every shard of a project from add_term_stats.
+        """
+        return self.score_terms(set(tokenize(query)), k, allowed, stats)
+
+    def score_terms(self, terms, k, allowed=None, stats=None):
+        if not self.document_lengths:
+            return []
+        n_documents, total_length, frequencies = stats or self.get_term_stats(terms)
+        average_length = total_length / n_documents
+
+        scores = {}
+        for term in get_scored_terms(terms, n_documents, frequencies):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            frequency = frequencies[term]
+            idf = math.log(1 + (n_documents - frequency + 0.5) / (frequency + 0.5))
+            for document_id, count in postings.items():
+                if allowed is not None and document_id not in allowed:
+                    continue
+                length = self.document_lengths[document_id] / average_length
+                saturation = BM25_K1 * (1 - BM25_B + BM25_B * length)
+                tf = count * (BM25_K1 + 1) / (count + saturation)
+                scores[document_id] = scores.get(document_id, 0.0) + idf * tf
+        return heapq.nlargest(
+            k, ((score, document_id) for document_id, score in scores.items())
+        )
+
+    def search_identifier(self, query, k=5, allowed=None, stats=None):
+        """Searches for an identifier, ranking functions with that exact name
+        first and the other functions that use it after them.
+
+        Only the whole identifier is looked up, not its words, so this only
+        touches the few postings of that identifier. Returns no hits when it
+        does not occur anywhere.
+        """
+        exact = self.find_name(query)
+        if allowed is not None:
+            exact = {document_id for document_id in exact if document_id in allowed}
+        terms = {
+            term.lower()
+            for term in IDENTIFIER_PATTERN.findall(query)
+            if term not in STOP_IDENTIFIERS
+        }
+        hits = self.score_terms(terms, k + len(exact), allowed, stats)
+        found = {document_id for _, document_id in hits}
+        hits.extend((0.0, document_id) for document_id in exact - found)
+        hits.sort(key=lambda hit: (hit[1] not in exact, -hit[0]))
+        return hits[:k]
@@ -1,19 +1,106 @@
+import copy
 import hashlib
 import json
 import os
+import threading
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional
 
 import chromadb
 from chromadb.config import Settings
+from chromadb.utils import embedding_functions
 from dotenv import load_dotenv
 
+from database.embedding_cache import CachedEmbeddingFunction, get_query_embedding_cache
+from database.id_allocator import IdAllocator
+
 # Load the variables from the .env file
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 COLLECTION_NAME = "memory_collection"
+CHROMA_DIRECTORY = ".chromadb/"
+# Kept in the Chroma directory, holds the next free memory ID.
+ID_ALLOCATOR_FILENAME = "next_memory_id"
+# Metadata key grouping memories that are deleted together.
+NAMESPACE_KEY = "namespace"
+# The number of query results kept by a MemoryDatabase.
+QUERY_RESULT_CACHE_MAX_ENTRIES = 128
 
 embed_model = "text-embedding-ada-002"
+# Chroma's default embedding model, used to key the memory embedding cache.
+MEMORY_EMBED_MODEL = "all-MiniLM-L6-v2"
+
+
+class FilePathIndex:
+    """The memory ID of each file path, and the file path of each memory."""
+
+    def __init__(self):
+        self.ids = {}
+        self.paths = {}
+
+    def add(self, memory_id: str, metadata: Optional[Dict[str, Any]]):
+        """Indexes a memory under the "file_path" of its metadata, if any."""
+        self.remove(memory_id)
+        file_path = (metadata or {}).get("file_path")
+        if file_path is not None:
+            self.ids[file_path] = memory_id
+            self.paths[memory_id] = file_path
+
+    def remove(self, memory_id: str):
+        file_path = self.paths.pop(memory_id, None)
+        if file_path is not None and self.ids.get(file_path) == memory_id:
+            del self.ids[file_path]
+
+    def get(self, file_path: str) -> Optional[str]:
+        return self.ids.get(file_path)
+
+
+class QueryResultCache:
+    """
+    A bounded LRU cache of query results, each tagged with the write
+    generation of the database it was read at.
+
+    An entry only answers lookups made at the same generation, so any write
+    to the database makes every earlier result stale.
+
+    Attributes
+    ----------
+    max_entries : int
+        the maximum number of cached results
+    hits : int
+        the number of lookups answered from the cache
+    misses : int
+        the number of lookups that found no result, or a stale one
+    """
+
+    def __init__(self, max_entries: int = QUERY_RESULT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, generation: int):
+        """Returns the result cached for ``key`` at ``generation``, or None."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != generation:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, generation: int, result):
+        self._entries[key] = (generation, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
 
 
 class MemoryDatabase:
@@ -28,13 +115,33 @@ class MemoryDatabase:
         the Chroma client object
     collection : chromadb.Collection
         the Chroma collection object
+    embedding_function : CachedEmbeddingFunction
+        Chroma's embedding function, read through the on-disk embedding cache
+    id_allocator : IdAllocator
+        hands out the IDs of new memories from a file in the Chroma directory
+    file_index : FilePathIndex
+        the ID of the memory of each file path, loaded from the collection on
+        first use and then kept up to date by every write through this object
+    pending_writes : dict
+        the writes not yet applied to the collection, by memory ID: a
+        (document, metadata) pair to upsert, either of which may be None to
+        keep the stored one, or None to delete the memory
+    generation : int
+        the number of writes made through this object, which tags the
+        results in query_cache
+    query_cache : QueryResultCache
+        the results of recent queries, by query text and ``top_k``
 
     Methods
     -------
     close():
         Deletes the Chroma collection.
+    flush():
+        Applies the buffered writes to the collection.
     get_next_id() -> str:
         Generates a new unique integer ID.
+    allocate_ids(count: int) -> List[str]:
+        Generates ``count`` new unique integer IDs.
     store_memories(memories: List[dict]):
         Stores the given memories in the collection.
     stringify_content(content) -> str:
@@ -47,6 +154,10 @@ class MemoryDatabase:
         Deletes a memory from the collection.
     clear_all_memories():
         Deletes all memories from the collection.
+    delete_memories_where(where: Dict[str, Any]):
+        Deletes the memories whose metadata matches a Chroma filter.
+    delete_namespace(namespace: str):
+        Deletes the memories whose metadata has the given namespace.
     query_relevant_memories(task: str, message: str, threshold: float = 0.7, top_k: int = 5) -> List[str]:
         Queries the collection for memories relevant to the given task and message.
     add_file_memory(file_path: str, content: str, metadata: Optional[Dict[str, Any]] = None):
@@ -55,42 +166,166 @@ class MemoryDatabase:
         Fetches a memory from the collection by ID.
     """
 
-    def __init__(self):
-        """Initializes a new MemoryDatabase object."""
+    def __init__(self, persist_directory=CHROMA_DIRECTORY, embedding_function=None):
+        """Initializes a new MemoryDatabase object.
+
+        ``embedding_function`` defaults to Chroma's default embedding model.
+        """
         client_settings = Settings(
             chroma_db_impl="duckdb+parquet",
-            persist_directory=".chromadb/",
+            persist_directory=persist_directory,
         )
         self.client = chromadb.Client(client_settings)
-        self.collection = self.client.get_or_create_collection(
-            name=COLLECTION_NAME, metadata={"hnsw:space": "cosine"}
+        self.embedding_function = CachedEmbeddingFunction(
+            embedding_function or embedding_functions.DefaultEmbeddingFunction(),
+            MEMORY_EMBED_MODEL,
+        )
+        self.collection = self.open_collection()
+
+        self.id_allocator = IdAllocator(
+            os.path.join(persist_directory, ID_ALLOCATOR_FILENAME),
+            get_start=self.get_first_free_id,
+        )
+        # None until the first file lookup.
+        self.file_index = None
+
+        self.pending_writes = {}
+        self.pending_lock = threading.RLock()
+        self.generation = 0
+        self.query_cache = QueryResultCache()
+
+    def open_collection(self):
+        """Gets or creates the memory collection."""
+        collection = self.client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            metadata={"hnsw:space": "cosine"},
+            embedding_function=self.embedding_function,
         )
 
         # Try inserting a dummy document to trigger index creation
-        self.collection.upsert(
+        collection.upsert(
             documents=["dummy document"],
             metadatas=[{"dummy": "metadata"}],
             ids=["dummy_id"],
         )
-        self.collection.delete(ids=["dummy_id"])  # remove the dummy document
+        collection.delete(ids=["dummy_id"])  # remove the dummy document
+        return collection
 
     def close(self):
         """Deletes the Chroma collection."""
+        with self.pending_lock:
+            self.pending_writes = {}
+            self.generation += 1
         self.client.delete_collection(name=COLLECTION_NAME)
+        self.file_index = None
+
+    def buffer_write(self, memory_id: str, document=None, metadata=None):
+        """Queues an upsert of ``memory_id`` for the next flush, merged into
+        the write already queued for it."""
+        with self.pending_lock:
+            self.generation += 1
+            previous = self.pending_writes.get(memory_id, (None, None))
+            if previous is None:
+                # A partial write of a deleted memory must not keep its
+                # stored document or metadata.
+                if document is None or metadata is None:
+                    self.flush()
+                previous = (None, None)
+            self.pending_writes[memory_id] = (
+                document if document is not None else previous[0],
+                metadata if metadata is not None else previous[1],
+            )
+
+    def flush(self):
+        """Applies the buffered writes to the collection.
+
+        Writes are buffered by every method that changes memories, keeping
+        only the last one for each ID, and flushed before any read and at the
+        end of an agent turn. A flush makes one delete, one embedding request
+        for all the new documents and a few upserts, however many writes were
+        buffered. If any of these fails, the writes stay buffered for the
+        next flush.
+        """
+        with self.pending_lock:
+            writes = self.pending_writes
+            if not writes:
+                return
+
+            deleted = [
+                memory_id for memory_id, write in writes.items() if write is None
+            ]
+            if deleted:
+                self.collection.delete(ids=deleted)
+
+            upserts = {i: write for i, write in writes.items() if write is not None}
+            documents = {i: doc for i, (doc, _) in upserts.items() if doc is not None}
+            embeddings = dict(
+                zip(documents, self.embedding_function(list(documents.values())))
+                if documents
+                else ()
+            )
+            # Writes without a metadata keep the stored one.
+            for has_metadata in (True, False):
+                ids = [
+                    i for i in documents if (upserts[i][1] is not None) == has_metadata
+                ]
+                if ids:
+                    self.collection.upsert(
+                        ids=ids,
+                        documents=[documents[i] for i in ids],
+                        embeddings=[embeddings[i] for i in ids],
+                        metadatas=[upserts[i][1] for i in ids]
+                        if has_metadata
+                        else None,
+                    )
+
+            # Chroma only upserts with a document. An update keeps the stored
+            # one, but fails for IDs that do not exist.
+            metadata_only = [i for i in upserts if i not in documents]
+            if metadata_only:
+                stored = self.collection.get(ids=metadata_only, include=[])["ids"]
+                if stored:
+                    self.collection.update(
+                        ids=stored, metadatas=[upserts[i][1] for i in stored]
+                    )
+            self.pending_writes = {}
 
     def get_next_id(self) -> str:
         """Generates a new unique integer ID."""
-        ids = [str(idx) for idx, doc in enumerate(self.collection.peek()["documents"])]
-        max_int_id = max(int(id) for id in ids if id.isdigit())
-        return str(max_int_id + 1)
+        return self.allocate_ids(1)[0]
+
+    def allocate_ids(self, count: int) -> List[str]:
+        """Generates ``count`` new unique integer IDs without reading the
+        collection."""
+        if count == 0:
+            return []
+        return [str(memory_id) for memory_id in self.id_allocator.allocate(count)]
+
+    def get_first_free_id(self) -> int:
+        """Returns one past the largest integer ID of a memory other than a
+        file memory, whose IDs are hashes. ID 0 holds the task list.
+
+        Only read when the ID allocator's file is missing.
+        """
+        self.flush()
+        memories = self.collection.get(include=["metadatas"])
+        memory_ids = [
+            int(memory_id)
+            for memory_id, metadata in zip(memories["ids"], memories["metadatas"])
+            if memory_id.isdigit() and "file_path" not in (metadata or {})
+        ]
+        return max(memory_ids, default=0) + 1
 
     def store_memories(self, memories: List[dict]):
-        """Stores the given memories in the collection."""
+        """Stores the given memories in the collection on the next flush."""
 
         # Prepare the data for adding to the collection
         documents = []
         metadatas = []
         ids = []
+        new_ids = iter(
+            self.allocate_ids(sum("id" not in memory for memory in memories))
+        )
 
         for memory in memories:
             # Create a copy of the metadata and add the content
@@ -101,16 +336,17 @@ class MemoryDatabase:
             documents.append(memory["content"])
             metadatas.append(metadata)
 
-            # If an ID is provided, append it to the IDs list
-            if "id" in memory:
-                ids.append(memory["id"])
+            # Memories without an ID get a new one
+            ids.append(memory["id"] if "id" in memory else next(new_ids))
 
-        # Add the data to the collection
-        self.collection.upsert(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids if ids else None,
-        )
+        # Add the data to the collection, replacing earlier pending writes
+        with self.pending_lock:
+            self.generation += 1
+            for memory_id, document, metadata in zip(ids, documents, metadatas):
+                self.pending_writes[memory_id] = (document, metadata)
+        if self.file_index is not None:
+            for memory_id, metadata in zip(ids, metadatas):
+                self.file_index.add(memory_id, metadata)
 
     def stringify_content(self, content):
         """Converts the given content into a string."""
@@ -128,73 +364,85 @@ class MemoryDatabase:
     def query_memories(
         self, query: str = None, id: str = None, top_k: int = 5
     ) -> List[dict]:
-        """Queries the collection and returns the results."""
-
-        if self.collection.count() < top_k:
-            top_k = self.collection.count()
+        """Queries the collection and returns the results.
 
+        Query results are cached by the query and ``top_k`` until the next
+        write through this object, so repeating a query between writes does
+        not read the collection.
+        """
         if query is not None:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=top_k,
-                include=["documents", "metadatas"],
-            )
+            key = (query, top_k)
+            results = self.query_cache.get(key, self.generation)
+            if results is None:
+                self.flush()
+                generation = self.generation
+                query_embeddings = get_query_embedding_cache().get_or_embed(
+                    [query], self.embedding_function, MEMORY_EMBED_MODEL
+                )
+                results = self.collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=min(top_k, self.collection.count()),
+                    include=["documents", "metadatas"],
+                )
+                self.query_cache.put(key, generation, results)
+            # Callers may change the results they get.
+            return copy.deepcopy(results)
         elif id is not None:
-            results = self.collection.get(ids=[id], include=["documents", "metadatas"])
+            self.flush()
+            return self.collection.get(ids=[id], include=["documents", "metadatas"])
         else:
             raise ValueError("You must provide either 'query' or 'id'.")
 
-        return results
-
     def update_memory(
         self,
         memory_id: str,
         new_content: Optional[str] = None,
         new_metadata: Optional[Dict[str, Any]] = None,
     ):
-        """Updates a memory in the collection."""
-        update_data = {}
-
-        if new_content:
-            update_data["documents"] = [new_content]
-
-        if new_metadata:
-            update_data["metadatas"] = [new_metadata]
-
+        """Updates a memory in the collection on the next flush."""
         if new_content or new_metadata:
-            self.collection.upsert(
-                ids=[memory_id],
-                metadatas=update_data.get("metadatas"),
-                documents=update_data.get("documents"),
-            )
+            self.buffer_write(memory_id, new_content or None, new_metadata or None)
+        if new_metadata and self.file_index is not None:
+            self.file_index.add(memory_id, new_metadata)
 
     def delete_memory(self, memory_id: str):
-        """Deletes a memory from the collection."""
-        try:
-            result = self.collection.delete(ids=[memory_id])
-
-            if not result:
-                return f"No memories were deleted. Check if memory with id {memory_id} exists."
-
-            return f"Successfully deleted memory with id: {memory_id}"
-
-        except Exception as e:
-            return f"Error in delete_memory: {str(e)}"
+        """Deletes a memory from the collection on the next flush."""
+        with self.pending_lock:
+            self.generation += 1
+            self.pending_writes[memory_id] = None
+        if self.file_index is not None:
+            self.file_index.remove(memory_id)
+        return f"Successfully deleted memory with id: {memory_id}"
 
     def clear_all_memories(self):
-        """Deletes all memories from the collection."""
-        count = self.collection.count()
-
-        while count > 0:
-            # Peek at up to 10 items in the collection
-            items = self.collection.peek()
-
-            # Extract the ids and delete the items
-            ids = items["ids"]
-            self.collection.delete(ids=ids)
+        """Deletes all memories from the collection.
 
-            # Update the count
-            count = self.collection.count()
+        The collection is dropped and created again, which takes the same
+        time however many memories it holds. IDs keep counting from where
+        they were, so memories deleted here are never confused with new
+        ones.
+        """
+        with self.pending_lock:
+            self.pending_writes = {}
+            self.generation += 1
+        self.client.delete_collection(name=COLLECTION_NAME)
+        self.collection = self.open_collection()
+        self.file_index = FilePathIndex()
+
+    def delete_memories_where(self, where: Dict[str, Any]):
+        """Deletes the memories whose metadata matches a Chroma ``where``
+        filter, in a single operation."""
+        with self.pending_lock:
+            self.flush()
+            self.collection.delete(where=where)
+            self.generation += 1
+        # Reloaded on the next file lookup.
+        self.file_index = None
+
+    def delete_namespace(self, namespace: str):
+        """Deletes the memories stored with ``namespace`` under the
+        "namespace" key of their metadata."""
+        self.delete_memories_where({NAMESPACE_KEY: namespace})
 
     def query_relevant_memories(
         self, task: str, message: str, top_k: int = 5
@@ -211,9 +459,6 @@ class MemoryDatabase:
         Returns:
             List[str]: The list of relevant memories.
         """
-        if self.collection.count() < top_k:
-            top_k = self.collection.count()
-
         query = f"{task} {message}"
         results = self.query_memories(query, top_k=top_k)
 
@@ -260,25 +505,34 @@ class MemoryDatabase:
 
         # If the ID was found, get the file data using the ID
         if file_id:
+            self.flush()
             return self.collection.get(ids=[file_id])
 
         # If no ID was found, return an empty list
         return []
 
     def get_id_from_filepath(self, file_path: str) -> str:
-        all_documents = self.collection.get()
-
-        # Get the list of metadatas from the dictionary
-        metadatas = all_documents["metadatas"]
-        ids = all_documents["ids"]
+        """Returns the ID of the memory of a file, or None if there is none.
 
-        # Iterate over the metadatas list
-        for i, metadata in enumerate(metadatas):
-            if isinstance(metadata, dict) and "file_path" in metadata:
-                if metadata["file_path"] == file_path:
-                    return ids[i]
-
-        return None
+        Answered from the file index without reading the collection.
+        """
+        return self.get_file_index().get(file_path)
+
+    def get_file_index(self) -> FilePathIndex:
+        """Returns the file index, loading it on first use."""
+        if self.file_index is None:
+            self.flush()
+            # The filter leaves out memories without a file path in Chroma.
+            file_memories = self.collection.get(
+                where={"file_path": {"$ne": ""}}, include=["metadatas"]
+            )
+            file_index = FilePathIndex()
+            for memory_id, metadata in zip(
+                file_memories["ids"], file_memories["metadatas"]
+            ):
+                file_index.add(memory_id, metadata)
+            self.file_index = file_index
+        return self.file_index
 
 
 def main():
@@ -317,6 +571,7 @@ def main():
         {"id": "2", "content": "This is another memory.", "metadata": {"tag": "test"}},
     ]
     memory_db.store_memories(memories)
+    memory_db.flush()
     pretty_print_memory(memory_db.collection.peek())
     print("\n")
 
@@ -333,12 +588,14 @@ def main():
         new_content="This is an updated memory.",
         new_metadata={"tag": "updated"},
     )
+    memory_db.flush()
     pretty_print_memory(memory_db.collection.peek())
     print("\n")
 
     # Delete a memory
     print("Deleting a memory:")
     memory_db.delete_memory(memory_id="1")
+    memory_db.flush()
     pretty_print_memory(memory_db.collection.peek())
     print("\n")
 
@@ -351,6 +608,7 @@ def main():
     # Add file memory
     print("Adding file memory:")
     memory_db.add_file_memory(file_path="file.txt", content="This is file content.")
+    memory_db.flush()
     pretty_print_memory(memory_db.collection.peek())
     print("\n")
 
@@ -0,0 +1,307 @@
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from database.codebase_database import (
+    CodebaseDatabase,
+    fuse_search_hits,
+    get_query_embeddings,
+)
+from database.embedding_cache import get_embedding_cache, reopen_embedding_cache
+from database.file_walker import DEFAULT_EXCLUDES, walk_files
+from database.index_store import get_index_dir
+from database.lexical_index import add_term_stats
+
+
+def get_shard_dir(index_dir, shard, n_shards):
+    return os.path.join(index_dir, f"shard_{shard}_of_{n_shards}")
+
+
+def merge_identifier_hits(shard_hits, k):
+    """Merges the identifier hits of one query on every shard into the
+    ``k`` best, IDs becoming (shard, ID) pairs.
+
+    Returns None if no shard could answer the query.
+    """
+    identifier = []
+    exact = set()
+    for shard, hits in enumerate(shard_hits):
+        if hits and "identifier" in hits:
+            identifier.extend((score, (shard, i)) for score, i in hits["identifier"])
+            exact.update((shard, i) for i in hits["exact"])
+    if not identifier:
+        return None
+    identifier.sort(key=lambda hit: (hit[1] not in exact, -hit[0]))
+    return {"identifier": identifier[:k], "exact": exact}
+
+
+def merge_embedded_hits(shard_hits, n_candidates):
+    """Merges the FAISS and BM25 hits of one query on every shard into the
+    ``n_candidates`` best of each, IDs becoming (shard, ID) pairs."""
+    merged = {
+        "vector": heapq.nsmallest(
+            n_candidates,
+            (
+                (distance, (shard, i))
+                for shard, hits in enumerate(shard_hits)
+                for distance, i in hits["vector"]
+            ),
+            key=lambda hit: hit[0],
+        )
+    }
+    if any("lexical" in hits for hits in shard_hits):
+        merged["lexical"] = heapq.nlargest(
+            n_candidates,
+            (
+                (score, (shard, i))
+                for shard, hits in enumerate(shard_hits)
+                for score, i in hits.get("lexical", ())
+            ),
+            key=lambda hit: hit[0],
+        )
+    return merged
+
+
+def build_shard(project_folder, shard, n_shards, index_dir, cache_path, kwargs):
+    """Builds and saves one shard in a worker process."""
+    reopen_embedding_cache(cache_path)
+    database = CodebaseDatabase(
+        project_folder,
+        index_dir=get_shard_dir(index_dir, shard, n_shards),
+        shard=(shard, n_shards),
+        checkpoint=True,
+        **kwargs,
+    )
+    return database.timings
+
+
+class ShardedCodebaseDatabase:
+    """
+    A codebase index split into shards that build and search in parallel.
+
+    Every shard is a CodebaseDatabase over the files get_shard assigns to
+    it, saved in its own folder under ``index_dir``. Shards are built in
+    worker processes, each parsing and embedding its own files, and then
+    loaded memory-mapped. Queries are embedded once and searched on every
+    shard from a thread pool, which runs the FAISS searches in parallel as
+    FAISS releases the GIL, and the per-shard results are merged into a
+    global top k.
+
+    Search results, refresh, save and estimate_memory work as for a single
+    CodebaseDatabase, so a FileWatcher can keep a sharded index up to date.
+
+    Attributes
+    ----------
+    project_folder : str
+        the folder of the project
+    n_shards : int
+        the number of shards the project is split into
+    index_dir : str
+        the folder holding one index folder per shard
+    max_workers : int
+        the number of worker processes building shards
+    shards : list
+        the CodebaseDatabase of each shard
+    """
+
+    def __init__(
+        self,
+        project_folder,
+        n_shards=None,
+        index_dir=None,
+        max_workers=None,
+        exclude=DEFAULT_EXCLUDES,
+        use_gitignore=True,
+        progress_callback=None,
+        build=True,
+        **database_kwargs,
+    ):
+        self.project_folder = project_folder
+        self.n_shards = n_shards or os.cpu_count() or 1
+        self.index_dir = index_dir or get_index_dir(project_folder)
+        self.max_workers = min(max_workers or os.cpu_count() or 1, self.n_shards)
+        self.exclude = exclude
+        self.use_gitignore = use_gitignore
+        self.progress_callback = progress_callback
+        # Each shard already has a process of its own, so their file
+        # parsing does not start further pools.
+        database_kwargs.setdefault("parse_workers", 1)
+        self.database_kwargs = dict(
+            database_kwargs, exclude=exclude, use_gitignore=use_gitignore
+        )
+        self.shards = []
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.n_shards, thread_name_prefix="aidapt-shard"
+        )
+        if build:
+            self.build()
+
+    @classmethod
+    def load(cls, project_folder, n_shards=None, **kwargs):
+        """Opens the saved shards of a project.
+
+        Shards without a saved index open empty and pick up their files on
+        the next refresh. Returns None if no shard has a saved index.
+        """
+        database = cls(project_folder, n_shards, build=False, **kwargs)
+        database.shards = [database.load_shard(i) for i in range(database.n_shards)]
+        if all(shard.faiss_index is None for shard in database.shards):
+            return None
+        return database
+
+    def load_shard(self, shard):
+        kwargs = dict(
+            self.database_kwargs,
+            index_dir=get_shard_dir(self.index_dir, shard, self.n_shards),
+            shard=(shard, self.n_shards),
+        )
+        database = CodebaseDatabase.load(self.project_folder, mmap=True, **kwargs)
+        if database is None:
+            database = CodebaseDatabase(self.project_folder, build=False, **kwargs)
+        return database
+
+    def build(self):
+        """Builds every shard in a worker process and loads the results."""
+        start = time.perf_counter()
+        cache_path = get_embedding_cache().path
+        self.report_progress(0, start)
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(
+                    build_shard,
+                    self.project_folder,
+                    shard,
+                    self.n_shards,
+                    self.index_dir,
+                    cache_path,
+                    self.database_kwargs,
+                )
+                for shard in range(self.n_shards)
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                self.report_progress(done, start)
+        self.shards = [self.load_shard(i) for i in range(self.n_shards)]
+
+    def report_progress(self, done, start):
+        """Sends the number of shards built, like report_progress of
+        CodebaseDatabase."""
+        if self.progress_callback is None:
+            return
+        elapsed = time.perf_counter() - start
+        self.progress_callback(
+            "progress",
+            {
+                "stage": "shards",
+                "done": done,
+                "total": self.n_shards,
+                "elapsed": elapsed,
+                "eta": elapsed / done * (self.n_shards - done) if done else None,
+            },
+        )
+
+    def list_code_files(self):
+        return walk_files(
+            self.project_folder,
+            exclude=self.exclude,
+            use_gitignore=self.use_gitignore,
+        )
+
+    def refresh(self, paths=None):
+        """Re-indexes the files that changed, each in its own shard.
+
+        Returns the files that were re-indexed or dropped.
+        """
+        if paths is None:
+            paths = set(self.list_code_files())
+            for shard in self.shards:
+                paths.update(shard.file_states)
+        paths = list(paths)
+        changed_files = []
+        for shard_changes in self.executor.map(
+            lambda shard: shard.refresh(paths), self.shards
+        ):
+            changed_files.extend(shard_changes)
+        return changed_files
+
+    def save(self):
+        for shard in self.shards:
+            shard.save()
+
+    def estimate_memory(self):
+        return sum(shard.estimate_memory() for shard in self.shards)
+
+    def search_faiss_index(self, query, k=5, include=None, exclude=None):
+        """Returns the ``k`` most relevant results across all shards, in the
+        format of CodebaseDatabase.search_faiss_index."""
+        return self.search_many([query], k, include, exclude)[0]
+
+    def search_many(self, queries, k=5, include=None, exclude=None):
+        """Searches every shard for several queries and merges the results.
+
+        Shards return their FAISS and BM25 hits rather than results. Each
+        kind of hit is merged into one global ranking by its own measure,
+        and the rankings are then fused once, as a single CodebaseDatabase
+        fuses its own. BM25 scores are computed from term statistics summed
+        over the shards, so they compare across shards.
+        """
+        if not queries or not self.shards:
+            return [[] for _ in queries]
+        shard_stats = list(
+            self.executor.map(lambda shard: shard.get_term_stats(queries), self.shards)
+        )
+        stats = [
+            add_term_stats(query_stats[position] for query_stats in shard_stats)
+            for position in range(len(queries))
+        ]
+
+        shard_hits = list(
+            self.executor.map(
+                lambda shard: shard.search_identifiers(
+                    queries, k, include, exclude, stats
+                ),
+                self.shards,
+            )
+        )
+        all_hits = [
+            merge_identifier_hits([hits[position] for hits in shard_hits], k)
+            for position in range(len(queries))
+        ]
+
+        embedded = [position for position, hits in enumerate(all_hits) if not hits]
+        if embedded:
+            # Queries are embedded once for all shards.
+            embedded_queries = [queries[p] for p in embedded]
+            embedded_stats = [stats[p] for p in embedded]
+            query_vectors = get_query_embeddings(embedded_queries)
+            shard_hits = list(
+                self.executor.map(
+                    lambda shard: shard.search_embedded(
+                        embedded_queries,
+                        query_vectors,
+                        k,
+                        include,
+                        exclude,
+                        embedded_stats,
+                    ),
+                    self.shards,
+                )
+            )
+            n_candidates = self.shards[0].get_candidate_count(k)
+            for j, position in enumerate(embedded):
+                all_hits[position] = merge_embedded_hits(
+                    [hits[j] for hits in shard_hits], n_candidates
+                )
+
+        results = []
+        for hits in all_hits:
+            query_results = []
+            for distance, score, (shard, i) in fuse_search_hits(hits, k):
+                query_results.extend(
+                    self.shards[shard].make_results(
+                        [(distance, score, i)], include, exclude
+                    )
+                )
+            results.append(query_results)
+        return results
@@ -0,0 +1,139 @@
+import contextlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+EXACT_VECTORS_FILENAME = "exact_vectors.f32"
+EXACT_VECTORS_INFO_FILENAME = "exact_vectors.json"
+# Vectors are copied between files this many at a time, so saving never
+# holds more than one chunk in memory.
+COPY_CHUNK_VECTORS = 65_536
+
+
+class VectorStore:
+    """
+    Exact float32 vectors keyed by ID, kept in a memory-mapped file.
+
+    Indexes with lossy storage re-rank their candidates against these
+    vectors, so searches never have to embed documents again. Vectors are
+    appended to the file and removing one only forgets its row; save()
+    writes the live rows to a compact file next to the index, which the
+    store then keeps using. Until its first save, a store appends to a
+    temporary file that is deleted when the store is.
+
+    Attributes
+    ----------
+    path : str
+        the file the vectors are stored in, one row after the other
+    dimension : int
+        the length of each vector, None until the first one is added
+    rows : dict
+        the row in the file of each ID's vector
+    """
+
+    def __init__(self, path=None, dimension=None, rows=None):
+        self._temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="aidapt-vectors-", suffix=".f32")
+            os.close(fd)
+        self.path = path
+        self.dimension = dimension
+        self.rows = rows or {}
+        self.n_rows = len(self.rows)
+        self._memmap = None
+
+    @classmethod
+    def load(cls, index_dir):
+        """Opens the vectors saved in ``index_dir``, or returns None."""
+        info_path = os.path.join(index_dir, EXACT_VECTORS_INFO_FILENAME)
+        path = os.path.join(index_dir, EXACT_VECTORS_FILENAME)
+        if not os.path.isfile(info_path) or not os.path.isfile(path):
+            return None
+        with open(info_path) as file:
+            info = json.load(file)
+        if os.path.getsize(path) < len(info["ids"]) * info["dimension"] * 4:
+            return None
+        rows = {document_id: row for row, document_id in enumerate(info["ids"])}
+        return cls(path, info["dimension"], rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, document_id):
+        return document_id in self.rows
+
+    def __del__(self):
+        if getattr(self, "_temporary", False):
+            self._memmap = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def add(self, ids, vectors):
+        """Appends the vectors of ``ids``, replacing any they had before."""
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype="float32")
+        self.dimension = vectors.shape[1]
+        # Saved stores may have rows past their last ID, left by adds that
+        # were never saved; new rows go after those.
+        self.n_rows = max(
+            self.n_rows, os.path.getsize(self.path) // (4 * self.dimension)
+        )
+        with open(self.path, "r+b") as file:
+            file.seek(self.n_rows * self.dimension * 4)
+            for start in range(0, len(vectors), COPY_CHUNK_VECTORS):
+                file.write(vectors[start : start + COPY_CHUNK_VECTORS].tobytes())
+        for row, document_id in enumerate(ids, start=self.n_rows):
+            self.rows[int(document_id)] = row
+        self.n_rows += len(ids)
+        self._memmap = None
+
+    def remove(self, ids):
+        for document_id in ids:
+            self.rows.pop(int(document_id), None)
+
+    def get(self, ids):
+        """Returns the vectors of ``ids`` as an array, one row per ID."""
+        if not len(ids):
+            return np.empty((0, self.dimension or 0), dtype="float32")
+        if self._memmap is None:
+            self._memmap = np.memmap(
+                self.path,
+                dtype="float32",
+                mode="r",
+                shape=(self.n_rows, self.dimension),
+            )
+        return np.array(self._memmap[[self.rows[int(i)] for i in ids]])
+
+    def save(self, index_dir, lock=None):
+        """Writes the live vectors to ``index_dir``, atomically, and keeps
+        using the written file.
+
+        ``lock`` is only held to swap the written files in, so that readers
+        holding it never see the store half switched to them.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        path = os.path.join(index_dir, EXACT_VECTORS_FILENAME)
+        info_path = os.path.join(index_dir, EXACT_VECTORS_INFO_FILENAME)
+        ids = list(self.rows)
+        with open(path + ".tmp", "wb") as file:
+            for start in range(0, len(ids), COPY_CHUNK_VECTORS):
+                file.write(self.get(ids[start : start + COPY_CHUNK_VECTORS]).tobytes())
+        with open(info_path + ".tmp", "w") as file:
+            json.dump({"dimension": self.dimension, "ids": ids}, file)
+
+        with lock or contextlib.nullcontext():
+            os.replace(path + ".tmp", path)
+            os.replace(info_path + ".tmp", info_path)
+            if self._temporary:
+                self._memmap = None
+                os.remove(self.path)
+                self._temporary = False
+            self.path = path
+            self.rows = {document_id: row for row, document_id in enumerate(ids)}
+            self.n_rows = len(ids)
+            self._memmap = None
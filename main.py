@@ -1,6 +1,7 @@
 from agents.agent import Agent
 from agents.manager_agent import AgentManager
 from database.codebase_database import convert_to_database
+from database.file_watcher import FileWatcher
 from database.memory_database import MemoryDatabase
 from ui.user_interface import (
     ask_restart_project_context,
@@ -42,13 +43,28 @@ def main():
         project_folder = clone_repository()
 
     # Step 7: Convert the sourced project into an AI-friendly database. This will help the AI understand and interact with the codebase effectively.
-    codebase_database = convert_to_database(project_folder, project_source)
+    # Indexing progress is reported through the Agent callback set in step 1.
+    codebase_database = convert_to_database(
+        project_folder, project_source, Agent.get_callback()
+    )
+
+    # Keep the codebase index in sync with the files the agents create, edit, rename and delete.
+    # The watcher re-indexes changed files on a background thread, so the interaction loop never waits on it.
+    watcher = None
+    if codebase_database is not None:
+        watcher = FileWatcher(codebase_database, save=True)
+        watcher.start()
 
     # Step 8: Create an instance of the Manager Agent. This agent is responsible for managing the high-level operations and interactions.
     manager_agent = AgentManager()
 
     # Step 9: Begin the interaction loop between the user and the AI agent. This is where the bulk of the AI-user interaction happens.
-    interaction_loop(manager_agent, codebase_database)
+    try:
+        interaction_loop(manager_agent, codebase_database)
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        memory_database.flush()
 
 
 def interaction_loop(manager_agent, codebase_database=None):
@@ -0,0 +1,75 @@
+import unittest
+
+from database.chunker import count_tokens, get_chunk_spans
+from database.document_store import DocumentStore
+from database.file_parser import chunk_function, extract_functions
+
+
+def make_long_function(n_lines):
+    body = "".join(
+        f"    value_{i} = compute(value_{i - 1}, {i})\n" for i in range(n_lines)
+    )
+    return "def generated():\n" + body
+
+
+class TestGetChunkSpans(unittest.TestCase):
+    def test_short_spans_are_not_chunked(self):
+        self.assertIsNone(get_chunk_spans(b"def f():\n    pass\n", max_tokens=100))
+
+    def test_chunks_fit_overlap_and_cover_every_line(self):
+        span = make_long_function(300).encode()
+        chunks = get_chunk_spans(span, max_tokens=200, overlap_tokens=40)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(span))
+        for start, end, _, _ in chunks:
+            self.assertLessEqual(count_tokens(span[start:end].decode()), 200)
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertLess(chunk[0], previous[1])
+            self.assertLessEqual(chunk[2], previous[3])
+            self.assertGreater(chunk[3], previous[3])
+
+    def test_splits_lines_longer_than_a_chunk(self):
+        span = b"x = [" + b"1, " * 2000 + b"]\n"
+        chunks = get_chunk_spans(span, max_tokens=100, overlap_tokens=10)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk[2:] == (0, 0) for chunk in chunks))
+
+
+class TestChunkFunction(unittest.TestCase):
+    def test_chunks_map_back_to_the_parent_function(self):
+        source = ("import os\n\n\n" + make_long_function(2000)).encode()
+        function = extract_functions(source)[0]
+
+        chunks = chunk_function(source, function)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual([c["chunk_index"] for c in chunks], list(range(len(chunks))))
+        self.assertEqual(chunks[0]["start_line"], function["start_line"])
+        self.assertEqual(chunks[-1]["end_line"], function["end_line"])
+        for chunk in chunks:
+            self.assertEqual(chunk["function_name"], "generated")
+            self.assertEqual(
+                (chunk["parent_start_line"], chunk["parent_end_line"]),
+                (function["start_line"], function["end_line"]),
+            )
+            self.assertEqual(
+                source[chunk["start_byte"] : chunk["end_byte"]].decode().rstrip("\n"),
+                chunk["code"],
+            )
+
+    def test_chunks_without_a_span_keep_their_code(self):
+        function = {"code": make_long_function(2000), "function_name": "generated"}
+
+        chunks = chunk_function(b"", function)
+
+        self.assertGreater(len(chunks), 1)
+        store = DocumentStore(enumerate(chunks))
+        self.assertEqual(store[1]["code"], chunks[1]["code"])
+        self.assertEqual(store[1]["chunk_index"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
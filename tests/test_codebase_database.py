@@ -0,0 +1,551 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from database import codebase_database, embedding_cache  # noqa: E402
+from database.codebase_database import CodebaseDatabase  # noqa: E402
+from database.embedding_cache import (  # noqa: E402
+    EmbeddingCache,
+    QueryEmbeddingCache,
+)
+from database.index_factory import (  # noqa: E402
+    PQ_MIN_TRAINING_VECTORS,
+    STORAGE_TYPES,
+    build_index,
+    get_storage,
+)
+
+
+class FakeEmbeddings:
+    """Embeds text into a small deterministic vector and counts calls."""
+
+    def __init__(self):
+        self.texts_embedded = 0
+
+    def embed(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+    def embed_query(self, text):
+        self.texts_embedded += 1
+        return self.embed(text)
+
+    def embed_documents(self, texts):
+        self.texts_embedded += len(texts)
+        return [self.embed(text) for text in texts]
+
+
+class CodebaseDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.project_folder = os.path.join(self.directory, "project")
+        self.mtime = time.time()
+        os.makedirs(os.path.join(self.project_folder, "pkg"))
+        self.write(
+            "a.py",
+            "def alpha(x):\n    return x + 1\n\n\ndef beta(y):\n    return y * 2\n",
+        )
+        self.write("pkg/b.py", "def gamma():\n    pass\n")
+
+        self.embeddings = FakeEmbeddings()
+        cache = EmbeddingCache(os.path.join(self.directory, "cache.sqlite3"))
+        patches = [
+            mock.patch.object(codebase_database, "embeddings", self.embeddings),
+            mock.patch.object(embedding_cache, "_embedding_cache", cache),
+            mock.patch.object(
+                embedding_cache, "_query_embedding_cache", QueryEmbeddingCache()
+            ),
+            mock.patch("builtins.print"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(cache.close)
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, relative_path, content):
+        path = os.path.join(self.project_folder, relative_path)
+        with open(path, "w") as file:
+            file.write(content)
+        # Make every write visible as an mtime change, even within one tick.
+        self.mtime += 10
+        os.utime(path, (self.mtime, self.mtime))
+        return path
+
+    def function_names(self, database):
+        return sorted(doc["function_name"] for doc in database.documents.values())
+
+
+class TestIncrementalRefresh(CodebaseDatabaseTestCase):
+    def test_documents_and_index_stay_in_sync(self):
+        database = CodebaseDatabase(self.project_folder)
+        self.assertEqual(self.function_names(database), ["alpha", "beta", "gamma"])
+        self.assertEqual(database.faiss_index.ntotal, len(database.documents))
+
+    def test_only_changed_files_are_reembedded(self):
+        database = CodebaseDatabase(self.project_folder)
+        embedded_before = self.embeddings.texts_embedded
+
+        path = self.write(
+            "pkg/b.py", "def gamma():\n    return 3\n\n\ndef delta():\n    pass\n"
+        )
+        changed = database.refresh()
+
+        self.assertEqual(changed, [path])
+        self.assertEqual(self.embeddings.texts_embedded - embedded_before, 2)
+        self.assertEqual(
+            self.function_names(database), ["alpha", "beta", "delta", "gamma"]
+        )
+        self.assertEqual(database.faiss_index.ntotal, len(database.documents))
+
+    def test_deleted_files_are_dropped(self):
+        database = CodebaseDatabase(self.project_folder)
+        os.remove(os.path.join(self.project_folder, "a.py"))
+        database.refresh()
+
+        self.assertEqual(self.function_names(database), ["gamma"])
+        self.assertEqual(database.faiss_index.ntotal, 1)
+        results = database.search_faiss_index("def gamma():\n    pass", k=5)
+        self.assertEqual([r["document"]["function_name"] for r in results], ["gamma"])
+
+    def test_touch_without_content_change_is_ignored(self):
+        database = CodebaseDatabase(self.project_folder)
+        path = os.path.join(self.project_folder, "a.py")
+        os.utime(path, (self.mtime + 100, self.mtime + 100))
+        self.assertEqual(database.refresh(), [])
+
+
+class TestSaveAndLoad(CodebaseDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index_dir = os.path.join(self.directory, "index")
+
+    def test_load_restores_documents_without_embedding(self):
+        database = CodebaseDatabase(self.project_folder, index_dir=self.index_dir)
+        database.save()
+        embedded_before = self.embeddings.texts_embedded
+
+        loaded = CodebaseDatabase.load(self.project_folder, index_dir=self.index_dir)
+
+        self.assertEqual(self.embeddings.texts_embedded, embedded_before)
+        self.assertEqual(loaded.documents, database.documents)
+        self.assertEqual(loaded.file_states, database.file_states)
+        self.assertEqual(loaded.faiss_index.ntotal, database.faiss_index.ntotal)
+        self.assertEqual(loaded.refresh(), [])
+
+    def test_mmapped_index_can_still_be_refreshed(self):
+        CodebaseDatabase(self.project_folder, index_dir=self.index_dir).save()
+        loaded = CodebaseDatabase.load(
+            self.project_folder, mmap=True, index_dir=self.index_dir
+        )
+
+        self.write("pkg/b.py", "def delta():\n    pass\n")
+        loaded.refresh()
+        loaded.save()
+
+        reloaded = CodebaseDatabase.load(self.project_folder, index_dir=self.index_dir)
+        self.assertEqual(self.function_names(reloaded), ["alpha", "beta", "delta"])
+        self.assertEqual(reloaded.faiss_index.ntotal, 3)
+
+    def test_searches_run_while_saving(self):
+        database = CodebaseDatabase(
+            self.project_folder, storage="sq8", index_dir=self.index_dir
+        )
+        writing = threading.Event()
+        searched = threading.Event()
+        waits = []
+
+        def write_documents(*args):
+            writing.set()
+            waits.append(searched.wait(5))
+
+        with mock.patch.object(codebase_database, "write_documents", write_documents):
+            saver = threading.Thread(target=database.save)
+            saver.start()
+            writing.wait(5)
+            results = database.search_faiss_index("def gamma():\n    pass", k=1)
+            searched.set()
+            saver.join()
+
+        self.assertEqual(results[0]["document"]["function_name"], "gamma")
+        self.assertEqual(waits, [True])
+
+    def test_only_ivf_indexes_stay_memory_mapped(self):
+        for index_type in ("flat", "ivf", "hnsw"):
+            with self.subTest(index_type=index_type):
+                CodebaseDatabase(
+                    self.project_folder, index_type=index_type, index_dir=self.index_dir
+                ).save()
+                loaded = CodebaseDatabase.load(
+                    self.project_folder, mmap=True, index_dir=self.index_dir
+                )
+                self.assertEqual(loaded.index_mmapped, index_type == "ivf")
+
+    def test_load_without_saved_index_returns_none(self):
+        self.assertIsNone(
+            CodebaseDatabase.load(self.project_folder, index_dir=self.index_dir)
+        )
+
+
+class TestIndexTypes(CodebaseDatabaseTestCase):
+    def test_refresh_works_for_every_index_type(self):
+        for index_type in ("flat", "ivf", "hnsw"):
+            with self.subTest(index_type=index_type):
+                database = CodebaseDatabase(self.project_folder, index_type=index_type)
+                self.write("a.py", "def alpha(x):\n    return x\n")
+                database.refresh()
+
+                self.assertEqual(self.function_names(database), ["alpha", "gamma"])
+                self.assertEqual(database.faiss_index.ntotal, 2)
+                results = database.search_faiss_index("def gamma():\n    pass", k=1)
+                self.assertEqual(results[0]["document"]["function_name"], "gamma")
+
+
+class TestQuantizedStorage(CodebaseDatabaseTestCase):
+    def test_lossy_storage_reranks_with_exact_distances(self):
+        exact = CodebaseDatabase(self.project_folder)
+        compressed = CodebaseDatabase(self.project_folder, storage="sq8")
+        query = "def beta(y):\n    return y * 2\n"
+
+        expected = exact.search_faiss_index(query, k=3)
+        found = compressed.search_faiss_index(query, k=3)
+
+        self.assertEqual(
+            [r["document"]["function_name"] for r in found],
+            [r["document"]["function_name"] for r in expected],
+        )
+        for f, e in zip(found, expected):
+            self.assertAlmostEqual(float(f["distance"]), float(e["distance"]), places=3)
+
+    def test_reranks_from_saved_vectors_without_embedding(self):
+        index_dir = os.path.join(self.directory, "index")
+        database = CodebaseDatabase(
+            self.project_folder, storage="sq8", index_dir=index_dir
+        )
+        query = "def beta(y):\n    return y * 2\n"
+        expected = database.search_faiss_index(query, k=3)
+        database.save()
+        loaded = CodebaseDatabase.load(self.project_folder, index_dir=index_dir)
+        self.write("pkg/c.py", "def delta(y):\n    return y * 3\n")
+        loaded.refresh()
+        embedded = self.embeddings.texts_embedded
+
+        # Evicted documents would have to be embedded again.
+        empty_cache = EmbeddingCache(os.path.join(self.directory, "empty.sqlite3"))
+        self.addCleanup(empty_cache.close)
+        with mock.patch.object(embedding_cache, "_embedding_cache", empty_cache):
+            found = loaded.search_faiss_index(query, k=4)
+
+        self.assertEqual(self.embeddings.texts_embedded, embedded)
+        names = [r["document"]["function_name"] for r in found]
+        self.assertIn("delta", names)
+        self.assertEqual(
+            [name for name in names if name != "delta"],
+            [r["document"]["function_name"] for r in expected],
+        )
+
+    def test_hnsw_removals_rebuild_from_exact_vectors(self):
+        database = CodebaseDatabase(
+            self.project_folder, index_type="hnsw", storage="sq8"
+        )
+        os.remove(os.path.join(self.project_folder, "pkg/b.py"))
+        database.refresh()
+
+        ids = sorted(database.documents.records)
+        expected = build_index(
+            database.exact_vectors.get(ids), ids, "hnsw", storage="sq8"
+        )
+        for document_id in ids:
+            np.testing.assert_array_equal(
+                database.faiss_index.reconstruct(document_id),
+                expected.reconstruct(document_id),
+            )
+
+    def test_memory_report(self):
+        report = CodebaseDatabase(self.project_folder).memory_report(k=2)
+
+        self.assertEqual(report["storage"], "float32")
+        self.assertEqual(report["vectors"], 3)
+        self.assertEqual(report["float32_bytes_per_vector"], 12)
+        self.assertGreaterEqual(report["bytes_per_vector"], 12)
+        self.assertEqual(report["recall@2"], 1.0)
+
+
+class TestSearchMany(CodebaseDatabaseTestCase):
+    def test_matches_individual_searches(self):
+        database = CodebaseDatabase(self.project_folder)
+        queries = ["def gamma():\n    pass", "def alpha(x):\n    return x + 1"]
+
+        results = database.search_many(queries, k=2)
+
+        self.assertEqual(len(results), 2)
+        for query, query_results in zip(queries, results):
+            expected = database.search_faiss_index(query, k=2)
+            self.assertEqual(
+                [r["document"] for r in query_results],
+                [r["document"] for r in expected],
+            )
+
+    def test_embeds_all_queries_in_one_request(self):
+        database = CodebaseDatabase(self.project_folder)
+        with mock.patch.object(
+            self.embeddings, "embed_documents", wraps=self.embeddings.embed_documents
+        ) as embed_documents:
+            database.search_many(["first query", "second query", "third query"])
+        embed_documents.assert_called_once()
+
+    def test_repeated_queries_are_not_reembedded(self):
+        database = CodebaseDatabase(self.project_folder)
+        database.search_faiss_index("parse the response")
+        embedded_before = self.embeddings.texts_embedded
+
+        database.search_faiss_index("parse the response")
+        database.search_many(["parse  the response"])
+
+        self.assertEqual(self.embeddings.texts_embedded, embedded_before)
+
+
+class TestHybridSearch(CodebaseDatabaseTestCase):
+    def test_identifier_queries_are_not_embedded(self):
+        database = CodebaseDatabase(self.project_folder)
+        embedded_before = self.embeddings.texts_embedded
+
+        results = database.search_faiss_index("beta", k=2)
+
+        self.assertEqual(self.embeddings.texts_embedded, embedded_before)
+        self.assertEqual(results[0]["document"]["function_name"], "beta")
+
+    def test_unknown_identifiers_fall_back_to_vector_search(self):
+        database = CodebaseDatabase(self.project_folder)
+        results = database.search_faiss_index("unknown_name", k=2)
+        self.assertEqual(len(results), 2)
+
+    def test_lexical_index_follows_refresh_and_load(self):
+        index_dir = os.path.join(self.directory, "index")
+        database = CodebaseDatabase(self.project_folder, index_dir=index_dir)
+        self.write("pkg/b.py", "def delta():\n    pass\n")
+        database.refresh()
+        database.save()
+
+        for searched in (
+            database,
+            CodebaseDatabase.load(self.project_folder, index_dir=index_dir),
+        ):
+            names = [
+                r["document"]["function_name"]
+                for r in searched.search_faiss_index("delta", k=1)
+            ]
+            self.assertEqual(names, ["delta"])
+            self.assertEqual(searched.get_lexical_index().find_name("gamma"), set())
+
+
+class TestCheckpointedBuild(CodebaseDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index_dir = os.path.join(self.directory, "index")
+        # Flush and checkpoint after every file.
+        self.options = dict(
+            index_dir=self.index_dir,
+            batch_size=1,
+            max_concurrency=1,
+            checkpoint=True,
+        )
+        patch = mock.patch.object(codebase_database, "BUILD_CHECKPOINT_SECONDS", 0)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_reports_progress_and_saves_the_index(self):
+        progress = []
+        database = CodebaseDatabase(
+            self.project_folder,
+            progress_callback=lambda output_type, feedback: progress.append(
+                (output_type, feedback)
+            ),
+            **self.options,
+        )
+
+        self.assertEqual({output_type for output_type, _ in progress}, {"progress"})
+        embedding = [p for _, p in progress if p["stage"] == "embedding"]
+        self.assertEqual([p["done"] for p in embedding], [1, 2])
+        self.assertEqual(embedding[-1]["eta"], 0)
+        self.assertEqual(progress[-1][1]["stage"], "indexing")
+
+        loaded = CodebaseDatabase.load(self.project_folder, index_dir=self.index_dir)
+        self.assertEqual(loaded.documents, database.documents)
+        self.assertFalse(os.path.exists(os.path.join(self.index_dir, "build")))
+
+    def test_interrupted_build_resumes_from_its_checkpoint(self):
+        add_build_documents = CodebaseDatabase.add_build_documents
+        calls = []
+
+        def fail_on_second_file(database, build_dir, documents):
+            calls.append(list(documents))
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            add_build_documents(database, build_dir, documents)
+
+        with mock.patch.object(
+            CodebaseDatabase, "add_build_documents", fail_on_second_file
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                CodebaseDatabase(self.project_folder, **self.options)
+
+        embedded = []
+        embed_documents = CodebaseDatabase.embed_documents
+
+        def record_embedded(database, documents):
+            documents = list(documents)
+            embedded.extend(document["function_name"] for document in documents)
+            return embed_documents(database, documents)
+
+        with mock.patch.object(CodebaseDatabase, "embed_documents", record_embedded):
+            database = CodebaseDatabase(self.project_folder, **self.options)
+
+        self.assertEqual(self.function_names(database), ["alpha", "beta", "gamma"])
+        self.assertEqual(database.faiss_index.ntotal, 3)
+        self.assertEqual(len(embedded), 3 - len(calls[0]))
+        self.assertEqual(
+            [
+                r["document"]["function_name"]
+                for r in database.search_faiss_index("gamma")
+            ][0],
+            "gamma",
+        )
+
+
+class TestDeduplication(CodebaseDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # The same body as a.py's alpha, indented as a method.
+        self.copy = self.write(
+            "copy.py", "class Copy:\n    def alpha(x):\n        return x + 1\n"
+        )
+
+    def test_duplicate_bodies_are_embedded_and_indexed_once(self):
+        database = CodebaseDatabase(self.project_folder)
+
+        self.assertEqual(len(database.documents), 4)
+        self.assertEqual(database.faiss_index.ntotal, 3)
+        self.assertEqual(self.embeddings.texts_embedded, 3)
+        report = database.dedup_report()
+        self.assertEqual((report["unique_bodies"], report["duplicates"]), (3, 1))
+        self.assertAlmostEqual(report["dedup_ratio"], 4 / 3)
+
+    def test_hits_list_every_location(self):
+        database = CodebaseDatabase(self.project_folder)
+
+        for query in ("alpha", "def alpha(x):\n    return x + 1"):
+            results = database.search_faiss_index(query, k=3)
+            alpha = [r for r in results if r["document"]["function_name"] == "alpha"]
+            self.assertEqual(len(alpha), 1)
+            self.assertEqual(
+                sorted(location["function_name"] for location in alpha[0]["locations"]),
+                ["Copy.alpha", "alpha"],
+            )
+
+    def test_removing_the_indexed_copy_indexes_another(self):
+        database = CodebaseDatabase(self.project_folder)
+        os.remove(os.path.join(self.project_folder, "a.py"))
+        database.refresh()
+
+        self.assertEqual(database.faiss_index.ntotal, 2)
+        results = database.search_faiss_index("def alpha(x):\n    return x + 1", k=1)
+        self.assertEqual(results[0]["document"]["function_name"], "Copy.alpha")
+        self.assertEqual(len(results[0]["locations"]), 1)
+
+    def test_groups_survive_save_and_load(self):
+        index_dir = os.path.join(self.directory, "index")
+        database = CodebaseDatabase(self.project_folder, index_dir=index_dir)
+        database.save()
+
+        loaded = CodebaseDatabase.load(self.project_folder, index_dir=index_dir)
+
+        self.assertEqual(loaded.body_groups, database.body_groups)
+        self.assertEqual(loaded.dedup_report(), database.dedup_report())
+
+
+class TestFilteredSearch(CodebaseDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write(
+            "pkg/c.py",
+            "def delta():\n    return 4\n\n\ndef epsilon(z):\n    return z - 5\n",
+        )
+        self.write("copy.py", "class Copy:\n    def alpha(x):\n        return x + 1\n")
+
+    def paths(self, results):
+        return {
+            os.path.relpath(location["filepath"], self.project_folder)
+            for result in results
+            for location in result["locations"]
+        }
+
+    def test_returns_k_results_within_the_filter(self):
+        query = "def alpha(x):\n    return x + 1"
+        for storage in STORAGE_TYPES:
+            if storage == "pq":
+                # Enough functions to train a product quantizer rather than
+                # fall back to sq8.
+                self.write(
+                    "bulk.py",
+                    "".join(
+                        f"def f{i}():\n    return {i}\n\n\n"
+                        for i in range(PQ_MIN_TRAINING_VECTORS)
+                    ),
+                )
+            for index_type in ("flat", "hnsw", "ivf"):
+                database = CodebaseDatabase(
+                    self.project_folder, index_type=index_type, storage=storage
+                )
+                self.assertEqual(get_storage(database.faiss_index), storage)
+                for hybrid in (True, False):
+                    with self.subTest(
+                        storage=storage, index_type=index_type, hybrid=hybrid
+                    ):
+                        database.hybrid = hybrid
+                        results = database.search_faiss_index(
+                            query, k=3, include="pkg/"
+                        )
+
+                        self.assertEqual(len(results), 3)
+                        self.assertEqual(self.paths(results), {"pkg/b.py", "pkg/c.py"})
+
+    def test_exclude_patterns(self):
+        database = CodebaseDatabase(self.project_folder)
+
+        results = database.search_faiss_index(
+            "def gamma():\n    pass", k=10, exclude=["pkg", "copy.py"]
+        )
+
+        self.assertEqual(self.paths(results), {"a.py"})
+        self.assertEqual(len(results), 2)
+
+    def test_results_only_list_matching_copies(self):
+        database = CodebaseDatabase(self.project_folder)
+
+        for query in ("alpha", "def alpha(x):\n    return x + 1"):
+            results = database.search_faiss_index(query, k=1, include="copy.py")
+            self.assertEqual(results[0]["document"]["function_name"], "Copy.alpha")
+            self.assertEqual(len(results[0]["locations"]), 1)
+
+    def test_filter_follows_refresh(self):
+        database = CodebaseDatabase(self.project_folder)
+        self.assertEqual(database.search_faiss_index("zeta", include="new"), [])
+
+        os.makedirs(os.path.join(self.project_folder, "new"))
+        self.write("new/d.py", "def zeta():\n    pass\n")
+        database.refresh()
+
+        results = database.search_faiss_index("zeta", include="new")
+        self.assertEqual(self.paths(results), {"new/d.py"})
+
+
+if __name__ == "__main__":
+    unittest.main()
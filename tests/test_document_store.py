@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+from database.document_store import DocumentStore, get_body_hash
+from database.file_parser import get_functions
+
+SOURCE = """def alpha():
+    return "é"
+
+
+class Beta:
+    def gamma(self):
+        return 2
+"""
+
+
+class TestDocumentStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "module.py")
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(SOURCE)
+        self.functions = get_functions(self.path)
+
+    def test_reads_code_lazily_from_the_file(self):
+        store = DocumentStore(enumerate(self.functions))
+
+        self.assertEqual(store.paths, [self.path])
+        for i, function in enumerate(self.functions):
+            self.assertIsNone(store.records[i].code)
+            self.assertEqual(store[i], function)
+
+    def test_keeps_code_of_documents_without_a_span(self):
+        store = DocumentStore()
+        store[7] = {"code": "def manual(): pass", "function_name": "manual"}
+
+        self.assertEqual(store[7]["code"], "def manual(): pass")
+        self.assertIsNone(store[7]["filepath"])
+
+    def test_changed_files_read_as_empty_instead_of_failing(self):
+        store = DocumentStore(enumerate(self.functions))
+        with open(self.path, "w") as file:
+            file.write("")
+
+        self.assertEqual(store[0]["code"], "")
+        self.assertTrue(store[0]["stale"])
+
+    def test_moved_functions_are_found_again(self):
+        store = DocumentStore(enumerate(self.functions))
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write("import os\n\n\n" + SOURCE)
+
+        for i, function in enumerate(self.functions):
+            self.assertEqual(store[i]["function_name"], function["function_name"])
+            self.assertEqual(store[i]["code"], function["code"])
+            self.assertEqual(store[i]["start_line"], function["start_line"] + 3)
+            self.assertNotIn("stale", store[i])
+
+    def test_changed_functions_are_marked_stale(self):
+        store = DocumentStore(enumerate(self.functions))
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(SOURCE.replace("return 2", "return 3"))
+
+        self.assertEqual(store[0]["code"], self.functions[0]["code"])
+        self.assertNotIn("stale", store[0])
+        self.assertEqual(store[1]["function_name"], "Beta.gamma")
+        self.assertEqual(store[1]["code"], "    def gamma(self):\n        return 3")
+        self.assertTrue(store[1]["stale"])
+
+
+class TestGetBodyHash(unittest.TestCase):
+    def test_ignores_whitespace_only(self):
+        self.assertEqual(
+            get_body_hash("def f(x):\n    return x\n"),
+            get_body_hash("    def f(x):\r\n        return  x"),
+        )
+        self.assertNotEqual(get_body_hash("return x"), get_body_hash("return y"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,4 @@
-from agents.external_apis import get_embedding
+from database.codebase_database import get_embedding
 
 
 def main():
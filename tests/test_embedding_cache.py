@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from database.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite3")
+        self.calls = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def test_warm_cache_makes_no_embedding_calls(self):
+        cache = EmbeddingCache(self.path)
+        first = cache.get_or_embed(["a", "bb", "a"], self.embed, "model")
+        cache.close()
+        self.assertEqual(self.calls, [["a", "bb"]])
+
+        reopened = EmbeddingCache(self.path)
+        second = reopened.get_or_embed(["a", "bb"], self.embed, "model")
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(second, first[:2])
+        self.assertEqual(reopened.stats()["hits"], 2)
+        self.assertEqual(reopened.stats()["misses"], 0)
+        reopened.close()
+
+    def test_model_is_part_of_the_key(self):
+        cache = EmbeddingCache(self.path)
+        cache.get_or_embed(["a"], self.embed, "model-a")
+        cache.get_or_embed(["a"], self.embed, "model-b")
+        self.assertEqual(len(self.calls), 2)
+        cache.close()
+
+    def test_least_recently_used_rows_are_evicted(self):
+        # Each two-float vector takes 8 bytes, so the cap holds two rows.
+        cache = EmbeddingCache(self.path, max_bytes=16)
+        cache.get_or_embed(["a"], self.embed, "model")
+        cache.get_or_embed(["b"], self.embed, "model")
+        cache.get_or_embed(["a"], self.embed, "model")
+        cache.get_or_embed(["c"], self.embed, "model")
+
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.stats()["bytes"], 16)
+        self.assertIsNotNone(cache.get_many(["a"], "model")[0])
+        self.assertIsNone(cache.get_many(["b"], "model")[0])
+        cache.close()
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    def test_repeated_queries_are_embedded_once(self):
+        cache = QueryEmbeddingCache()
+        cache.get_or_embed(["find  the parser"], self.embed, "model")
+        vectors = cache.get_or_embed(
+            ["find the parser", "new query"], self.embed, "model"
+        )
+
+        self.assertEqual(self.calls, [["find  the parser"], ["new query"]])
+        self.assertEqual(vectors[0], [16.0])
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_least_recently_used_query_is_evicted(self):
+        cache = QueryEmbeddingCache(max_entries=2)
+        for text in ["a", "b", "a", "c"]:
+            cache.get_or_embed([text], self.embed, "model")
+
+        self.assertIsNotNone(cache.get("a", "model"))
+        self.assertIsNone(cache.get("b", "model"))
+
+    def test_entries_expire_after_ttl(self):
+        cache = QueryEmbeddingCache(ttl=10)
+        with mock.patch("database.embedding_cache.time.monotonic", return_value=0):
+            cache.get_or_embed(["a"], self.embed, "model")
+        with mock.patch("database.embedding_cache.time.monotonic", return_value=11):
+            self.assertIsNone(cache.get("a", "model"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
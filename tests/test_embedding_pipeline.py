@@ -0,0 +1,49 @@
+import threading
+import time
+import unittest
+
+from database.embedding_pipeline import embed_in_batches, make_batches
+
+
+class TestMakeBatches(unittest.TestCase):
+    def test_batches_are_bounded_by_count(self):
+        batches = list(make_batches(["a"] * 10, batch_size=4))
+        self.assertEqual(batches, [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+
+    def test_batches_are_bounded_by_characters(self):
+        texts = ["x" * 6, "x" * 6, "x" * 20, "x"]
+        batches = list(make_batches(texts, batch_size=10, max_batch_chars=12))
+        self.assertEqual(batches, [[0, 1], [2], [3]])
+
+
+class TestEmbedInBatches(unittest.TestCase):
+    def test_results_keep_input_order(self):
+        def embed_batch(texts):
+            # Finish later batches first to shuffle completion order.
+            time.sleep(0.01 * (10 - int(texts[0])))
+            return [[float(text)] for text in texts]
+
+        texts = [str(i) for i in range(10)]
+        vectors = embed_in_batches(texts, embed_batch, batch_size=1, max_concurrency=4)
+        self.assertEqual(vectors, [[float(i)] for i in range(10)])
+
+    def test_concurrency_is_capped(self):
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def embed_batch(texts):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return [[0.0] for _ in texts]
+
+        embed_in_batches(["a"] * 20, embed_batch, batch_size=1, max_concurrency=3)
+        self.assertLessEqual(peak[0], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from database import file_parser
+from database.file_parser import (
+    decode_code,
+    extract_functions,
+    extract_functions_by_indentation,
+    get_functions,
+)
+
+SOURCE = b"""import functools
+
+
+def top(a):
+    return a
+
+
+@functools.lru_cache()
+async def cached(x):
+    def inner():
+        return x
+
+    return inner
+
+
+class Service:
+    @staticmethod
+    def helper():
+        pass
+"""
+
+
+class TestExtractFunctions(unittest.TestCase):
+    def test_finds_methods_async_decorated_and_nested_functions(self):
+        functions = extract_functions(SOURCE)
+
+        self.assertEqual(
+            [f["function_name"] for f in functions],
+            ["top", "cached", "cached.inner", "Service.helper"],
+        )
+
+    def test_spans_cover_decorators_and_map_to_bytes(self):
+        functions = {f["function_name"]: f for f in extract_functions(SOURCE)}
+
+        cached = functions["cached"]
+        self.assertEqual((cached["start_line"], cached["end_line"]), (8, 13))
+        self.assertTrue(cached["code"].startswith("@functools.lru_cache()"))
+        for function in functions.values():
+            span = SOURCE[function["start_byte"] : function["end_byte"]]
+            self.assertEqual(span.decode().rstrip("\n"), function["code"])
+
+    def test_falls_back_to_indentation_on_syntax_errors(self):
+        functions = extract_functions(
+            b"def broken(:\n    pass\n\ndef ok():\n    pass\n"
+        )
+        self.assertEqual([f["function_name"] for f in functions], ["broken", "ok"])
+
+    def test_carriage_return_line_endings(self):
+        for line_break in (b"\r", b"\r\n"):
+            source = SOURCE.replace(b"\n", line_break)
+            for parse in (extract_functions, extract_functions_by_indentation):
+                with self.subTest(line_break=line_break, parse=parse.__name__):
+                    top = {f["function_name"]: f for f in parse(source)}["top"]
+                    self.assertEqual(top["start_line"], 4)
+                    self.assertEqual(top["code"], "def top(a):\n    return a")
+                    span = source[top["start_byte"] : top["end_byte"]]
+                    self.assertEqual(decode_code(span), top["code"])
+
+        functions = extract_functions(SOURCE.replace(b"\n", b"\r"))
+        cached = {f["function_name"]: f for f in functions}["cached"]
+        self.assertEqual((cached["start_line"], cached["end_line"]), (8, 13))
+
+
+class TestGetFunctions(unittest.TestCase):
+    def test_identical_content_is_parsed_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ("a.py", "b.py")]
+            for path in paths:
+                with open(path, "wb") as file:
+                    file.write(SOURCE + b"\n# unique to this test\n")
+
+            with mock.patch.object(
+                file_parser, "extract_functions", wraps=extract_functions
+            ) as extract:
+                first = get_functions(paths[0])
+                second = get_functions(paths[1])
+
+        extract.assert_called_once()
+        self.assertEqual({f["filepath"] for f in first}, {paths[0]})
+        self.assertEqual({f["filepath"] for f in second}, {paths[1]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from database import file_parser
+from database.file_parser import parse_files
+from database.file_walker import PathFilter, walk_files
+
+
+class TestWalkFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def touch(self, relative_path, content=""):
+        path = os.path.join(self.root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def walk(self, **kwargs):
+        return sorted(
+            os.path.relpath(path, self.root) for path in walk_files(self.root, **kwargs)
+        )
+
+    def test_skips_excluded_directories_and_other_extensions(self):
+        self.touch("app/main.py")
+        self.touch("app/readme.md")
+        self.touch("venv/lib/site.py")
+        self.touch(".git/hooks/hook.py")
+        self.touch("node_modules/pkg/index.py")
+        self.touch("pkg.egg-info/setup.py")
+
+        self.assertEqual(self.walk(), ["app/main.py"])
+
+    def test_custom_exclude_list(self):
+        self.touch("app/main.py")
+        self.touch("tests/test_main.py")
+
+        self.assertEqual(self.walk(exclude=("tests",)), ["app/main.py"])
+
+    def test_honors_nested_gitignore_files(self):
+        self.touch(".gitignore", "generated/\n/top_only.py\n*_pb2.py\n!keep_pb2.py\n")
+        self.touch("generated/models.py")
+        self.touch("top_only.py")
+        self.touch("app/top_only.py")
+        self.touch("app/service_pb2.py")
+        self.touch("app/keep_pb2.py")
+        self.touch("app/.gitignore", "local.py\n")
+        self.touch("app/local.py")
+        self.touch("local.py")
+
+        self.assertEqual(
+            self.walk(),
+            ["app/keep_pb2.py", "app/top_only.py", "local.py"],
+        )
+        self.assertEqual(len(self.walk(use_gitignore=False)), 7)
+
+    def test_double_star_patterns(self):
+        self.touch(".gitignore", "**/fixtures/*.py\ndocs/**\n")
+        self.touch("a/b/fixtures/data.py")
+        self.touch("docs/conf.py")
+        self.touch("a/b/code.py")
+
+        self.assertEqual(self.walk(), ["a/b/code.py"])
+
+
+class TestPathFilter(unittest.TestCase):
+    def matching(self, **kwargs):
+        path_filter = PathFilter("/project", **kwargs)
+        paths = [
+            "app/main.py",
+            "app/tests/test_main.py",
+            "tests/test_app.py",
+            "setup.py",
+        ]
+        return [
+            path
+            for path in paths
+            if path_filter.matches(os.path.join("/project", path))
+        ]
+
+    def test_patterns_match_files_and_their_directories(self):
+        self.assertEqual(
+            self.matching(include=["app/"]),
+            ["app/main.py", "app/tests/test_main.py"],
+        )
+        self.assertEqual(self.matching(exclude=["tests"]), ["app/main.py", "setup.py"])
+        self.assertEqual(
+            self.matching(include=["*.py"], exclude=["test_*.py"]),
+            ["app/main.py", "setup.py"],
+        )
+        self.assertEqual(self.matching(include=["/tests"]), ["tests/test_app.py"])
+
+
+class TestParseFiles(unittest.TestCase):
+    def test_process_pool_keeps_file_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i in range(8):
+                path = os.path.join(directory, f"module_{i}.py")
+                with open(path, "w") as file:
+                    file.write(f"def function_{i}():\n    pass\n")
+                paths.append(path)
+
+            with mock.patch.object(file_parser, "PARALLEL_PARSE_MIN_FILES", 1):
+                results = parse_files(paths, max_workers=2)
+
+        self.assertEqual(
+            [functions[0]["function_name"] for _, functions in results],
+            [f"function_{i}" for i in range(8)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+import unittest
+
+from database.codebase_database import CodebaseDatabase
+from database.file_watcher import FileWatcher
+from tests.test_codebase_database import CodebaseDatabaseTestCase
+
+
+class TestFileWatcher(CodebaseDatabaseTestCase):
+    def wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Timed out waiting for the watcher.")
+            time.sleep(0.01)
+
+    def test_poll_reports_created_changed_and_deleted_files(self):
+        watcher = FileWatcher(CodebaseDatabase(self.project_folder))
+        watcher.poll()
+
+        created = self.write("c.py", "def c():\n    pass\n")
+        changed = self.write("a.py", "def alpha():\n    pass\n")
+        deleted = os.path.join(self.project_folder, "pkg", "b.py")
+        os.remove(deleted)
+
+        self.assertEqual(watcher.poll(), {created, changed, deleted})
+        self.assertEqual(watcher.poll(), set())
+
+    def test_changes_are_indexed_in_the_background(self):
+        database = CodebaseDatabase(self.project_folder)
+        refreshed = []
+        with FileWatcher(
+            database, interval=0.01, debounce=0.05, on_refresh=refreshed.extend
+        ) as watcher:
+            path = self.write("pkg/b.py", "def delta():\n    pass\n")
+            self.write("pkg/b.py", "def delta():\n    return 1\n")
+            self.wait_for(lambda: watcher.refreshes)
+
+        self.assertEqual(refreshed, [path])
+        self.assertEqual(self.function_names(database), ["alpha", "beta", "delta"])
+        self.assertEqual(database.faiss_index.ntotal, 3)
+
+    def test_searches_do_not_wait_for_embedding_during_refresh(self):
+        database = CodebaseDatabase(self.project_folder)
+        embedding = threading.Event()
+        release = threading.Event()
+        embed_documents = self.embeddings.embed_documents
+
+        def slow_embed_documents(texts):
+            embedding.set()
+            release.wait(10)
+            return embed_documents(texts)
+
+        self.embeddings.embed_documents = slow_embed_documents
+        self.write("pkg/b.py", "def delta():\n    pass\n")
+        refresh = threading.Thread(target=database.refresh)
+        refresh.start()
+        try:
+            self.assertTrue(embedding.wait(10))
+            results = database.search_faiss_index("gamma", k=1)
+            self.assertEqual(results[0]["document"]["function_name"], "gamma")
+        finally:
+            release.set()
+            refresh.join()
+
+        self.assertEqual(self.function_names(database), ["alpha", "beta", "delta"])
+
+
+if __name__ == "__main__":
+    unittest.main()
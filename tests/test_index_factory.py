@@ -0,0 +1,35 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from database import index_factory
+from database.index_factory import IDFilter, build_index, search_index
+
+
+class TestFilteredIVFSearch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.standard_normal((4000, 8)).astype("float32")
+        self.ids = np.arange(4000) * 10
+        self.index = build_index(self.vectors, self.ids, "ivf", nprobe=1)
+        self.queries = rng.standard_normal((3, 8)).astype("float32")
+
+    def test_widens_nprobe_step_by_step(self):
+        selected = self.ids[:5]
+        id_filter = IDFilter(self.index, selected)
+        with mock.patch.object(
+            index_factory,
+            "get_filtered_search",
+            wraps=index_factory.get_filtered_search,
+        ) as get_filtered_search:
+            _, labels = search_index(self.index, self.queries, 5, id_filter)
+
+        for query_labels in labels:
+            self.assertEqual(set(query_labels), set(selected))
+        nprobes = [c.kwargs.get("nprobe") for c in get_filtered_search.mock_calls]
+        self.assertEqual(nprobes[:3], [None, 2, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import unittest
+from unittest import mock
+
+from database import codebase_database
+from database.index_registry import IndexRegistry
+from tests.test_codebase_database import CodebaseDatabaseTestCase
+
+
+class TestIndexRegistry(CodebaseDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_folder = os.path.join(self.directory, "other")
+        os.makedirs(self.other_folder)
+        with open(os.path.join(self.other_folder, "c.py"), "w") as file:
+            file.write("def delta():\n    return 4\n")
+
+        index_root = os.path.join(self.directory, "indexes")
+        patch = mock.patch.object(
+            codebase_database,
+            "get_index_dir",
+            lambda project_folder: os.path.join(
+                index_root, os.path.basename(project_folder)
+            ),
+        )
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_open_projects_are_reused(self):
+        registry = IndexRegistry()
+        database = registry.get(self.project_folder)
+        registry.get(self.other_folder)
+        embedded = self.embeddings.texts_embedded
+
+        self.assertIs(registry.get(self.project_folder + "/"), database)
+        self.assertEqual(self.embeddings.texts_embedded, embedded)
+        self.assertEqual(len(registry), 2)
+
+    def test_evicts_least_recently_used_and_reloads_it(self):
+        registry = IndexRegistry(memory_budget=1)
+        registry.get(self.project_folder)
+        registry.get(self.other_folder)
+
+        self.assertNotIn(self.project_folder, registry)
+        self.assertIn(self.other_folder, registry)
+        self.assertEqual(registry.evictions, 1)
+
+        embedded = self.embeddings.texts_embedded
+        database = registry.get(self.project_folder)
+        self.assertEqual(self.embeddings.texts_embedded, embedded)
+        self.assertEqual(self.function_names(database), ["alpha", "beta", "gamma"])
+        self.assertNotIn(self.other_folder, registry)
+
+    def test_budget_fitting_every_project_evicts_nothing(self):
+        registry = IndexRegistry()
+        registry.get(self.project_folder)
+        registry.get(self.other_folder)
+
+        usage = registry.memory_usage()
+        self.assertTrue(all(n_bytes > 0 for n_bytes in usage.values()))
+        self.assertEqual(registry.evictions, 0)
+
+    def test_close_saves_every_project(self):
+        registry = IndexRegistry()
+        registry.get(self.project_folder)
+        registry.close()
+
+        self.assertEqual(len(registry), 0)
+        self.assertIsNotNone(
+            codebase_database.CodebaseDatabase.load(self.project_folder)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+
+from database.lexical_index import (
+    COMMON_TERM_MIN_DOCUMENTS,
+    LexicalIndex,
+    is_identifier_query,
+    reciprocal_rank_fusion,
+    split_identifier,
+    tokenize,
+)
+
+
+class TestTokenize(unittest.TestCase):
+    def test_splits_snake_and_camel_case(self):
+        self.assertEqual(split_identifier("parse_response"), ["parse", "response"])
+        self.assertEqual(
+            split_identifier("HTTPServerError"), ["http", "server", "error"]
+        )
+
+    def test_keeps_whole_identifiers_next_to_their_words(self):
+        self.assertEqual(
+            tokenize("parse_response(x)"), ["parse_response", "parse", "response", "x"]
+        )
+
+    def test_skips_keywords_and_receivers(self):
+        self.assertEqual(
+            tokenize("def send(self, cls):\n    return None if x else True"),
+            ["send", "x"],
+        )
+
+    def test_identifier_queries(self):
+        self.assertTrue(is_identifier_query("parse_response"))
+        self.assertTrue(is_identifier_query(" CodebaseDatabase.refresh "))
+        self.assertFalse(is_identifier_query("parse the response"))
+        self.assertFalse(is_identifier_query("parse_response()"))
+
+
+class TestLexicalIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = LexicalIndex()
+        self.index.add(
+            1,
+            {
+                "function_name": "parse_response",
+                "code": 'def parse_response(text):\n    """Parse the reply."""\n',
+            },
+        )
+        self.index.add(
+            2,
+            {
+                "function_name": "Agent.send",
+                "code": "def send(self):\n    return parse_response(self.call())\n",
+            },
+        )
+        self.index.add(
+            3, {"function_name": "clone_repo", "code": "def clone_repo(url):\n"}
+        )
+
+    def test_ranks_the_defining_function_first(self):
+        hits = self.index.search("parse_response", k=3)
+        self.assertEqual([i for _, i in hits], [1, 2])
+
+    def test_matches_docstring_words(self):
+        self.assertEqual(self.index.search("reply")[0][1], 1)
+
+    def test_identifier_search_puts_exact_names_first(self):
+        self.assertEqual(self.index.search_identifier("send")[0][1], 2)
+        self.assertEqual(self.index.search_identifier("Agent.send")[0][1], 2)
+
+    def test_remove_forgets_terms_and_names(self):
+        self.index.remove(1)
+
+        self.assertEqual([i for _, i in self.index.search("reply")], [])
+        self.assertEqual(self.index.find_name("parse_response"), set())
+        self.assertEqual(
+            self.index.total_length, sum(self.index.document_lengths.values())
+        )
+
+
+class TestCommonTerms(unittest.TestCase):
+    def setUp(self):
+        self.index = LexicalIndex()
+        for i in range(COMMON_TERM_MIN_DOCUMENTS + 1):
+            self.index.add(i, {"function_name": f"f{i}", "code": "value = common()"})
+        self.index.add(-1, {"function_name": "g", "code": "value = common(rare)"})
+
+    def test_skips_terms_in_too_many_documents(self):
+        hits = self.index.search("common rare", k=3)
+        self.assertEqual([i for _, i in hits], [-1])
+
+    def test_scores_the_rarest_term_when_all_are_common(self):
+        self.assertEqual(len(self.index.search("common value", k=3)), 3)
+
+
+class TestReciprocalRankFusion(unittest.TestCase):
+    def test_rewards_ids_ranked_by_both_lists(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4]])
+        self.assertEqual([i for _, i in fused], [3, 1, 2, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,308 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from database import embedding_cache
+from database.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from database.id_allocator import IdAllocator
+from database.memory_database import MemoryDatabase, QueryResultCache
+
+
+def fake_embedding_function(texts):
+    return [[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in texts]
+
+
+def allocate_in_process(path, queue):
+    allocator = IdAllocator(path)
+    queue.put([i for _ in range(50) for i in allocator.allocate(2)])
+
+
+class MemoryDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.persist_directory = os.path.join(self.directory, "chroma")
+
+        cache = EmbeddingCache(os.path.join(self.directory, "cache.sqlite3"))
+        patches = [
+            mock.patch.object(embedding_cache, "_embedding_cache", cache),
+            mock.patch.object(
+                embedding_cache, "_query_embedding_cache", QueryEmbeddingCache()
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(cache.close)
+
+    def open(self):
+        return MemoryDatabase(self.persist_directory, fake_embedding_function)
+
+
+class TestIdAllocator(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "next_id")
+
+    def test_ids_continue_after_reopening(self):
+        allocator = IdAllocator(self.path, get_start=lambda: 5)
+        self.assertEqual(list(allocator.allocate(3)), [5, 6, 7])
+
+        reopened = IdAllocator(self.path, get_start=lambda: 0)
+        self.assertEqual(list(reopened.allocate()), [8])
+
+    def test_processes_never_share_ids(self):
+        queue = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=allocate_in_process, args=(self.path, queue))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        ids = [i for _ in processes for i in queue.get(timeout=30)]
+        for process in processes:
+            process.join()
+
+        self.assertEqual(len(ids), 400)
+        self.assertEqual(sorted(ids), list(range(400)))
+
+
+class TestMemoryIds(MemoryDatabaseTestCase):
+    def test_new_ids_follow_existing_memories(self):
+        database = self.open()
+        database.store_memories(
+            [{"id": "0", "content": "tasks"}, {"id": "41", "content": "a memory"}]
+        )
+        database.add_file_memory("main.py", "print('hello')")
+
+        self.assertFalse(os.path.exists(database.id_allocator.path))
+        self.assertEqual(database.get_next_id(), "42")
+        self.assertEqual(database.get_next_id(), "43")
+
+    def test_memories_without_ids_get_unique_ones(self):
+        database = self.open()
+        database.store_memories([{"content": f"memory {i}"} for i in range(20)])
+        database.store_memories(
+            [{"id": "tasks", "content": "given"}, {"content": "new"}]
+        )
+
+        with mock.patch.object(type(database.collection), "get") as get:
+            ids = database.allocate_ids(3)
+        get.assert_not_called()
+        database.flush()
+        self.assertEqual(database.collection.count(), 22)
+        self.assertEqual(ids, ["22", "23", "24"])
+
+
+class TestFileIndex(MemoryDatabaseTestCase):
+    def test_loads_only_file_memories_from_the_collection(self):
+        database = self.open()
+        database.add_file_memory("a.py", "print('a')")
+        database.add_file_memory("b.py", "print('b')")
+        database.store_memories([{"id": "1", "content": "not a file"}])
+        database.file_index = None
+
+        self.assertIsNotNone(database.get_id_from_filepath("a.py"))
+        self.assertEqual(set(database.file_index.ids), {"a.py", "b.py"})
+
+    def test_lookups_follow_writes_without_reading_the_collection(self):
+        database = self.open()
+        database.get_file_index()
+
+        with mock.patch.object(type(database.collection), "get") as get:
+            database.add_file_memory("a.py", "print('a')")
+            memory_id = database.get_id_from_filepath("a.py")
+            self.assertIsNotNone(memory_id)
+            self.assertIsNone(database.get_id_from_filepath("missing.py"))
+
+            database.delete_memory(memory_id)
+            database.add_file_memory("renamed.py", "print('a')")
+            self.assertIsNone(database.get_id_from_filepath("a.py"))
+            self.assertIsNotNone(database.get_id_from_filepath("renamed.py"))
+        get.assert_not_called()
+
+        self.assertEqual(
+            database.search_file("renamed.py")["metadatas"][0]["file_path"],
+            "renamed.py",
+        )
+
+
+class TestBulkDelete(MemoryDatabaseTestCase):
+    def test_clear_all_memories_leaves_a_usable_collection(self):
+        database = self.open()
+        database.store_memories([{"content": f"memory {i}"} for i in range(30)])
+        database.add_file_memory("a.py", "print('a')")
+
+        database.clear_all_memories()
+
+        self.assertEqual(database.collection.count(), 0)
+        self.assertIsNone(database.get_id_from_filepath("a.py"))
+        database.store_memories([{"content": "after clearing"}])
+        self.assertEqual(
+            database.query_memories("after clearing", top_k=1)["documents"],
+            [["after clearing"]],
+        )
+
+    def test_delete_namespace_only_deletes_that_namespace(self):
+        database = self.open()
+        database.store_memories(
+            [
+                {"content": "scratch 1", "metadata": {"namespace": "scratch"}},
+                {"content": "scratch 2", "metadata": {"namespace": "scratch"}},
+                {"content": "kept", "metadata": {"namespace": "notes"}},
+            ]
+        )
+        database.add_file_memory("a.py", "print('a')", {"namespace": "scratch"})
+
+        database.delete_namespace("scratch")
+
+        self.assertEqual(database.collection.count(), 1)
+        self.assertIsNone(database.get_id_from_filepath("a.py"))
+
+
+class TestWriteBuffer(MemoryDatabaseTestCase):
+    def open(self):
+        self.embedded = []
+
+        self.embedding_error = None
+
+        def embedding_function(texts):
+            if self.embedding_error is not None:
+                raise self.embedding_error
+            self.embedded.append(list(texts))
+            return fake_embedding_function(texts)
+
+        return MemoryDatabase(self.persist_directory, embedding_function)
+
+    def test_turn_of_writes_is_one_embedding_batch(self):
+        database = self.open()
+        self.embedded.clear()
+        database.update_memory("0", new_content="task 1")
+        database.store_memories([{"id": "1", "content": "first draft"}])
+        database.store_memories([{"id": "1", "content": "final", "metadata": {"a": 1}}])
+        database.store_memories([{"id": "2", "content": "deleted"}])
+        database.delete_memory("2")
+        database.add_file_memory("a.py", "print('a')")
+        database.update_memory("0", new_content="task 1 done")
+        self.assertEqual(self.embedded, [])
+
+        database.flush()
+
+        self.assertEqual(len(self.embedded), 1)
+        self.assertEqual(len(self.embedded[0]), 3)
+        memories = database.collection.get(include=["documents", "metadatas"])
+        documents = dict(zip(memories["ids"], memories["documents"]))
+        self.assertEqual(documents["0"], "task 1 done")
+        self.assertEqual(documents["1"], "final")
+        self.assertNotIn("2", documents)
+        self.assertEqual(database.collection.count(), 3)
+
+    def test_reads_see_pending_writes(self):
+        database = self.open()
+        database.store_memories([{"id": "1", "content": "remember this"}])
+
+        results = database.query_memories("remember this", top_k=1)
+
+        self.assertEqual(results["ids"], [["1"]])
+        self.assertEqual(database.pending_writes, {})
+
+    def test_partial_updates_keep_the_rest(self):
+        database = self.open()
+        database.store_memories([{"id": "1", "content": "a", "metadata": {"k": 1}}])
+        database.flush()
+
+        database.update_memory("1", new_metadata={"k": 2})
+        database.update_memory("missing", new_metadata={"k": 3})
+        database.flush()
+        memory = database.query_memories(id="1")
+        self.assertEqual(memory["documents"], ["a"])
+        self.assertEqual(memory["metadatas"], [{"k": 2}])
+
+        database.delete_memory("1")
+        database.update_memory("1", new_content="b")
+        memory = database.query_memories(id="1")
+        self.assertEqual(memory["documents"], ["b"])
+        self.assertEqual(memory["metadatas"], [None])
+
+    def test_failed_flush_keeps_the_writes(self):
+        database = self.open()
+        database.store_memories([{"id": "1", "content": "deleted"}])
+        database.flush()
+        database.update_memory("0", new_content="task list")
+        database.store_memories([{"id": "2", "content": "second"}])
+        database.delete_memory("1")
+
+        self.embedding_error = RuntimeError("embedding service unavailable")
+        with self.assertRaises(RuntimeError):
+            database.flush()
+        self.assertEqual(len(database.pending_writes), 3)
+
+        self.embedding_error = None
+        database.flush()
+        memories = database.collection.get(include=["documents"])
+        self.assertEqual(
+            dict(zip(memories["ids"], memories["documents"])),
+            {"0": "task list", "2": "second"},
+        )
+
+
+class TestQueryCache(MemoryDatabaseTestCase):
+    def test_repeated_queries_skip_the_collection_until_a_write(self):
+        database = self.open()
+        database.store_memories([{"id": "1", "content": "first memory"}])
+        first = database.query_relevant_memories("task", "message")
+
+        with mock.patch.object(type(database.collection), "query") as query:
+            with mock.patch.object(type(database.collection), "count") as count:
+                self.assertEqual(
+                    database.query_relevant_memories("task", "message"), first
+                )
+        query.assert_not_called()
+        count.assert_not_called()
+        self.assertEqual(database.query_cache.hits, 1)
+
+        database.store_memories([{"id": "2", "content": "second memory"}])
+        results = database.query_memories("task message")
+        self.assertEqual(sorted(results["ids"][0]), ["1", "2"])
+
+    def test_every_kind_of_write_invalidates(self):
+        database = self.open()
+        database.store_memories([{"id": "1", "content": "a", "metadata": {"k": 1}}])
+        writes = [
+            lambda: database.update_memory("1", new_metadata={"k": 2}),
+            lambda: database.add_file_memory("a.py", "print('a')"),
+            lambda: database.delete_memory("1"),
+            lambda: database.delete_namespace("scratch"),
+            database.clear_all_memories,
+        ]
+        for write in writes:
+            database.query_memories("a")
+            generation = database.generation
+            write()
+            self.assertGreater(database.generation, generation)
+            self.assertIsNone(database.query_cache.get(("a", 5), database.generation))
+
+    def test_results_are_copies(self):
+        database = self.open()
+        database.store_memories([{"id": "1", "content": "a"}])
+        database.query_memories("a")["ids"][0].clear()
+
+        self.assertEqual(database.query_memories("a")["ids"], [["1"]])
+
+    def test_cache_is_bounded(self):
+        cache = QueryResultCache(max_entries=2)
+        for query in ("a", "b", "c"):
+            cache.put((query, 5), 0, query)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(("a", 5), 0))
+        self.assertEqual(cache.get(("c", 5), 0), "c")
+        self.assertIsNone(cache.get(("c", 5), 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
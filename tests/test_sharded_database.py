@@ -0,0 +1,127 @@
+import os
+import unittest
+
+from database.codebase_database import CodebaseDatabase
+from database.file_watcher import FileWatcher
+from database.file_walker import get_shard
+from database.sharded_database import ShardedCodebaseDatabase
+from tests.test_codebase_database import CodebaseDatabaseTestCase
+
+
+class TestShardedCodebaseDatabase(CodebaseDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for package in ("one", "two", "three"):
+            os.makedirs(os.path.join(self.project_folder, package))
+            self.write(
+                f"{package}/module.py",
+                f"def {package}_first():\n    return '{package}'\n\n\n"
+                f"def {package}_second(x):\n    return x, '{package}'\n",
+            )
+        self.index_dir = os.path.join(self.directory, "index")
+
+    def open(self, **kwargs):
+        return ShardedCodebaseDatabase(
+            self.project_folder,
+            n_shards=3,
+            index_dir=self.index_dir,
+            max_workers=2,
+            **kwargs,
+        )
+
+    def test_shards_partition_the_project(self):
+        database = self.open()
+
+        names = [self.function_names(shard) for shard in database.shards]
+        self.assertEqual(
+            sorted(name for shard_names in names for name in shard_names),
+            self.function_names(CodebaseDatabase(self.project_folder)),
+        )
+        for shard, shard_database in enumerate(database.shards):
+            for path in shard_database.file_states:
+                self.assertEqual(get_shard(self.project_folder, path, 3), shard)
+
+    def test_search_merges_a_global_top_k(self):
+        query = "def two_second(x):\n    return x, 'two'\n"
+        for hybrid in (True, False):
+            with self.subTest(hybrid=hybrid):
+                sharded = self.open(hybrid=hybrid)
+                single = CodebaseDatabase(self.project_folder, hybrid=hybrid)
+
+                results = sharded.search_faiss_index(query, k=4)
+
+                self.assertEqual(len(results), 4)
+                self.assertEqual(results[0]["document"]["function_name"], "two_second")
+                if not hybrid:
+                    self.assertEqual(
+                        [r["distance"] for r in results],
+                        [r["distance"] for r in single.search_faiss_index(query, k=4)],
+                    )
+
+    def test_hybrid_search_matches_a_single_database(self):
+        # Functions of different lengths, so that no two tie on a score,
+        # whose order would depend on their IDs.
+        self.write("a.py", "def alpha(x):\n    return x + 1\n")
+        for n, package in enumerate(("one", "two", "three")):
+            self.write(
+                f"{package}/module.py",
+                f"def {package}_first():\n"
+                + "    step()\n" * n
+                + f"    return '{package}'\n",
+            )
+            self.write(
+                f"{package}/lookup.py",
+                f"def lookup_{package}(value, target):\n"
+                + "    value = value.strip()\n" * (n + 1)
+                + "    return value == target\n",
+            )
+        self.write("pkg/target.py", "def target_fn(value):\n    return lookup(value)\n")
+        sharded = self.open()
+        single = CodebaseDatabase(self.project_folder)
+        queries = [
+            "lookup value target",
+            "def target_fn(value):\n    return lookup(value)\n",
+            "lookup_two",
+            "target",
+        ]
+
+        def summarize(results):
+            return [
+                (r["document"]["function_name"], round(r["score"], 9)) for r in results
+            ]
+
+        for query, sharded_results, single_results in zip(
+            queries, sharded.search_many(queries, k=4), single.search_many(queries, k=4)
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(summarize(sharded_results), summarize(single_results))
+
+    def test_load_and_refresh(self):
+        self.open()
+        loaded = ShardedCodebaseDatabase.load(
+            self.project_folder, n_shards=3, index_dir=self.index_dir
+        )
+        self.assertTrue(
+            all(
+                shard.faiss_index is not None
+                for shard in loaded.shards
+                if shard.file_states
+            )
+        )
+
+        self.write("two/module.py", "def replaced():\n    pass\n")
+        with FileWatcher(loaded, interval=0.01, debounce=0.0) as watcher:
+            watcher.notify([os.path.join(self.project_folder, "two/module.py")])
+        results = loaded.search_faiss_index("replaced", k=1)
+        self.assertEqual(results[0]["document"]["function_name"], "replaced")
+
+    def test_load_without_saved_shards_returns_none(self):
+        self.assertIsNone(
+            ShardedCodebaseDatabase.load(
+                self.project_folder, n_shards=3, index_dir=self.index_dir
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -87,6 +87,9 @@ def display_intermediate_response(output_type, feedback=None):
     elif output_type == "task_report":
         # Display a task report
         display_task_report(feedback)
+    elif output_type == "progress":
+        # Display the progress of a long-running job such as indexing
+        display_progress(feedback)
     else:
         display_prompt(
             prompt_text=f"{output_type} is an invalid output type. ", style="bold red"
@@ -315,3 +318,24 @@ def display_task_report(task_report):
         table.add_row(line)
 
     console.print(table)
+
+
+def display_progress(progress):
+    total = progress["total"]
+    percent = 100 * progress["done"] / total if total else 100
+    line = (
+        f"{progress['stage'].capitalize()}: {progress['done']}/{total} ({percent:.0f}%)"
+    )
+    if progress.get("eta") is not None:
+        line += f", ETA {format_duration(progress['eta'])}"
+    console.print(line, style="dim")
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"